@@ -1,59 +1,201 @@
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
+import functools
 import json
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+import time
 import uuid
-import openai
 from dotenv import load_dotenv
 import os
+from meal_store import MealRecord, open_store, tidy_number, user_data_dir
+from estimate_cache import EstimateCache
+from file_cache import json_cache
+from settings_store import SettingsStore
+from local_estimator import estimate_locally, merge_estimates
+from jobs import JobQueue, QueueFull, DONE, FAILED, report_progress
+from stream_json import PartialJSONParser
+from suggestion_cache import SuggestionCache, suggestion_inputs
+from meal_index import MealIndex
+from trends import MealTrends, goal_adherence, resample, rolling_average
+from profiling import Profiler
+from llm_client import LLMClient
+
+# Start of this script run, for the startup timings under Cache statistics
+RUN_STARTED = time.perf_counter()
 
 # Load environment variables
 load_dotenv()
 
-# Initialize OpenAI client
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# Seconds a single OpenAI request may take before it is abandoned
+LLM_TIMEOUT = 20
+# Seconds an estimate or suggestion job may take in total, retries included
+JOB_TIMEOUT = 60
+# How often the page redraws a reply that is still streaming in
+JOB_POLL_SECONDS = 0.25
+# Stream OpenAI replies so they can be shown as they arrive (TEMPO_STREAM=0 to turn off)
+STREAM_RESPONSES = os.getenv("TEMPO_STREAM", "1") != "0"
 
-def get_protein_choices():
-    """Get list of popular protein choices in India from ChatGPT"""
-    try:
-        with open('cache.json', 'r') as f:
-            cache = json.load(f)
-            if "protein_choices" in cache:
-                return cache["protein_choices"]
-    except FileNotFoundError:
-        cache = {}
-
-    # If not in cache, try to get from OpenAI
-    try:
-        response = openai.chat.completions.create(
+# Timing spans go to profile.jsonl in the data folder (TEMPO_PROFILE=0 to turn off);
+# TEMPO_DEBUG=1 adds a panel with per-phase p50/p95 to the sidebar
+PROFILE_FILE = "profile.jsonl"
+PROFILE_TO_FILE = os.getenv("TEMPO_PROFILE", "1") != "0"
+SHOW_DEBUG_PANEL = os.getenv("TEMPO_DEBUG", "0") == "1"
+
+@st.cache_resource
+def get_profiler():
+    """Process-wide profiler shared by all sessions and job queue threads"""
+    return Profiler(os.path.join(user_data_dir(), PROFILE_FILE) if PROFILE_TO_FILE else None)
+
+profiler = get_profiler()
+profiler.start_run(RUN_STARTED)
+
+@st.cache_resource
+def get_llm_client():
+    """Process-wide OpenAI client: one connection pool, per-model limits, and identical requests sent once"""
+    return LLMClient()
+
+@st.cache_resource
+def get_job_queue():
+    """Process-wide worker pool that runs OpenAI calls off the script thread"""
+    return JobQueue(workers=4, max_pending=32, timeout=JOB_TIMEOUT)
+
+@st.cache_resource
+def get_meal_store(user):
+    """Process-wide meal store for one user (JSON journal or SQLite, picked by TEMPO_STORAGE)"""
+    return open_store(user)
+
+def current_user():
+    """Email of the signed-in user, or None when the app runs without login"""
+    if st.user.get("is_logged_in"):
+        return st.user.get("email")
+    return None
+
+# Each signed-in user gets their own data folder; everyone else shares one
+meal_store = get_meal_store(current_user())
+
+@st.cache_resource
+def get_meal_index(user):
+    """Process-wide index of one user's past meal descriptions, built on first use"""
+    # Archived months only contribute a summary per description, read in the
+    # background; searches don't wait for it
+    store = get_meal_store(user)
+    return MealIndex(store.recent_records(), load_summaries=store.archived_summaries)
+
+@st.cache_resource
+def get_meal_trends(user):
+    """Process-wide columnar copy of one user's meals for the Trends tab"""
+    # Archived months only contribute their per-day totals
+    store = get_meal_store(user)
+    return MealTrends(store.recent_records(), store.archived_daily_totals())
+
+# Kept current by the add/delete/repeat helpers below
+meal_index = get_meal_index(current_user())
+meal_trends = get_meal_trends(current_user())
+
+# Settings changes made during a run are written once when the run finishes
+settings = SettingsStore(meal_store)
+
+def profiled(func):
+    """Profile func as a run of its own when it reruns alone as a fragment"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if profiler.in_run():
+            return func(*args, **kwargs)
+        profiler.start_run()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.finish_run(fragment=func.__name__, caches=cache_hit_rates())
+    return wrapper
+
+def flushes_settings(func):
+    """Write staged settings changes when func returns, even if it triggers a rerun"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            settings.flush()
+    return wrapper
+
+# Meals shown per page in the History tab
+HISTORY_PAGE_SIZE = 20
+
+# Trends tab: days shown for each range (None for everything), and for each
+# grouping the period passed to resample() and how many periods are averaged
+TREND_RANGES = {"Last 30 days": 30, "Last 90 days": 90, "Last year": 365, "All time": None}
+TREND_GROUPINGS = {"Day": (None, 7, "7-day"), "Week": ("week", 4, "4-week"),
+                   "Month": ("month", 3, "3-month")}
+
+# Model and prompt revision used by estimate_macros. Bump the prompt version
+# whenever the prompt changes so cached estimates from the old one are ignored.
+ESTIMATE_MODEL = "gpt-4o-mini"
+ESTIMATE_PROMPT_VERSION = 1
+
+@st.cache_resource
+def get_estimate_cache():
+    """Process-wide persistent cache of macro estimates"""
+    return EstimateCache()
+
+@st.cache_resource
+def get_suggestion_cache():
+    """Process-wide cache of meal suggestions keyed on bucketed remaining goals"""
+    return SuggestionCache()
+
+# Fetched here because estimate_macros and get_meal_suggestions also run on
+# job queue threads
+estimate_cache = get_estimate_cache()
+suggestion_cache = get_suggestion_cache()
+llm_client = get_llm_client()
+
+# Shown while protein choices are being fetched, and kept if the fetch fails
+DEFAULT_PROTEIN_CHOICES = ["Chicken", "Paneer", "Whey Protein", "Eggs", "Dal"]
+
+def fetch_protein_choices():
+    """Get list of popular protein choices in India from ChatGPT (runs on a job queue thread)"""
+    with profiler.span("openai.protein_choices") as span:
+        span["model"] = "gpt-4.1-nano"
+        completion = llm_client.complete(
             model="gpt-4.1-nano",
             messages=[
                 {"role": "system", "content": """You are a nutrition expert familiar with Indian cuisine."""},
                 {"role": "user", "content": """List top 5 most popular protein sources (not recipes or combinations) used by fitness enthusiasts and athletes in India.
                 Return ONLY a JSON array of strings, no explanations.
                 Example: ["Chicken", "Paneer", "Whey Protein"]"""}
-            ]
+            ],
+            timeout=LLM_TIMEOUT
         )
-        protein_choices = json.loads(response.choices[0].message.content)
-    except Exception as e:
+        record_usage(span, completion)
+    protein_choices = json.loads(completion.text)
+    if not isinstance(protein_choices, list) or not all(isinstance(p, str) for p in protein_choices):
+        raise ValueError("Invalid response format")
+    return protein_choices
+
+def get_protein_choices():
+    """Cached protein choices, or None while they are fetched in the background"""
+    cache = settings.get("cache") or {}
+    if "protein_choices" in cache:
+        return cache["protein_choices"]
+
+    # If not in cache, fetch them from OpenAI without holding up the page
+    job = st.session_state.protein_choices_job
+    if job is None:
+        job = st.session_state.protein_choices_job = start_job(fetch_protein_choices)
+    if job is not None and not job.done:
+        return None
+    st.session_state.protein_choices_job = None
+    if job is not None and job.status == DONE:
+        protein_choices = job.result
+    else:
         # Fallback to default list if API call fails
-        protein_choices = [
-            "Chicken", "Paneer", "Whey Protein",
-            "Eggs", "Dal"
-        ]
+        protein_choices = DEFAULT_PROTEIN_CHOICES
 
     # Save choices to cache
     cache["protein_choices"] = protein_choices
-    with open('cache.json', 'w') as f:
-        json.dump(cache, f, indent=2)
+    settings.set("cache", cache)
 
-    # Now handle preferences
-    try:
-        preferences = load_preferences()
-    except FileNotFoundError:
-        preferences = {"protein_sources": []}
-        save_preferences(preferences)
-
-    # Filter out preferences that aren't in the choices
+    # Filter out preferences that aren't in the choices (only written if any were dropped)
+    preferences = load_preferences()
     preferences["protein_sources"] = [
         protein for protein in preferences["protein_sources"]
         if protein in protein_choices
@@ -62,26 +204,32 @@ def get_protein_choices():
 
     return protein_choices
 
-def load_meals():
-    try:
-        with open('meals.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        # Create meals.json with empty structure if it doesn't exist
-        initial_data = {"meals": []}
-        with open('meals.json', 'w') as f:
-            json.dump(initial_data, f, indent=2)
-        return initial_data
-
-def save_meals(meals_data):
-    with open('meals.json', 'w') as f:
-        json.dump(meals_data, f, indent=2)
-
-def get_today_meals(meals_data):
+def add_meal(meal):
+    meal_store.add(meal)
+    record = MealRecord.from_dict(meal)
+    meal_index.add(record)
+    meal_trends.add(record)
+
+def delete_meal(meal):
+    meal_store.delete(meal.id, meal.day)
+    meal_index.remove(meal.id)
+    if not meal_trends.remove(meal.id):
+        # An archived meal only counts in its day's totals and its month's
+        # summary, so recount those
+        records = meal_store.recent_records()
+        meal_trends.rebuild(records, meal_store.archived_daily_totals())
+        meal_index.rebuild(records)
+
+def repeat_meal(meal, source_id):
+    meal_store.repeat(meal, source_id)
+    record = MealRecord.from_dict(meal)
+    meal_index.add(record)
+    meal_trends.add(record)
+
+def get_today_meals():
     today = date.today().isoformat()
-    today_meals = [meal for meal in meals_data["meals"] 
-                  if meal["timestamp"].startswith(today)]
-    return today_meals
+    with profiler.span("load_meals"):
+        return meal_store.meals_for_day(today)
 
 def calculate_daily_totals(meals):
     totals = {
@@ -89,71 +237,148 @@ def calculate_daily_totals(meals):
         "carbs": 0,
         "fat": 0
     }
-    for meal in meals:
-        for macro in totals:
-            totals[macro] += meal["macros"][macro]
+    with profiler.span("daily_totals"):
+        for meal in meals:
+            totals["protein"] += meal.protein
+            totals["carbs"] += meal.carbs
+            totals["fat"] += meal.fat
     # Calculate total calories
     totals["calories"] = (totals["protein"] * 4) + (totals["carbs"] * 4) + (totals["fat"] * 9)
     return totals
 
+def get_daily_totals(day):
+    """Read one day's totals from the per-day rollup kept by the meal store"""
+    with profiler.span("daily_rollups"):
+        rollup = meal_store.daily_totals(day)
+    totals = {macro: rollup[macro] for macro in ("protein", "carbs", "fat")}
+    totals["calories"] = tidy_number((totals["protein"] * 4) + (totals["carbs"] * 4) + (totals["fat"] * 9))
+    return totals
+
 def display_meal_card(meal, show_date=True, tab_name=""):
     """Display a meal in a bordered container with its details"""
     with st.container(border=True):
         if show_date:
-            meal_date = datetime.fromisoformat(meal["timestamp"]).strftime("%B %d, %Y %I:%M %p")
+            meal_date = datetime.fromtimestamp(meal.epoch).strftime("%B %d, %Y %I:%M %p")
             st.write(f"**{meal_date}**")
         else:
-            meal_time = datetime.fromisoformat(meal["timestamp"]).strftime("%I:%M %p")
+            meal_time = datetime.fromtimestamp(meal.epoch).strftime("%I:%M %p")
             st.write(f"**{meal_time}**")
-        st.write(meal["description"])
-        if "interpretation" in meal:
-            st.caption(meal['interpretation'])
+        st.write(meal.description)
+        if meal.interpretation is not None:
+            st.caption(meal.interpretation)
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("Protein", f"{meal['macros']['protein']}g")
+            st.metric("Protein", f"{meal.protein}g")
         with col2:
-            st.metric("Carbs", f"{meal['macros']['carbs']}g")
+            st.metric("Carbs", f"{meal.carbs}g")
         with col3:
-            st.metric("Fat", f"{meal['macros']['fat']}g")
+            st.metric("Fat", f"{meal.fat}g")
         
         # Add action buttons
         col1, col2 = st.columns([1, 1])
         with col1:
-            if st.button("Delete", key=f"delete_{tab_name}_{meal['id']}"):
-                meals_data = load_meals()
-                # Remove the meal from the list
-                meals_data["meals"] = [m for m in meals_data["meals"] if m["id"] != meal["id"]]
-                save_meals(meals_data)
+            if st.button("Delete", key=f"delete_{tab_name}_{meal.id}"):
+                delete_meal(meal)
                 st.session_state.notification = {
                     "message": "Meal deleted successfully!",
                     "type": "success"
                 }
-                st.rerun()
+                rerun_fragment()
         with col2:
-            if st.button("Repeat", key=f"repeat_{tab_name}_{meal['id']}"):
+            if st.button("Repeat", key=f"repeat_{tab_name}_{meal.id}"):
                 # Create and save the repeated meal
                 repeated_meal = {
                     "id": str(uuid.uuid4()),
                     "timestamp": datetime.now().isoformat(),
-                    "description": meal["description"],
-                    "macros": meal["macros"]
+                    "description": meal.description,
+                    "macros": meal.macros
                 }
-                meals_data = load_meals()
-                meals_data["meals"].append(repeated_meal)
-                save_meals(meals_data)
+                if meal.interpretation is not None:
+                    repeated_meal["interpretation"] = meal.interpretation
+                    remember_estimate(meal.description, {
+                        "interpretation": meal.interpretation,
+                        "macros": meal.macros
+                    })
+                repeat_meal(repeated_meal, meal.id)
                 st.session_state.notification = {
                     "message": "Meal repeated successfully!",
                     "type": "success"
                 }
-                st.rerun()
+                rerun_fragment()
 
-def estimate_macros(meal_description):
-    """Estimate macros using OpenAI API"""
+def is_valid_estimate(result):
+    """Whether result has a string interpretation and numeric protein/carbs/fat"""
+    if not isinstance(result, dict) or not isinstance(result.get("interpretation"), str):
+        return False
+    macros = result.get("macros")
+    return isinstance(macros, dict) and all(
+        isinstance(macros.get(macro), (int, float)) and not isinstance(macros.get(macro), bool)
+        for macro in ("protein", "carbs", "fat")
+    )
+
+def remember_estimate(meal_description, result):
+    """Store a known-good estimate so the same description is answered instantly"""
+    estimate_cache.put(meal_description, ESTIMATE_MODEL, ESTIMATE_PROMPT_VERSION, result)
+
+def record_usage(span, completion):
+    """Add a reply's token usage and time to first token to a profiling span"""
+    if completion.shared:
+        # Joined an identical request in flight; its sender counted the tokens
+        span["shared"] = True
+        return
+    if completion.usage is not None:
+        span["prompt_tokens"] = completion.usage.prompt_tokens
+        span["completion_tokens"] = completion.usage.completion_tokens
+    if completion.first_token_ms is not None:
+        span["first_token_ms"] = completion.first_token_ms
+
+def complete_json(phase, **request):
+    """Run a chat completion and parse its JSON reply.
+
+    When streaming, the reply parsed so far is published with report_progress
+    so the page can show it before the last token arrives. The request is
+    profiled as "openai.<phase>" with its model, token usage and (when
+    streaming) time to the first token.
+    """
+    with profiler.span(f"openai.{phase}") as span:
+        span["model"] = request["model"]
+        if STREAM_RESPONSES:
+            parser = PartialJSONParser()
+            completion = llm_client.complete(
+                stream=True, on_delta=lambda piece: report_progress(parser.feed(piece)),
+                timeout=LLM_TIMEOUT, **request)
+        else:
+            completion = llm_client.complete(timeout=LLM_TIMEOUT, **request)
+        record_usage(span, completion)
+        response_text = completion.text
+
+    if not response_text.strip():
+        raise ValueError("Empty response from ChatGPT")
     try:
-        response = openai.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": """You are a nutrition expert. For the given meal description:
+        return json.loads(response_text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON response: {response_text}")
+
+def estimate_macros(meal_description):
+    """Estimate macros from the built-in food table, using OpenAI API for anything it doesn't know.
+
+    Runs on a job queue thread, so it raises on failure (and the queue retries)
+    instead of touching session state.
+    """
+    local_result, unparsed = estimate_locally(meal_description)
+    if local_result is not None and not unparsed:
+        return local_result
+
+    cached = estimate_cache.get(meal_description, ESTIMATE_MODEL, ESTIMATE_PROMPT_VERSION)
+    # A malformed entry cached before replies were checked is asked for again
+    if cached is not None and is_valid_estimate(cached):
+        return cached
+
+    result = complete_json(
+        "estimate_macros",
+        model=ESTIMATE_MODEL,
+        messages=[
+            {"role": "system", "content": """You are a nutrition expert. For the given meal description:
                 1. First, explain what you understand about the meal (quantities, ingredients, preparation). Don't give feedback on the pros and cons of the meal.
                 2. Then estimate the macronutrients (protein, carbs, fat in grams)
                 
@@ -162,72 +387,59 @@ def estimate_macros(meal_description):
                     "interpretation": "Your understanding of the meal",
                     "macros": {"protein": X, "carbs": Y, "fat": Z}
                 }"""},
-                {"role": "user", "content": meal_description}
-            ]
-        )
+            {"role": "user", "content": ", ".join(unparsed) or meal_description}
+        ]
+    )
+    # Raising lets the job queue retry; a bad reply must not reach the session or the cache
+    if not is_valid_estimate(result):
+        raise ValueError("Invalid response format")
 
-        # Extract the JSON response
-        result = json.loads(response.choices[0].message.content)
-        return result
-    except Exception as e:
-        st.session_state.notification = {
-            "message": f"Error estimating macros: {str(e)}",
-            "type": "error"
-        }
-        return {
-            "interpretation": "Unable to process the description",
-            "macros": {"protein": 0, "carbs": 0, "fat": 0}
-        }
+    if local_result is not None:
+        result = merge_estimates(local_result, result)
+    remember_estimate(meal_description, result)
+    return result
 
 def load_goals():
-    try:
-        with open('goals.json', 'r') as f:
-            goals = json.load(f)
-            # Add last_meal_time if it doesn't exist
-            if "last_meal_time" not in goals:
-                goals["last_meal_time"] = "18:00"
-                save_goals(goals)
-            return goals
-    except FileNotFoundError:
-        # Create goals.json with default values if it doesn't exist
-        default_goals = {
+    with profiler.span("load_settings"):
+        goals = settings.get("goals")
+    if goals is None:
+        # Create goals with default values if they don't exist
+        goals = {
             "daily_calories": 2000,
             "protein_goal": 150,
             "last_meal_time": "18:00"  # Default to 6 PM
         }
-        with open('goals.json', 'w') as f:
-            json.dump(default_goals, f, indent=2)
-        return default_goals
+        save_goals(goals)
+    elif "last_meal_time" not in goals:
+        # Add last_meal_time if it doesn't exist
+        goals["last_meal_time"] = "18:00"
+        save_goals(goals)
+    return goals
 
 def save_goals(goals):
-    with open('goals.json', 'w') as f:
-        json.dump(goals, f, indent=2)
+    settings.set("goals", goals)
 
 def load_preferences():
-    try:
-        with open('preferences.json', 'r') as f:
-            preferences = json.load(f)
-            # Add last_meal_time if it doesn't exist
-            if "last_meal_time" not in preferences:
-                preferences["last_meal_time"] = "18:00"
-                save_preferences(preferences)
-            return preferences
-    except FileNotFoundError:
-        # Create preferences.json with default values if it doesn't exist
-        default_preferences = {
+    with profiler.span("load_settings"):
+        preferences = settings.get("preferences")
+    if preferences is None:
+        # Create preferences with default values if they don't exist
+        preferences = {
             "protein_sources": [],
             "last_meal_time": "18:00"  # Default to 6 PM
         }
-        with open('preferences.json', 'w') as f:
-            json.dump(default_preferences, f, indent=2)
-        return default_preferences
+        save_preferences(preferences)
+    elif "last_meal_time" not in preferences:
+        # Add last_meal_time if it doesn't exist
+        preferences["last_meal_time"] = "18:00"
+        save_preferences(preferences)
+    return preferences
 
 def save_preferences(preferences):
-    with open('preferences.json', 'w') as f:
-        json.dump(preferences, f, indent=2)
+    settings.set("preferences", preferences)
 
-def get_meal_suggestions(goals, preferences, today_meals):
-    """Get meal suggestions from ChatGPT based on goals and progress"""
+def get_suggestion_inputs(goals, preferences, today_meals):
+    """Remaining goals and time left, rounded into the buckets the suggestion cache is keyed on"""
     # Calculate remaining time
     current_time = datetime.now()
     last_meal_time = datetime.combine(current_time.date(), datetime.strptime(preferences["last_meal_time"], "%H:%M").time())
@@ -238,12 +450,17 @@ def get_meal_suggestions(goals, preferences, today_meals):
     remaining_protein = goals["protein_goal"] - daily_totals["protein"]
     remaining_calories = goals["daily_calories"] - daily_totals["calories"]
     
+    return suggestion_inputs(remaining_protein, remaining_calories, hours_remaining,
+                             preferences["protein_sources"], preferences["last_meal_time"])
+
+def get_meal_suggestions(inputs):
+    """Get meal suggestions from ChatGPT for bucketed inputs and cache them (runs on a job queue thread; raises on failure)"""
     # Prepare the prompt
     prompt = f"""You are a nutrition expert helping with meal planning. Here's the situation:
-- Time left until last meal of the day ({preferences['last_meal_time']}): {hours_remaining:.1f} hours
-- Remaining protein goal: {remaining_protein}g
-- Remaining calories: {remaining_calories} kcal
-- Preferred protein sources: {', '.join(preferences['protein_sources'])}
+- Time left until last meal of the day ({inputs.last_meal_time}): {inputs.hours:.1f} hours
+- Remaining protein goal: {inputs.protein}g
+- Remaining calories: {inputs.calories} kcal
+- Preferred protein sources: {', '.join(inputs.protein_sources)}
 
 Please suggest 1-2 meals that:
 1. Use the preferred protein sources
@@ -268,39 +485,211 @@ Return a JSON object with:
     "note": "any important notes about timing or feasibility"
 }}"""
 
+    suggestions = complete_json(
+        "meal_suggestions",
+        model="gpt-4.1-nano",
+        messages=[
+            {"role": "system", "content": prompt}
+        ]
+    )
+    if not isinstance(suggestions, dict) or "suggestions" not in suggestions:
+        raise ValueError("Invalid response format")
+    suggestion_cache.put(inputs, suggestions)
+    return suggestions
+
+def prefetch_suggestions(inputs):
+    """Fetch suggestions for inputs in the background unless they're cached or on their way"""
+    if not suggestion_cache.needs_fetch(inputs):
+        return
+    job_queue = get_job_queue()
+    if job_queue.stats()["waiting"]:
+        # Don't hold up requests someone is waiting for
+        return
     try:
-        response = openai.chat.completions.create(
-            model="gpt-4.1-nano",
-            messages=[
-                {"role": "system", "content": prompt}
-            ]
-        )
-        response_text = response.choices[0].message.content.strip()
-        if not response_text:
-            raise ValueError("Empty response from ChatGPT")
-            
-        try:
-            suggestions = json.loads(response_text)
-            if not isinstance(suggestions, dict) or "suggestions" not in suggestions:
-                raise ValueError("Invalid response format")
-            return suggestions
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Invalid JSON response: {response_text}")
-            
-    except Exception as e:
-        return {
-            "suggestions": [],
-            "note": f"Error getting suggestions: {str(e)}"
+        job = job_queue.submit(get_meal_suggestions, inputs)
+    except QueueFull:
+        return
+    suggestion_cache.track(inputs, job, prefetch=True)
+
+def rerun_fragment():
+    """Rerun only the current fragment, or the whole app if this is a full run"""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+def show_notification():
+    """Show the pending notification as a toast, then clear it"""
+    if st.session_state.notification["message"]:
+        if st.session_state.notification["type"] == "success":
+            st.toast(st.session_state.notification["message"], icon="✅")
+        elif st.session_state.notification["type"] == "error":
+            st.toast(st.session_state.notification["message"], icon="❌")
+        elif st.session_state.notification["type"] == "warning":
+            st.toast(st.session_state.notification["message"], icon="⚠️")
+        st.session_state.notification = {"message": None, "type": None}
+
+def start_job(func, *args):
+    """Queue func on the job queue; warn and return None if the queue is full"""
+    try:
+        return get_job_queue().submit(func, *args)
+    except QueueFull:
+        st.session_state.notification = {
+            "message": "Too many requests are in progress. Please try again in a moment.",
+            "type": "warning"
         }
+        return None
+
+def new_pending_meal(description, **fields):
+    """A meal waiting for Save, timestamped on the date picked in the meal form"""
+    # Convert date to datetime for timestamp
+    meal_datetime = datetime.combine(st.session_state.meal_date, datetime.now().time())
+    return {
+        "id": str(uuid.uuid4()),
+        "timestamp": meal_datetime.isoformat(),
+        "description": description,
+        **fields
+    }
+
+def submit_meal_input():
+    """Estimate the typed meal in the background and clear the input"""
+    meal_input = st.session_state.meal_input
+    if not meal_input:
+        return
+    # The meal shows as estimating until the job is done
+    job = start_job(estimate_macros, meal_input)
+    if job is not None:
+        st.session_state.pending_meals.append(new_pending_meal(meal_input, job=job))
+    st.session_state.meal_input = ""
+
+def use_past_meal(match):
+    """Log a past meal again with its stored macros, without estimating it"""
+    fields = {"macros": match["macros"],
+              "interpretation": match.get("interpretation", "Same as a meal you logged before.")}
+    st.session_state.pending_meals.append(new_pending_meal(match["description"], **fields))
+    st.session_state.meal_input = ""
+
+def collect_finished_jobs():
+    """Move results of finished background jobs into the session"""
+    for pending in list(st.session_state.pending_meals):
+        job = pending.get("job")
+        if job is None or not job.done:
+            continue
+        if job.status == DONE:
+            # Fill in the estimate; the meal now waits for Save
+            macros, interpretation = job.result["macros"], job.result["interpretation"]
+            del pending["job"]
+            pending["macros"] = macros
+            pending["interpretation"] = interpretation
+        else:
+            st.session_state.pending_meals.remove(pending)
+            if job.status == FAILED:
+                st.session_state.notification = {
+                    "message": f"Error estimating macros: {str(job.error)}",
+                    "type": "error"
+                }
+
+    job = st.session_state.suggestions_job
+    if job is not None and job.done:
+        st.session_state.suggestions_job = None
+        if job.status == DONE:
+            st.session_state.suggestions = job.result
+        elif job.status == FAILED:
+            st.session_state.suggestions = {
+                "suggestions": [],
+                "note": f"Error getting suggestions: {str(job.error)}"
+            }
 
 # Initialize session state
-if 'pending_meal' not in st.session_state:
-    st.session_state.pending_meal = None
+if 'pending_meals' not in st.session_state:
+    # Meals waiting for Save; ones still being estimated carry their "job"
+    st.session_state.pending_meals = []
+if 'suggestions_job' not in st.session_state:
+    st.session_state.suggestions_job = None
+    st.session_state.suggestions = None
+    # Bucketed inputs the shown suggestions were asked for
+    st.session_state.suggestions_inputs = None
 if 'notification' not in st.session_state:
     st.session_state.notification = {"message": None, "type": None}
+if 'protein_choices_job' not in st.session_state:
+    st.session_state.protein_choices_job = None
+if 'timings' not in st.session_state:
+    # Milliseconds from the start of this session's latest run, by milestone
+    st.session_state.timings = {}
+if 'history_cursors' not in st.session_state:
+    # Meal each History page starts after; None is the newest page
+    st.session_state.history_cursors = [None]
 
-# Sidebar
-with st.sidebar:
+def display_suggestion(suggestion):
+    """Display a suggested meal; values still streaming in show as …"""
+    def amount(key, unit):
+        return f"{suggestion[key]}{unit}" if key in suggestion else "…"
+    with st.container(border=True):
+        st.write(f"**{suggestion['meal']}**")
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Protein", amount("protein", "g"))
+        with col2:
+            st.metric("Carbs", amount("carbs", "g"))
+        with col3:
+            st.metric("Fat", amount("fat", "g"))
+        with col4:
+            st.metric("Calories", amount("calories", " kcal"))
+
+# Replies still streaming in are redrawn by these fragments every
+# JOB_POLL_SECONDS. Once the job is done the whole page reruns to show the
+# final result, and the fragment is no longer drawn (so it stops polling).
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def estimating_meals():
+    """Meals still being estimated, with the interpretation as it arrives"""
+    estimating = [pending for pending in st.session_state.pending_meals if "job" in pending]
+    if not estimating or any(pending["job"].done for pending in estimating):
+        st.rerun()
+    for pending in estimating:
+        with st.container(border=True):
+            st.write(f"**{pending['description']}**")
+            partial = pending["job"].partial
+            interpretation = partial.get("interpretation") if isinstance(partial, dict) else None
+            st.caption(f"{interpretation}…" if interpretation else "Estimating…")
+            if st.button("Cancel", key=f"cancel_{pending['id']}"):
+                pending["job"].cancel()
+                st.session_state.pending_meals.remove(pending)
+                st.rerun()
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def waiting_for_protein_choices():
+    """Note shown while protein choices are fetched"""
+    job = st.session_state.protein_choices_job
+    if job is None or job.done:
+        st.rerun()
+    st.caption("Updating protein choices…")
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def streaming_suggestions():
+    """Meal suggestions shown one by one as they arrive"""
+    job = st.session_state.suggestions_job
+    if job is None or job.done:
+        st.rerun()
+    st.write("### Meal Suggestions")
+    partial = job.partial if isinstance(job.partial, dict) else {}
+    arrived = [suggestion for suggestion in partial.get("suggestions", [])
+               if isinstance(suggestion, dict) and suggestion.get("meal")]
+    if not arrived:
+        st.caption("Getting suggestions…")
+    for suggestion in arrived:
+        display_suggestion(suggestion)
+    if st.button("Cancel", key="cancel_suggestions"):
+        # Stop waiting but let the job finish: its answer fills the cache,
+        # and other sessions may be waiting on the same job
+        st.session_state.suggestions_job = None
+        st.rerun()
+
+# Sidebar settings. Changing a setting reruns only this fragment.
+@st.fragment
+@profiled
+@flushes_settings
+def settings_panel():
+    show_notification()
     st.title("⚙️ Settings")
     st.write("Configure your meal tracking preferences")
     
@@ -330,6 +719,7 @@ with st.sidebar:
             "message": "Goals updated successfully!",
             "type": "success"
         }
+        # The Today progress panel depends on the goals
         st.rerun()
 
     # Save preferences if they've changed
@@ -343,7 +733,7 @@ with st.sidebar:
             "message": "Preferences updated successfully!",
             "type": "success"
         }
-        st.rerun()
+        rerun_fragment()
 
     # Protein Preferences
     st.write("### Protein Preferences")
@@ -351,15 +741,17 @@ with st.sidebar:
     
     # Get protein choices from cache or ChatGPT
     protein_options = get_protein_choices()
+    fetching = protein_options is None
+    if fetching:
+        # Show the default list (read-only) until the fetch finishes
+        protein_options = DEFAULT_PROTEIN_CHOICES
+        waiting_for_protein_choices()
     
     # Add refresh button
     if st.button("🔄 Refresh Protein Choices"):
         # Delete cache to force refresh
-        try:
-            os.remove('cache.json')
-        except FileNotFoundError:
-            pass
-        st.rerun()
+        settings.delete("cache")
+        rerun_fragment()
     
     # Filter out invalid preferences
     valid_preferences = [
@@ -370,11 +762,11 @@ with st.sidebar:
     # Show protein options as checkboxes
     selected_proteins = []
     for protein in protein_options:
-        if st.checkbox(protein, value=protein in valid_preferences):
+        if st.checkbox(protein, value=protein in valid_preferences, disabled=fetching):
             selected_proteins.append(protein)
     
     # Save preferences if they've changed
-    if selected_proteins != preferences["protein_sources"]:
+    if not fetching and selected_proteins != preferences["protein_sources"]:
         new_preferences = {
             "protein_sources": selected_proteins
         }
@@ -383,181 +775,341 @@ with st.sidebar:
             "message": "Protein preferences updated!",
             "type": "success"
         }
-        st.rerun()
+        rerun_fragment()
+
+    # How often data was served from the in-process caches
+    with st.expander("📊 Cache statistics"):
+        read_stats = json_cache.stats()
+        st.caption(f"Settings files: {read_stats['hit_rate']:.0%} read from memory "
+                   f"({read_stats['hits']} hits, {read_stats['misses']} misses)")
+        if hasattr(meal_store, "stats"):
+            store_stats = meal_store.stats()
+            st.caption(f"Meal log: {store_stats['hit_rate']:.0%} served from memory "
+                       f"({store_stats['hits']} hits, {store_stats['reloads']} full reloads)")
+            archive_stats = store_stats["archive"]
+            if archive_stats["segments"]:
+                st.caption(f"Archive: {archive_stats['segments']} monthly segments, "
+                           f"{archive_stats['block_reads']} days decoded, "
+                           f"{archive_stats['block_hits']} served from memory")
+        estimate_stats = estimate_cache.stats()
+        st.caption(f"Macro estimates: {estimate_stats['hit_rate']:.0%} cache hits "
+                   f"({estimate_stats['entries']} cached)")
+        suggestion_stats = suggestion_cache.stats()
+        st.caption(f"Meal suggestions: {suggestion_stats['hit_rate']:.0%} cache hits "
+                   f"({suggestion_stats['entries']} cached, {suggestion_stats['prefetches']} prefetched)")
+        job_stats = get_job_queue().stats()
+        st.caption(f"Background jobs: {job_stats['running']} running, {job_stats['waiting']} waiting, "
+                   f"{job_stats['completed']} completed, {job_stats['failed']} failed, "
+                   f"{job_stats['retried']} retries")
+        for model, llm_stats in get_llm_client().stats().items():
+            st.caption(f"{model}: {llm_stats.get('requests', 0)} requests "
+                       f"({llm_stats.get('shared', 0)} more joined one in flight), "
+                       f"up to {llm_stats['limit']} at once, circuit {llm_stats['circuit']}")
+        cold = get_startup_timings()
+        timings = st.session_state.timings
+        if "full_run" in cold:
+            st.caption(f"Startup: first paint after {cold['first_paint']} ms, full page after "
+                       f"{cold['full_run']} ms (this session's last run: {timings['first_paint']} / "
+                       f"{timings.get('full_run', '…')} ms)")
+
+    if SHOW_DEBUG_PANEL:
+        with st.expander("⏱️ Performance"):
+            st.dataframe(profiler.summary(), hide_index=True)
+            if profiler.path:
+                st.caption(f"Spans are logged to {os.path.abspath(profiler.path)}")
+
+@st.cache_resource
+def get_startup_timings():
+    """Timings of this process's first run (a cold start), by milestone"""
+    return {}
+
+def cache_hit_rates():
+    """Hit rates of the in-process caches so far, cheap enough to log every run"""
+    rates = {}
+    for name, cache in (("settings", json_cache), ("estimates", estimate_cache), ("suggestions", suggestion_cache)):
+        lookups = cache.hits + cache.misses
+        rates[name] = round(cache.hits / lookups, 3) if lookups else None
+    if hasattr(meal_store, "stats"):
+        rates["meal_log"] = round(meal_store.stats()["hit_rate"], 3)
+    return rates
+
+def record_timing(milestone):
+    """Note the milliseconds since this run started, for this session and for a cold start"""
+    elapsed = round((time.perf_counter() - RUN_STARTED) * 1000)
+    st.session_state.timings[milestone] = elapsed
+    get_startup_timings().setdefault(milestone, elapsed)
+
+# Everything above draws nothing, so this is when the first element is sent
+record_timing("first_paint")
+
+with st.sidebar:
+    settings_panel()
 
 # Main content
 st.title("🥗 Tempo")
 st.write("Hello World! Welcome to Tempo - your minimalist meal tracking app.")
 
-# Show notification if needed
-if st.session_state.notification["message"]:
-    if st.session_state.notification["type"] == "success":
-        st.toast(st.session_state.notification["message"], icon="✅")
-    elif st.session_state.notification["type"] == "error":
-        st.toast(st.session_state.notification["message"], icon="❌")
-    elif st.session_state.notification["type"] == "warning":
-        st.toast(st.session_state.notification["message"], icon="⚠️")
-    st.session_state.notification = {"message": None, "type": None}
+# Today and History tabs. Meal actions (save, delete, repeat) rerun only
+# this fragment, not the sidebar.
+@st.fragment
+@profiled
+@flushes_settings
+def meal_views():
+    collect_finished_jobs()
+    show_notification()
+    goals = load_goals()
+    protein_goal = goals["protein_goal"]
+    daily_calories = goals["daily_calories"]
 
-# Create tabs
-tab1, tab2 = st.tabs(["📅 Today", "📋 History"])
+    tab1, tab2, tab3 = st.tabs(["📅 Today", "📋 History", "📈 Trends"])
 
-# Today Tab
-with tab1:
-    # Daily macro breakdown
-    meals_data = load_meals()
-    today_meals = get_today_meals(meals_data)
-    daily_totals = calculate_daily_totals(today_meals)
+    # Today Tab
+    with tab1:
+        # Daily macro breakdown
+        today_meals = get_today_meals()
+        daily_totals = get_daily_totals(date.today().isoformat())
 
-    with st.container(border=True):
-        st.write("### Today's Progress")
-        col1, col2, col3, col4 = st.columns(4)
-        with col1:
-            protein_diff = daily_totals["protein"] - protein_goal
-            protein_percent = (daily_totals["protein"] / protein_goal) * 100
-            delta_color = "normal"  # default color
-            if protein_percent > 120:
-                delta_color = "inverse"  # red when over 120%
-            elif 95 <= protein_percent <= 105:
-                delta_color = "normal"  # green when within ±5%
-            st.metric("Protein", f"{daily_totals['protein']}g", 
-                     f"{'+' if protein_diff > 0 else ''}{protein_diff}g",
-                     delta_color=delta_color)
-        with col2:
-            st.metric("Carbs", f"{daily_totals['carbs']}g")
-        with col3:
-            st.metric("Fat", f"{daily_totals['fat']}g")
-        with col4:
-            calories_diff = daily_totals["calories"] - daily_calories
-            calories_percent = (daily_totals["calories"] / daily_calories) * 100
-            delta_color = "normal"  # default color
-            if calories_percent > 110:
-                delta_color = "inverse"  # red when over 110%
-            elif 90 <= calories_percent <= 110:
-                delta_color = "normal"  # green when within ±10%
-            st.metric("Calories", f"{daily_totals['calories']} kcal", 
-                     f"{'+' if calories_diff > 0 else ''}{calories_diff} kcal",
-                     delta_color=delta_color)
-
-    # Get meal suggestions
-    if st.button("Get Meal Suggestions"):
-        goals = load_goals()
-        preferences = load_preferences()
-        suggestions = get_meal_suggestions(goals, preferences, today_meals)
-        
-        st.write("### Meal Suggestions")
-        if suggestions["suggestions"]:
-            for suggestion in suggestions["suggestions"]:
-                with st.container(border=True):
-                    st.write(f"**{suggestion['meal']}**")
-                    col1, col2, col3, col4 = st.columns(4)
-                    with col1:
-                        st.metric("Protein", f"{suggestion['protein']}g")
-                    with col2:
-                        st.metric("Carbs", f"{suggestion['carbs']}g")
-                    with col3:
-                        st.metric("Fat", f"{suggestion['fat']}g")
-                    with col4:
-                        st.metric("Calories", f"{suggestion['calories']} kcal")
-        if suggestions["note"]:
-            st.info(suggestions["note"])
-
-    # Meal logging
-    st.subheader("What did you eat today?")
-    with st.form("meal_input_form", clear_on_submit=True):
-        meal_input = st.text_input("Meal Description", 
-                                 placeholder="e.g., 2 rotis with dal and cucumber salad",
-                                 help="Just type what you ate like you're telling a friend",
-                                 label_visibility="collapsed")
-        with st.container():
-            st.markdown("""
-                <style>
-                div[data-testid="stDateInput"] {
-                    width: 200px;
-                }
-                </style>
-            """, unsafe_allow_html=True)
-            meal_date = st.date_input("When did you eat this meal?", 
-                                    value=date.today(),
-                                    max_value=date.today(),
-                                    label_visibility="collapsed")
-        submitted = st.form_submit_button("Show Macros")
+        with st.container(border=True):
+            st.write("### Today's Progress")
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                protein_diff = daily_totals["protein"] - protein_goal
+                protein_percent = (daily_totals["protein"] / protein_goal) * 100
+                delta_color = "normal"  # default color
+                if protein_percent > 120:
+                    delta_color = "inverse"  # red when over 120%
+                elif 95 <= protein_percent <= 105:
+                    delta_color = "normal"  # green when within ±5%
+                st.metric("Protein", f"{daily_totals['protein']}g", 
+                         f"{'+' if protein_diff > 0 else ''}{protein_diff}g",
+                         delta_color=delta_color)
+            with col2:
+                st.metric("Carbs", f"{daily_totals['carbs']}g")
+            with col3:
+                st.metric("Fat", f"{daily_totals['fat']}g")
+            with col4:
+                calories_diff = daily_totals["calories"] - daily_calories
+                calories_percent = (daily_totals["calories"] / daily_calories) * 100
+                delta_color = "normal"  # default color
+                if calories_percent > 110:
+                    delta_color = "inverse"  # red when over 110%
+                elif 90 <= calories_percent <= 110:
+                    delta_color = "normal"  # green when within ±10%
+                st.metric("Calories", f"{daily_totals['calories']} kcal", 
+                         f"{'+' if calories_diff > 0 else ''}{calories_diff} kcal",
+                         delta_color=delta_color)
+
+        # Suggestions for the current remaining goals are fetched in the
+        # background whenever those change (e.g. after a meal is saved), so
+        # the button can usually answer from the cache
+        current_inputs = get_suggestion_inputs(goals, load_preferences(), today_meals)
+        prefetch_suggestions(current_inputs)
+        if st.session_state.suggestions_inputs != current_inputs:
+            # Shown suggestions were for goals that have changed since
+            st.session_state.suggestions = None
+
+        if st.button("Get Meal Suggestions"):
+            st.session_state.suggestions_inputs = current_inputs
+            st.session_state.suggestions = suggestion_cache.get(current_inputs)
+            if st.session_state.suggestions is not None:
+                st.session_state.suggestions_job = None
+            else:
+                # Wait for the prefetch if there is one, otherwise ask now
+                job = suggestion_cache.job(current_inputs)
+                if job is None:
+                    job = start_job(get_meal_suggestions, current_inputs)
+                    if job is not None:
+                        suggestion_cache.track(current_inputs, job)
+                st.session_state.suggestions_job = job
+
+        if st.session_state.suggestions_job is not None:
+            streaming_suggestions()
+        elif st.session_state.suggestions:
+            suggestions = st.session_state.suggestions
+            st.write("### Meal Suggestions")
+            if suggestions["suggestions"]:
+                for suggestion in suggestions["suggestions"]:
+                    display_suggestion(suggestion)
+            if suggestions["note"]:
+                st.info(suggestions["note"])
+
+        # Meal logging
+        st.subheader("What did you eat today?")
+        with st.container(border=True):
+            # Not a form, so pressing Enter shows matching past meals
+            meal_input = st.text_input("Meal Description", key="meal_input",
+                                     placeholder="e.g., 2 rotis with dal and cucumber salad",
+                                     help="Just type what you ate like you're telling a friend",
+                                     label_visibility="collapsed")
+            # Past meals that look like what's typed; using one skips the estimate
+            with profiler.span("meal_search"):
+                matches = meal_index.search(meal_input) if meal_input else []
+            for i, match in enumerate(matches):
+                col1, col2 = st.columns([5, 1])
+                with col1:
+                    st.write(f"{match['description']}")
+                    st.caption(f"{match['macros']['protein']}g protein · {match['macros']['carbs']}g carbs · "
+                               f"{match['macros']['fat']}g fat · logged {match['count']}×")
+                with col2:
+                    st.button("Use", key=f"use_match_{i}", on_click=use_past_meal, args=(match,))
+            with st.container():
+                st.markdown("""
+                    <style>
+                    div[data-testid="stDateInput"] {
+                        width: 200px;
+                    }
+                    </style>
+                """, unsafe_allow_html=True)
+                st.date_input("When did you eat this meal?", key="meal_date",
+                              value=date.today(),
+                              max_value=date.today(),
+                              label_visibility="collapsed")
+            st.button("Show Macros", on_click=submit_meal_input)
+
+        # Meals still being estimated, then the macro breakdown of finished ones
+        if any("job" in pending for pending in st.session_state.pending_meals):
+            estimating_meals()
+        for pending in list(st.session_state.pending_meals):
+            if "job" in pending:
+                continue
+
+            st.write("### Macro Breakdown")
+            st.write(f"**{pending['description']}**")
+            st.caption(pending['interpretation'])
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Protein", f"{pending['macros']['protein']}g")
+            with col2:
+                st.metric("Carbs", f"{pending['macros']['carbs']}g")
+            with col3:
+                st.metric("Fat", f"{pending['macros']['fat']}g")
         
-        if submitted and meal_input:
-            # Create new meal entry and store in session state
-            result = estimate_macros(meal_input)
-            macros = result["macros"]
+            # Second form for confirmation
+            with st.form(f"meal_confirm_form_{pending['id']}"):
+                st.write("### Ready to save this meal?")
+                col1, col2 = st.columns([1, 1])
+                with col1:
+                    confirmed = st.form_submit_button("Save Meal")
+                with col2:
+                    discarded = st.form_submit_button("Discard")
+                if confirmed:
+                    # Add new meal and save
+                    add_meal(pending)
+                    # Set notification to show after reload
+                    st.session_state.notification = {
+                        "message": "Meal added successfully!",
+                        "type": "success"
+                    }
+                    # Clear the pending meal
+                    st.session_state.pending_meals.remove(pending)
+                    # Reload the page
+                    rerun_fragment()
+                if discarded:
+                    st.session_state.pending_meals.remove(pending)
+                    rerun_fragment()
 
-            if result["interpretation"] == "Unable to process the description":
-                st.session_state.notification = {
-                    "message": f"Error estimating macros. {result['interpretation']}",
-                    "type": "error"
-                }
-                st.rerun()
+        # Today's meals
+        st.write("### Today's Meals")
+        if not today_meals:
+            st.write("No meals logged yet today.")
+        else:
+            # Sort meals by timestamp (newest first)
+            sorted_meals = sorted(today_meals, 
+                                key=lambda x: x.epoch, 
+                                reverse=True)
+            with profiler.span("render_today"):
+                for meal in sorted_meals:
+                    display_meal_card(meal, show_date=False, tab_name="today")
+
+    # History Tab
+    with tab2, profiler.span("render_history"):
+        st.write("### Past Meals")
+        history_cursors = st.session_state.history_cursors
+        # Fetch one extra meal to know whether there is an older page
+        with profiler.span("load_meals"):
+            page_meals = meal_store.page(HISTORY_PAGE_SIZE + 1, before=history_cursors[-1])
+        has_older = len(page_meals) > HISTORY_PAGE_SIZE
+        page_meals = page_meals[:HISTORY_PAGE_SIZE]
+
+        if not page_meals:
+            if len(history_cursors) == 1:
+                st.write("No meals logged yet.")
             else:
-                # Convert date to datetime for timestamp
-                meal_datetime = datetime.combine(meal_date, datetime.now().time())
-                st.session_state.pending_meal = {
-                    "id": str(uuid.uuid4()),
-                    "timestamp": meal_datetime.isoformat(),
-                    "description": meal_input,
-                    "macros": macros,
-                    "interpretation": result["interpretation"]
-                }
+                st.write("No older meals.")
+        else:
+            # Group the page's meals under a header per day (newest first)
+            current_day = None
+            for meal in page_meals:
+                meal_day = meal.day
+                if meal_day != current_day:
+                    current_day = meal_day
+                    day_totals = get_daily_totals(meal_day)
+                    st.write(f"#### {date.fromisoformat(meal_day).strftime('%A, %B %d, %Y')}")
+                    st.caption(f"{day_totals['protein']}g protein · {day_totals['carbs']}g carbs · "
+                               f"{day_totals['fat']}g fat · {day_totals['calories']} kcal")
+                display_meal_card(meal, show_date=False, tab_name="history")
 
-    # Show macro breakdown if we have a pending meal
-    if st.session_state.pending_meal:
-        st.write("### Macro Breakdown")
-        st.caption(st.session_state.pending_meal['interpretation'])
-        col1, col2, col3 = st.columns(3)
+        col1, col2 = st.columns(2)
         with col1:
-            st.metric("Protein", f"{st.session_state.pending_meal['macros']['protein']}g")
+            if len(history_cursors) > 1 and st.button("← Newer meals", key="history_newer"):
+                history_cursors.pop()
+                rerun_fragment()
         with col2:
-            st.metric("Carbs", f"{st.session_state.pending_meal['macros']['carbs']}g")
-        with col3:
-            st.metric("Fat", f"{st.session_state.pending_meal['macros']['fat']}g")
-        
-        # Second form for confirmation
-        with st.form("meal_confirm_form"):
-            st.write("### Ready to save this meal?")
-            confirmed = st.form_submit_button("Save Meal")
-            if confirmed:
-                # Add new meal and save
-                meals_data["meals"].append(st.session_state.pending_meal)
-                save_meals(meals_data)
-                # Set notification to show after reload
-                st.session_state.notification = {
-                    "message": "Meal added successfully!",
-                    "type": "success"
-                }
-                # Clear the pending meal
-                st.session_state.pending_meal = None
-                # Reload the page
-                st.rerun()
+            if has_older and st.button("Older meals →", key="history_older"):
+                history_cursors.append(page_meals[-1])
+                rerun_fragment()
 
-    # Today's meals
-    st.write("### Today's Meals")
-    if not today_meals:
-        st.write("No meals logged yet today.")
-    else:
-        # Sort meals by timestamp (newest first)
-        sorted_meals = sorted(today_meals, 
-                            key=lambda x: x["timestamp"], 
-                            reverse=True)
-        for meal in sorted_meals:
-            display_meal_card(meal, show_date=False, tab_name="today")
-
-# History Tab
-with tab2:
-    st.write("### Past Meals")
-    meals_data = load_meals()
-    if not meals_data["meals"]:
-        st.write("No meals logged yet.")
-    else:
-        # Sort meals by date (newest first)
-        sorted_meals = sorted(meals_data["meals"], 
-                            key=lambda x: x["timestamp"], 
-                            reverse=True)
-        
-        for meal in sorted_meals:
-            display_meal_card(meal, show_date=True, tab_name="history") 
\ No newline at end of file
+    # Trends Tab
+    with tab3, profiler.span("render_trends"):
+        st.write("### Trends")
+        col1, col2 = st.columns(2)
+        with col1:
+            range_name = st.selectbox("Range", list(TREND_RANGES), key="trends_range")
+        with col2:
+            grouping = st.radio("Group by", list(TREND_GROUPINGS), horizontal=True, key="trends_grouping")
+        range_days = TREND_RANGES[range_name]
+        today = date.today()
+        start = None if range_days is None else today - timedelta(days=range_days - 1)
+        daily = meal_trends.daily(start=start, end=today)
+
+        if not daily.meals.any():
+            st.write("No meals logged in this range.")
+        else:
+            # Today isn't over yet, so it doesn't count towards adherence
+            adherence = goal_adherence(meal_trends.daily(start=start, end=today - timedelta(days=1)),
+                                       protein_goal, daily_calories)
+            logged = daily.meals > 0
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Days logged", int(logged.sum()))
+            with col2:
+                st.metric("Avg calories", f"{daily.calories[logged].mean():.0f} kcal")
+            completed = adherence["days_logged"] > 0
+            with col3:
+                st.metric("Protein goal met", f"{adherence['protein']:.0%}" if completed else "–")
+            with col4:
+                st.metric("Calorie goal met", f"{adherence['calories']:.0%}" if completed else "–")
+            if completed:
+                st.caption(f"Averages are per logged day. Both goals were met on {adherence['both']:.0%} "
+                           f"of {adherence['days_logged']} completed logged days (calories within ±10%).")
+
+            period, window, window_name = TREND_GROUPINGS[grouping]
+            totals = daily if period is None else resample(daily, period)
+            calories_chart = {"Date": totals.periods,
+                              "Calories": totals.calories,
+                              f"{window_name} average": rolling_average(totals.calories, totals.meals, window)}
+            if period is None:
+                calories_chart["Goal"] = [daily_calories] * len(totals.periods)
+            st.write("#### Calories")
+            st.line_chart(calories_chart, x="Date", x_label="", y_label="kcal")
+            st.write("#### Macros")
+            st.bar_chart({"Date": totals.periods, "Protein": totals.protein,
+                          "Carbs": totals.carbs, "Fat": totals.fat},
+                         x="Date", x_label="", y_label="grams")
+
+meal_views()
+record_timing("full_run")
+profiler.finish_run(first_paint_ms=st.session_state.timings["first_paint"], caches=cache_hit_rates())
+
+# Read the archive's meal summaries for search now that the page is up
+meal_index.preload()
@@ -0,0 +1,481 @@
+"""Benchmarks of the meal log hot paths on synthetic histories.
+
+For each size a ``meals.json`` history is generated in a temp folder. The
+benchmark first times the store operations behind the app's hot paths:
+loading, saving, today's meals and the first (sorting) and later History
+pages. It then runs ``app.py`` with Streamlit's AppTest: a cold first run,
+warm reruns (with per-phase timings taken from the app's profile.jsonl) and one
+meal estimate. OpenAI requests go to a local fake server with a configurable
+latency, so no network or API key is needed. Results are JSON, so runs can be
+compared between commits::
+
+    python benchmark.py --sizes 1000 100000 1000000 --output bench.json
+"""
+
+import argparse
+from datetime import date, datetime, timedelta
+import http.server
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from meal_store import DEFAULT_DB_FILE, MealJournal
+from profiling import percentile
+from sqlite_store import migrate, SqliteMealStore
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# Dishes the synthetic history is made of: description, protein, carbs, fat
+DISHES = [
+    ("roti with dal", 12, 45, 6),
+    ("paneer bhurji", 18, 6, 20),
+    ("chicken curry with rice", 32, 60, 14),
+    ("masala omelette", 14, 3, 12),
+    ("whey protein shake", 24, 4, 2),
+    ("rajma chawal", 15, 70, 5),
+    ("poha", 5, 40, 7),
+    ("idli sambar", 8, 42, 3),
+    ("greek yogurt with berries", 17, 20, 4),
+    ("grilled fish salad", 30, 10, 9),
+    ("chole bhature", 14, 80, 28),
+    ("egg fried rice", 13, 55, 12),
+    ("mixed vegetable sabzi", 4, 15, 8),
+    ("peanut butter toast", 10, 30, 16),
+    ("tofu stir fry", 20, 18, 11),
+]
+QUANTITIES = ["", "1 bowl of ", "2 servings of ", "half a plate of ", "a large "]
+
+
+def synthetic_meals(count, years=10, seed=0):
+    """Yield count meals ending today, oldest first.
+
+    Meals are spread over at most the given number of years, with at least
+    three per day, so larger histories log more meals per day.
+    """
+    rng = random.Random(seed)
+    per_day = max(3, math.ceil(count / (years * 365)))
+    days = math.ceil(count / per_day)
+    first_day = datetime.combine(
+        date.today() - timedelta(days=days - 1), datetime.min.time()
+    )
+    # Meals fall between 07:00 and 21:00
+    slot = 14 * 3600 / per_day
+    for index in range(count):
+        day, meal_of_day = divmod(index, per_day)
+        offset = 7 * 3600 + meal_of_day * slot + rng.uniform(0, slot / 2)
+        description, protein, carbs, fat = rng.choice(DISHES)
+        scale = rng.choice((0.5, 1, 1, 1.5, 2))
+        meal = {
+            "id": f"meal-{index}",
+            "timestamp": (first_day + timedelta(days=day, seconds=offset)).isoformat(),
+            "description": rng.choice(QUANTITIES) + description,
+            "macros": {
+                "protein": round(protein * scale, 1),
+                "carbs": round(carbs * scale, 1),
+                "fat": round(fat * scale, 1),
+            },
+        }
+        if rng.random() < 0.5:
+            meal["interpretation"] = f"One portion of {description}"
+        yield meal
+
+
+def write_history(directory, count, seed):
+    """Write a synthetic meals.json with count meals into directory."""
+    with open(os.path.join(directory, "meals.json"), "w", encoding="utf-8") as f:
+        f.write('{"meals": [')
+        for index, meal in enumerate(synthetic_meals(count, seed=seed)):
+            if index:
+                f.write(",\n")
+            f.write(json.dumps(meal))
+        f.write("]}\n")
+
+
+class FakeOpenAI:
+    """Local stand-in for the OpenAI chat completions endpoint.
+
+    Every request is answered with a canned reply of the shape the app asks
+    for (protein choices, macro estimates or meal suggestions) after
+    ``latency`` seconds, streamed in small chunks when requested.
+    """
+
+    def __init__(self, latency=0.5, chunk_delay=0.01):
+        """Start serving on a free local port.
+
+        Args:
+            latency: Seconds before the first byte of each reply.
+            chunk_delay: Seconds between streamed chunks.
+        """
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.requests = 0
+        self._server = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0), _FakeOpenAIHandler
+        )
+        self._server.fake = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def base_url(self):
+        """URL to use as OPENAI_BASE_URL."""
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def close(self):
+        """Stop the server."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    @staticmethod
+    def reply(messages):
+        """Return the reply text for a chat request's messages."""
+        prompt = " ".join(message["content"] for message in messages)
+        if "protein sources" in prompt and "JSON array" in prompt:
+            return json.dumps(["Chicken", "Paneer", "Whey Protein", "Eggs", "Dal"])
+        if "numbered list of meal" in prompt:
+            # A bulk import estimating several meals at once
+            lines = [
+                line.split(". ", 1)[1] for line in messages[-1]["content"].splitlines()
+            ]
+            return json.dumps(
+                {
+                    "meals": [
+                        {
+                            "index": index,
+                            "interpretation": f"A typical serving of {line}",
+                            "macros": {"protein": 20, "carbs": 35, "fat": 12},
+                        }
+                        for index, line in enumerate(lines, 1)
+                    ]
+                }
+            )
+        if "meal planning" in prompt:
+            suggestion = {"protein": 30, "carbs": 40, "fat": 10, "calories": 370}
+            return json.dumps(
+                {
+                    "suggestions": [
+                        {"meal": "Grilled chicken wrap", **suggestion},
+                        {"meal": "Paneer tikka with salad", **suggestion},
+                    ],
+                    "note": "Synthetic suggestions from the benchmark",
+                }
+            )
+        return json.dumps(
+            {
+                "interpretation": f"A typical serving of {messages[-1]['content']}",
+                "macros": {"protein": 20, "carbs": 35, "fat": 12},
+            }
+        )
+
+
+class _FakeOpenAIHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        fake = self.server.fake
+        fake.requests += 1
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        text = fake.reply(request["messages"])
+        usage = {
+            "prompt_tokens": sum(len(m["content"]) for m in request["messages"]) // 4,
+            "completion_tokens": len(text) // 4,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": "fake", "created": int(time.time()), "model": request["model"]}
+        time.sleep(fake.latency)
+
+        if not request.get("stream"):
+            body = json.dumps(
+                {
+                    **base,
+                    "object": "chat.completion",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": text},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": usage,
+                }
+            ).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        chunk = {**base, "object": "chat.completion.chunk"}
+        for start in range(0, len(text), 8):
+            delta = {"content": text[start : start + 8]}
+            self._event({**chunk, "choices": [{"index": 0, "delta": delta}]})
+            time.sleep(fake.chunk_delay)
+        self._event(
+            {**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        )
+        if request.get("stream_options", {}).get("include_usage"):
+            self._event({**chunk, "choices": [], "usage": usage})
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def handle(self):
+        # The app stops reading a stream early when a request is superseded
+        try:
+            super().handle()
+        except ConnectionError:
+            pass
+
+    def _event(self, data):
+        self.wfile.write(f"data: {json.dumps(data)}\n\n".encode())
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def summarize(samples):
+    """Return count, min, median, p95 and max of millisecond samples."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"runs": 0}
+    return {
+        "runs": len(ordered),
+        "min_ms": round(ordered[0], 2),
+        "median_ms": round(statistics.median(ordered), 2),
+        "p95_ms": round(percentile(ordered, 95), 2),
+        "max_ms": round(ordered[-1], 2),
+    }
+
+
+def timed(func, repeat):
+    """Call func repeat times; return the summary and the last result."""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples), result
+
+
+def open_backend(backend, directory):
+    """Open the store the app would use for directory."""
+    if backend == "sqlite":
+        return SqliteMealStore(os.path.join(directory, DEFAULT_DB_FILE))
+    return MealJournal(directory)
+
+
+def bench_store(backend, directory, repeat):
+    """Time the store operations behind the app's hot paths."""
+    results = {}
+    today = date.today().isoformat()
+
+    if backend == "json":
+        # A fresh history is archived once on first open; time that apart
+        start = time.perf_counter()
+        open_backend(backend, directory).compact()
+        results["archive_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+    start = time.perf_counter()
+    store = open_backend(backend, directory)
+    store.recent_records()
+    results["cold_load_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+    # The first page sorts the whole history; later pages reuse that order
+    start = time.perf_counter()
+    first_page = store.page(21)
+    results["history_first_page_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    results["history_page"], _ = timed(
+        lambda: store.page(21, before=first_page[-1]), repeat
+    )
+    results["load_meals"], meals_data = timed(store.load, repeat)
+    results["get_today_meals"], today_meals = timed(
+        lambda: store.meals_for_day(today), repeat
+    )
+    results["today_sort"], _ = timed(
+        lambda: sorted(today_meals, key=lambda meal: meal.epoch, reverse=True), repeat
+    )
+    results["save_meals"], _ = timed(lambda: store.replace(meals_data), repeat)
+    results["today_meals"] = len(today_meals)
+    return results
+
+
+def bench_app(directory, reruns, estimate_text, timeout):
+    """Run app.py with AppTest: a cold run, warm reruns and one estimate."""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    # Stores, indexes and queues from the previous size must not be reused
+    st.cache_resource.clear()
+    results = {}
+    app = AppTest.from_file(APP_PATH, default_timeout=timeout)
+
+    start = time.perf_counter()
+    app.run()
+    results["first_run_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    if app.exception:
+        raise RuntimeError(f"app.py failed: {app.exception[0].value}")
+
+    samples = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        samples.append((time.perf_counter() - start) * 1000)
+    results["rerun"] = summarize(samples)
+
+    # Log a meal the built-in food table doesn't know, so it goes to the LLM
+    app.text_input(key="meal_input").input(estimate_text)
+    next(button for button in app.button if button.label == "Show Macros").click()
+    start = time.perf_counter()
+    app.run()
+    while not any(button.label == "Save Meal" for button in app.button):
+        if time.perf_counter() - start > timeout:
+            raise RuntimeError("estimate did not finish")
+        time.sleep(0.02)
+        app.run()
+    results["estimate_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+    runs, spans = read_profile(os.path.join(directory, "profile.jsonl"))
+    # Skip the cold run; its phases are in first_run_ms
+    phases = {}
+    for run in runs[1 : reruns + 1]:
+        for phase, ms in run["spans"].items():
+            phases.setdefault(phase, []).append(ms)
+    results["phases"] = {phase: summarize(ms) for phase, ms in sorted(phases.items())}
+    results["openai"] = {phase: summarize(ms) for phase, ms in sorted(spans.items())}
+    return results
+
+
+def read_profile(path):
+    """Return the run records and the durations of OpenAI spans in path."""
+    runs = []
+    spans = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record["type"] == "run" and "fragment" not in record:
+                runs.append(record)
+            elif record["type"] == "span" and record["phase"].startswith("openai."):
+                spans.setdefault(record["phase"], []).append(record["ms"])
+    return runs, spans
+
+
+def git_commit():
+    """Return the current git commit of this checkout, or None."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(APP_PATH),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_size(args, count, directory, fake):
+    """Generate a history of count meals in directory and benchmark it."""
+    result = {"meals": count}
+    if args.keep:
+        result["directory"] = directory
+    print(f"{count} meals in {directory}", file=sys.stderr)
+
+    start = time.perf_counter()
+    write_history(directory, count, args.seed)
+    if args.backend == "sqlite":
+        migrate(directory, os.path.join(directory, DEFAULT_DB_FILE))
+    result["generate_ms"] = round((time.perf_counter() - start) * 1000, 2)
+
+    result["store"] = bench_store(args.backend, directory, args.repeat)
+    if args.skip_app:
+        return result
+
+    os.environ.update(
+        {
+            "TEMPO_DATA_DIR": directory,
+            "TEMPO_STORAGE": args.backend,
+            "TEMPO_DB_PATH": os.path.join(directory, DEFAULT_DB_FILE),
+            "TEMPO_STREAM": "0" if args.no_stream else "1",
+            "TEMPO_PROFILE": "1",
+            "OPENAI_API_KEY": "benchmark",
+            "OPENAI_BASE_URL": fake.base_url,
+        }
+    )
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        result["app"] = bench_app(
+            directory, args.reruns, "mystery benchmark stew", args.timeout
+        )
+    finally:
+        os.chdir(cwd)
+    return result
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--backend", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per store timing")
+    parser.add_argument("--reruns", type=int, default=10, help="warm app reruns")
+    parser.add_argument(
+        "--llm-latency", type=float, default=0.5, help="seconds before each reply"
+    )
+    parser.add_argument("--no-stream", action="store_true", help="TEMPO_STREAM=0")
+    parser.add_argument("--skip-app", action="store_true", help="store timings only")
+    parser.add_argument(
+        "--keep", action="store_true", help="keep the generated data folders"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=600, help="seconds per run")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    report = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": args.backend,
+        "llm_latency_s": args.llm_latency,
+        "stream": not args.no_stream,
+        "seed": args.seed,
+        "sizes": [],
+    }
+    fake = FakeOpenAI(latency=args.llm_latency)
+    try:
+        for count in args.sizes:
+            directory = tempfile.mkdtemp(prefix=f"tempo-bench-{count}-")
+            try:
+                report["sizes"].append(run_size(args, count, directory, fake))
+            finally:
+                if not args.keep:
+                    shutil.rmtree(directory, ignore_errors=True)
+    finally:
+        fake.close()
+    report["llm_requests"] = fake.requests
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
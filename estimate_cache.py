@@ -0,0 +1,196 @@
+"""Persistent cache of macro estimates keyed on the normalized meal description.
+
+Entries are content-addressed: the key is a hash of the model, the prompt
+version and the normalized description, so changing either of the first two
+naturally stops old answers from being served.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from meal_store import user_data_dir
+
+CACHE_FILE = "estimate_cache.db"
+MAX_ENTRIES = 5000
+TTL_SECONDS = 90 * 24 * 3600
+
+NUMBER_WORDS = {
+    "a half": "0.5",
+    "half": "0.5",
+    "one": "1",
+    "two": "2",
+    "three": "3",
+    "four": "4",
+    "five": "5",
+    "six": "6",
+    "seven": "7",
+    "eight": "8",
+    "nine": "9",
+    "ten": "10",
+    "eleven": "11",
+    "twelve": "12",
+    "dozen": "12",
+}
+
+UNITS = {
+    "g": ("g", "gm", "gms", "gram", "grams", "gr"),
+    "kg": ("kg", "kgs", "kilo", "kilos", "kilogram", "kilograms"),
+    "ml": ("ml", "mls", "millilitre", "millilitres", "milliliter", "milliliters"),
+    "l": ("l", "litre", "litres", "liter", "liters"),
+    "cup": ("cup", "cups"),
+    "bowl": ("bowl", "bowls", "katori", "katoris"),
+    "plate": ("plate", "plates"),
+    "glass": ("glass", "glasses"),
+    "tbsp": ("tbsp", "tbsps", "tablespoon", "tablespoons"),
+    "tsp": ("tsp", "tsps", "teaspoon", "teaspoons"),
+    "piece": ("piece", "pieces", "pc", "pcs"),
+    "slice": ("slice", "slices"),
+    "scoop": ("scoop", "scoops"),
+}
+UNIT_ALIASES = {alias: unit for unit, aliases in UNITS.items() for alias in aliases}
+
+_NUMBER_WORD_RE = re.compile(
+    r"\b(" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True)) + r")\b"
+)
+_NUMBER_UNIT_RE = re.compile(r"(\d+(?:\.\d+)?)\s*([a-z]+)\b")
+_NUMBER_RE = re.compile(r"\d+\.\d+")
+
+
+def _normalize_number(match):
+    return f"{float(match.group(0)):g}"
+
+
+def _join_unit(match):
+    number, word = match.groups()
+    unit = UNIT_ALIASES.get(word)
+    if unit is None:
+        return f"{number} {word}"
+    return f"{number}{unit}"
+
+
+def _singular(word):
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us")):
+        return word[:-1]
+    return word
+
+
+def normalize_description(description):
+    """Reduce a meal description to a canonical form for cache lookups.
+
+    Lowercases, spells numbers as digits, canonicalizes units ("150 grams" and
+    "150gm" both become "150g"), drops punctuation and plural "s" endings and
+    collapses whitespace.
+
+    Args:
+        description: Free-text meal description.
+
+    Returns:
+        The normalized description.
+    """
+    text = description.lower().replace("&", " and ")
+    text = _NUMBER_WORD_RE.sub(lambda m: NUMBER_WORDS[m.group(1)], text)
+    text = re.sub(r"[^a-z0-9.\s]", " ", text)
+    text = re.sub(r"(?<!\d)\.|\.(?!\d)", " ", text)
+    text = _NUMBER_RE.sub(_normalize_number, text)
+    text = _NUMBER_UNIT_RE.sub(_join_unit, text)
+    return " ".join(_singular(word) for word in text.split())
+
+
+class EstimateCache:
+    """SQLite-backed LRU cache of estimate_macros results with a TTL."""
+
+    def __init__(self, path=None, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS):
+        """Open the cache file, creating it if needed.
+
+        Args:
+            path: SQLite file to keep entries in; defaults to CACHE_FILE in
+                the data folder (``$TEMPO_DATA_DIR``).
+            max_entries: Least recently used entries beyond this are evicted.
+            ttl: Seconds an entry stays valid after it was stored.
+        """
+        self.path = path or os.path.join(user_data_dir(), CACHE_FILE)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS estimates ("
+                "key TEXT PRIMARY KEY, result TEXT NOT NULL, "
+                "created_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS estimates_used_at ON estimates (used_at)"
+            )
+
+    @staticmethod
+    def key(description, model, prompt_version):
+        """Return the content address for a description under model/prompt."""
+        material = f"{model}\0{prompt_version}\0{normalize_description(description)}"
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, description, model, prompt_version):
+        """Return the cached result for description, or None on a miss."""
+        key = self.key(description, model, prompt_version)
+        now = time.time()
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT result, created_at FROM estimates WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] < now - self.ttl:
+                if row is not None:
+                    conn.execute("DELETE FROM estimates WHERE key = ?", (key,))
+                    self.evictions += 1
+                self.misses += 1
+                return None
+            conn.execute("UPDATE estimates SET used_at = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, description, model, prompt_version, result):
+        """Store result for description and evict entries over the size cap."""
+        key = self.key(description, model, prompt_version)
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO estimates (key, result, created_at, used_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(result), now, now),
+            )
+            expired = conn.execute(
+                "DELETE FROM estimates WHERE created_at < ?", (now - self.ttl,)
+            ).rowcount
+            overflow = conn.execute(
+                "DELETE FROM estimates WHERE key IN (SELECT key FROM estimates "
+                "ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+        self.evictions += expired + overflow
+
+    def stats(self):
+        """Return hit/miss/eviction counters and the current entry count."""
+        (entries,) = (
+            self._connection().execute("SELECT COUNT(*) FROM estimates").fetchone()
+        )
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            self._local.conn = conn
+        return conn
@@ -0,0 +1,69 @@
+"""Process-wide cache of parsed JSON files, validated by modification time and size.
+
+Every session served by the same Streamlit process shares ``json_cache``. An
+entry is reused while the file's ``(st_mtime_ns, st_size)`` is unchanged, so
+edits made outside the app are picked up on the next read, and writers in the
+app call ``invalidate`` so their own changes are never masked.
+"""
+
+import copy
+import json
+import os
+import threading
+
+
+class FileCache:
+    """Cache of parsed JSON documents keyed on path plus mtime and size."""
+
+    def __init__(self):
+        """Create an empty cache."""
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def read_json(self, path):
+        """Return the parsed contents of path, re-reading it only if it changed.
+
+        Args:
+            path: JSON file to read.
+
+        Returns:
+            A private copy of the parsed data, safe for the caller to modify.
+
+        Raises:
+            FileNotFoundError: If path doesn't exist.
+        """
+        key = os.path.abspath(path)
+        stat = os.stat(key)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+            self.misses += 1
+
+        with open(key, "r") as f:
+            stat = os.fstat(f.fileno())
+            data = json.load(f)
+        with self._lock:
+            self._entries[key] = ((stat.st_mtime_ns, stat.st_size), data)
+        return copy.deepcopy(data)
+
+    def invalidate(self, path):
+        """Forget the cached contents of path."""
+        with self._lock:
+            self._entries.pop(os.path.abspath(path), None)
+
+    def stats(self):
+        """Return hit/miss counters and the hit rate."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+json_cache = FileCache()
@@ -0,0 +1,111 @@
+"""Small helpers for writing data files safely."""
+
+import contextlib
+import json
+import os
+import stat
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows has no flock; locking becomes a no-op there
+    fcntl = None
+
+# Process umask, read on first use
+_umask = None
+_umask_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def file_lock(path, shared=False):
+    """Hold an advisory flock on path for the duration of the with block.
+
+    Shared holders don't block each other; an exclusive holder waits for all
+    of them and blocks new ones.
+
+    Args:
+        path: Lock file, created if missing.
+        shared: Take a shared lock instead of an exclusive one.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield
+    finally:
+        # Closing the descriptor releases the lock
+        os.close(fd)
+
+
+def atomic_write_json(path, data):
+    """Write JSON to path via a temp file and rename so readers never see half a file.
+
+    Args:
+        path: Destination file path.
+        data: JSON-serializable object to write.
+    """
+    _atomic_write(path, "w", lambda f: json.dump(data, f, indent=2))
+
+
+def atomic_write_bytes(path, data):
+    """Write bytes to path via a temp file and rename, like atomic_write_json.
+
+    Args:
+        path: Destination file path.
+        data: Bytes to write.
+    """
+    _atomic_write(path, "wb", lambda f: f.write(data))
+
+
+def _atomic_write(path, mode, write):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory
+    )
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file 0600; keep the mode a plain open would give
+        os.chmod(tmp_path, _file_mode(path))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def _file_mode(path):
+    """Mode of the existing file at path, or 0666 less the umask for a new one."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~_current_umask()
+
+
+def _current_umask():
+    global _umask
+    with _umask_lock:
+        if _umask is None:
+            _umask = _read_umask()
+        return _umask
+
+
+def _read_umask():
+    """Read the umask from /proc where possible, since os.umask has to set it."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError):
+        pass
+    # Without /proc the umask can only be read by setting it; set an owner-only
+    # one meanwhile so files other threads create can't end up more open
+    umask = os.umask(0o077)
+    os.umask(umask)
+    return umask
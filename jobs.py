@@ -0,0 +1,265 @@
+"""Background job queue for slow calls such as LLM requests.
+
+``JobQueue`` runs submitted functions on a small pool of worker threads, so a
+Streamlit script run can enqueue work and return at once. The caller keeps the
+returned ``Job`` (for example in session state) and checks ``job.done`` on
+later runs. A failed attempt is retried with exponential backoff until the job
+runs out of retries or time, and a job can be cancelled at any point.
+
+Job functions run outside any script run, so they must not call Streamlit.
+Each attempt should bound its own blocking calls (e.g. an HTTP timeout); the
+queue enforces the overall deadline between attempts.
+
+A job function can call ``report_progress`` with a partial result (such as the
+part of a streamed response received so far), which callers read from
+``job.partial`` while the job is still running.
+"""
+
+import queue
+import random
+import threading
+import time
+import uuid
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Job being run by the current worker thread, for report_progress
+_current = threading.local()
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when too many jobs are already waiting."""
+
+
+class Job:
+    """One unit of work submitted to a JobQueue.
+
+    Attributes:
+        id: Unique job id.
+        status: One of PENDING, RUNNING, DONE, FAILED or CANCELLED.
+        result: Return value of the function once status is DONE.
+        error: The last exception raised once status is FAILED.
+        partial: The latest value passed to report_progress, or None.
+        attempts: Number of times the function has been started.
+    """
+
+    def __init__(self, func, args, kwargs, retries, backoff, timeout):
+        """Create a pending job; use JobQueue.submit rather than this."""
+        self.id = str(uuid.uuid4())
+        self.status = PENDING
+        self.result = None
+        self.error = None
+        self.partial = None
+        self.first_progress_at = None
+        self.attempts = 0
+        self.retries = retries
+        self.backoff = backoff
+        self.submitted_at = time.monotonic()
+        self.deadline = self.submitted_at + timeout if timeout else None
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+
+    @property
+    def done(self):
+        """Whether the job has finished, failed or been cancelled."""
+        return self._finished.is_set()
+
+    @property
+    def elapsed(self):
+        """Seconds since the job was submitted."""
+        return time.monotonic() - self.submitted_at
+
+    def cancel(self):
+        """Cancel the job.
+
+        A job that hasn't started never runs. An attempt already in progress
+        can't be interrupted, but its result is discarded and no retry follows.
+
+        Returns:
+            True if the job was cancelled, False if it had already finished.
+        """
+        with self._lock:
+            if self.done:
+                return False
+            self.status = CANCELLED
+            self._cancelled.set()
+            self._finished.set()
+        return True
+
+    def wait(self, timeout=None):
+        """Block until the job is done or timeout seconds pass.
+
+        Returns:
+            True if the job is done.
+        """
+        return self._finished.wait(timeout)
+
+    def _start(self):
+        with self._lock:
+            if self.done:
+                return False
+            self.status = RUNNING
+            self.attempts += 1
+            return True
+
+    def _finish(self, status, result=None, error=None):
+        with self._lock:
+            if self.done:
+                return False
+            self.status = status
+            self.result = result
+            self.error = error
+            self._finished.set()
+        return True
+
+
+class JobQueue:
+    """Bounded queue of jobs served by a fixed pool of worker threads."""
+
+    def __init__(self, workers=4, max_pending=32, retries=2, backoff=1.0, timeout=60):
+        """Start the worker threads.
+
+        Args:
+            workers: Number of jobs run at the same time.
+            max_pending: Jobs allowed to wait for a worker before submit()
+                raises QueueFull.
+            retries: Default number of retries after a failed attempt.
+            backoff: Default delay in seconds before the first retry; it
+                doubles (with jitter) for each further retry.
+            timeout: Default seconds from submission after which no further
+                attempt is started.
+        """
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self._running = 0
+        self._stats_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._workers = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, func, *args, retries=None, backoff=None, timeout=None, **kwargs):
+        """Queue func(*args, **kwargs) to run on a worker thread.
+
+        Args:
+            func: Function to call. It must not use Streamlit.
+            *args: Positional arguments for func.
+            retries: Retries after a failed attempt (default: the queue's).
+            backoff: Delay before the first retry (default: the queue's).
+            timeout: Overall time budget in seconds (default: the queue's).
+            **kwargs: Keyword arguments for func.
+
+        Returns:
+            The queued Job.
+
+        Raises:
+            QueueFull: If max_pending jobs are already waiting.
+        """
+        job = Job(
+            func,
+            args,
+            kwargs,
+            retries=self.retries if retries is None else retries,
+            backoff=self.backoff if backoff is None else backoff,
+            timeout=self.timeout if timeout is None else timeout,
+        )
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            raise QueueFull(f"{self._queue.maxsize} jobs are already waiting") from None
+        return job
+
+    def stats(self):
+        """Return counts of waiting, running, completed, failed and retried jobs."""
+        with self._stats_lock:
+            return {
+                "waiting": self._queue.qsize(),
+                "running": self._running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "retried": self.retried,
+            }
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            with self._stats_lock:
+                self._running += 1
+            try:
+                self._run(job)
+            finally:
+                _current.job = None
+                with self._stats_lock:
+                    self._running -= 1
+                self._queue.task_done()
+
+    def _run(self, job):
+        if job.deadline is not None and time.monotonic() >= job.deadline:
+            if job._finish(
+                FAILED, error=TimeoutError("timed out waiting for a worker")
+            ):
+                self._count("failed")
+            return
+        for attempt in range(job.retries + 1):
+            if not job._start():
+                # Cancelled while waiting
+                return
+            _current.job = job
+            try:
+                result = job._func(*job._args, **job._kwargs)
+            except Exception as e:
+                delay = job.backoff * 2**attempt * random.uniform(0.5, 1.0)
+                out_of_time = (
+                    job.deadline is not None
+                    and time.monotonic() + delay >= job.deadline
+                )
+                if attempt == job.retries or out_of_time:
+                    if job._finish(FAILED, error=e):
+                        self._count("failed")
+                    return
+                self._count("retried")
+                # The next attempt starts over
+                job.partial = None
+                # Wake early if the job is cancelled during the backoff
+                if job._cancelled.wait(delay):
+                    return
+                continue
+            if job._finish(DONE, result=result):
+                self._count("completed")
+            return
+
+    def _count(self, counter):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+def report_progress(partial):
+    """Publish a partial result of the job running on this thread.
+
+    Does nothing when called outside a job, so job functions can also be
+    called directly.
+
+    Args:
+        partial: The result so far; it replaces any earlier partial result.
+    """
+    job = getattr(_current, "job", None)
+    if job is None:
+        return
+    if job.first_progress_at is None:
+        job.first_progress_at = time.monotonic()
+    job.partial = partial
@@ -0,0 +1,442 @@
+"""Shared OpenAI client with rate limiting, a circuit breaker and request dedup.
+
+Every OpenAI request of the process goes through one ``LLMClient``. It runs an
+asyncio event loop on a background thread with a single ``openai.AsyncOpenAI``
+client, so all requests share one pool of HTTP connections. Callers on
+ordinary threads, such as job queue workers, use the blocking ``complete``
+method, which can hand them a streamed reply piece by piece.
+
+Each model gets its own limits:
+
+- A token bucket keeps requests under the model's requests-per-minute limit.
+- An adaptive concurrency limit (additive increase, multiplicative decrease)
+  bounds the requests in flight. It grows by one after that many successes in
+  a row and halves when OpenAI rate-limits a request, times out or fails.
+- A circuit breaker opens after several failures in a row. While it is open,
+  requests fail at once with ``CircuitOpen`` instead of waiting on a service
+  that is down. After a cool-down one trial request is let through, and its
+  outcome closes or reopens the circuit.
+
+Identical requests (same model, messages and parameters) are single-flight.
+A request that is already in flight is joined instead of sent again, so many
+sessions estimating the same description cause one upstream call. A caller
+that joins late first receives the text streamed so far, then the rest as it
+arrives.
+
+The ``openai`` module is imported on the event loop thread on first use, so
+creating a client costs nothing at startup.
+"""
+
+import asyncio
+import collections
+import concurrent.futures
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+# Requests per minute allowed per model, and for models not listed
+REQUESTS_PER_MINUTE = {"gpt-4o-mini": 500, "gpt-4.1-nano": 500}
+DEFAULT_REQUESTS_PER_MINUTE = 500
+# Requests in flight per model at first, and the most the limit grows to
+INITIAL_CONCURRENCY = 4
+MAX_CONCURRENCY = 16
+# Failures in a row that open a model's circuit, and seconds it stays open
+FAILURE_THRESHOLD = 5
+RESET_SECONDS = 30
+# HTTP connections kept in the shared pool
+MAX_CONNECTIONS = 20
+# Default seconds a request may take, waiting for a slot included
+TIMEOUT = 20
+
+# Queued after the last streamed piece for a caller
+_FINISHED = object()
+
+
+class CircuitOpen(Exception):
+    """Raised instead of sending a request while the model's circuit is open."""
+
+
+Completion = collections.namedtuple(
+    "Completion", ["text", "usage", "first_token_ms", "shared"]
+)
+Completion.__doc__ = """Reply to a chat completion request.
+
+``text`` is the message content and ``usage`` the reply's token usage (None
+if OpenAI didn't report it). ``first_token_ms`` is how long the first streamed
+piece took (None when not streamed). ``shared`` is True when the request joined
+one already in flight, whose tokens were counted by the caller that sent it.
+"""
+
+
+class _ModelState:
+    """Rate limit, concurrency limit and circuit of one model.
+
+    Only touched from the event loop thread.
+    """
+
+    def __init__(self, requests_per_minute, concurrency, max_concurrency):
+        self.rate = requests_per_minute / 60
+        # A full minute's budget can be used in a burst
+        self.capacity = float(requests_per_minute)
+        self.tokens = self.capacity
+        self.refilled_at = time.monotonic()
+        self.limit = concurrency
+        self.max_limit = max_concurrency
+        self.in_flight = 0
+        self.successes = 0
+        self.failures = 0
+        self.open_until = None
+        self.probing = False
+        # Futures of requests waiting for a slot, woken when one frees up
+        self.waiters = []
+        self.counts = collections.Counter()
+
+
+class LLMClient:
+    """Process-wide OpenAI client running on a background event loop."""
+
+    def __init__(
+        self,
+        requests_per_minute=None,
+        concurrency=INITIAL_CONCURRENCY,
+        max_concurrency=MAX_CONCURRENCY,
+        failure_threshold=FAILURE_THRESHOLD,
+        reset_seconds=RESET_SECONDS,
+        max_connections=MAX_CONNECTIONS,
+    ):
+        """Start the event loop thread.
+
+        Args:
+            requests_per_minute: Per-model limits, merged over
+                REQUESTS_PER_MINUTE.
+            concurrency: Requests in flight per model at first.
+            max_concurrency: Most requests in flight per model.
+            failure_threshold: Failures in a row that open a circuit.
+            reset_seconds: Seconds a circuit stays open before a trial.
+            max_connections: Size of the shared HTTP connection pool.
+        """
+        self.requests_per_minute = {
+            **REQUESTS_PER_MINUTE,
+            **(requests_per_minute or {}),
+        }
+        self.concurrency = concurrency
+        self.max_concurrency = max_concurrency
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.max_connections = max_connections
+        self._client = None
+        self._models = {}
+        # Flight key -> _Flight of requests in progress
+        self._flights = {}
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(
+            target=self._loop.run_forever, name="llm-client", daemon=True
+        ).start()
+
+    def complete(
+        self, *, model, messages, stream=False, on_delta=None, timeout=TIMEOUT, **params
+    ):
+        """Send a chat completion request and wait for the reply.
+
+        Args:
+            model: Model name.
+            messages: Chat messages.
+            stream: Stream the reply, so on_delta receives it as it arrives.
+            on_delta: Called on the calling thread with each new piece of
+                text; with ``stream=False`` it gets the whole text at once.
+            timeout: Seconds to wait in total, queueing included.
+            **params: Other ``chat.completions.create`` parameters.
+
+        Returns:
+            A Completion.
+
+        Raises:
+            CircuitOpen: If the model's circuit is open.
+            TimeoutError: If no reply arrived within timeout.
+            openai.OpenAIError: If the request failed.
+        """
+        request = {"model": model, "messages": messages, **params}
+        pieces = queue.SimpleQueue() if on_delta is not None else None
+        deadline = time.monotonic() + timeout
+        future = asyncio.run_coroutine_threadsafe(
+            self._join(request, stream, pieces, timeout), self._loop
+        )
+        try:
+            if pieces is not None:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    try:
+                        piece = pieces.get(timeout=max(0.0, remaining))
+                    except queue.Empty:
+                        raise TimeoutError(f"No reply within {timeout}s") from None
+                    if piece is _FINISHED:
+                        break
+                    on_delta(piece)
+            # Once the last piece has arrived the reply is moments away
+            wait = None if pieces is not None else deadline - time.monotonic()
+            try:
+                return future.result(None if wait is None else max(0.0, wait))
+            except concurrent.futures.TimeoutError:
+                raise TimeoutError(f"No reply within {timeout}s") from None
+        except BaseException:
+            # Stop listening; the request itself is cancelled once nobody waits
+            future.cancel()
+            raise
+
+    def stats(self):
+        """Return per-model request counters, limits and circuit state."""
+        return asyncio.run_coroutine_threadsafe(self._stats(), self._loop).result()
+
+    async def _stats(self):
+        now = time.monotonic()
+        return {
+            model: {
+                **state.counts,
+                "in_flight": state.in_flight,
+                "limit": state.limit,
+                "circuit": (
+                    "closed"
+                    if state.open_until is None
+                    else "open" if now < state.open_until else "half-open"
+                ),
+            }
+            for model, state in self._models.items()
+        }
+
+    async def _join(self, request, stream, pieces, timeout):
+        key = _flight_key(request)
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.ensure_future(
+                self._fly(key, flight, request, stream, timeout)
+            )
+        else:
+            self._state(request["model"]).counts["shared"] += 1
+        flight.listen(pieces)
+        try:
+            completion = await asyncio.shield(flight.task)
+        finally:
+            flight.leave(pieces)
+            if not flight.listeners and not flight.task.done():
+                flight.task.cancel()
+        return completion._replace(shared=True) if shared else completion
+
+    async def _fly(self, key, flight, request, stream, timeout):
+        state = self._state(request["model"])
+        try:
+            await self._acquire(state, time.monotonic() + timeout)
+            try:
+                completion = await self._send(flight, request, stream, timeout)
+            except BaseException as e:
+                self._release(state, e)
+                raise
+            self._release(state, None)
+            return completion
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.finish()
+
+    async def _acquire(self, state, deadline):
+        """Wait for a concurrency slot and a rate limit token."""
+        if state.open_until is not None:
+            if time.monotonic() < state.open_until or state.probing:
+                state.counts["rejected"] += 1
+                raise CircuitOpen("OpenAI is failing; not sending requests for now")
+            # Half-open: this request is the trial
+            state.probing = True
+        try:
+            while state.in_flight >= state.limit:
+                waiter = asyncio.get_running_loop().create_future()
+                state.waiters.append(waiter)
+                try:
+                    await asyncio.wait_for(
+                        waiter, max(0.0, deadline - time.monotonic())
+                    )
+                except asyncio.TimeoutError:
+                    state.counts["throttled"] += 1
+                    raise TimeoutError("Timed out waiting for a request slot") from None
+                finally:
+                    state.waiters.remove(waiter)
+            state.in_flight += 1
+            try:
+                while not _take_token(state):
+                    wait = (1 - state.tokens) / state.rate
+                    if time.monotonic() + wait > deadline:
+                        state.counts["throttled"] += 1
+                        raise TimeoutError("Timed out waiting for the rate limit")
+                    await asyncio.sleep(wait)
+            except BaseException:
+                _free_slot(state)
+                raise
+        except BaseException:
+            state.probing = False
+            raise
+
+    def _release(self, state, error):
+        """Adjust state's limits and circuit to how a request ended."""
+        _free_slot(state)
+        probing, state.probing = state.probing, False
+        if isinstance(error, asyncio.CancelledError):
+            # Nobody was waiting for it any more; says nothing about OpenAI
+            return
+        state.counts["requests"] += 1
+        openai = _openai()
+        overloaded = isinstance(
+            error,
+            (
+                TimeoutError,
+                asyncio.TimeoutError,
+                openai.RateLimitError,
+                openai.APITimeoutError,
+                openai.APIConnectionError,
+                openai.InternalServerError,
+            ),
+        )
+        if error is not None:
+            state.counts["failed"] += 1
+        if overloaded:
+            if isinstance(error, openai.RateLimitError):
+                state.counts["rate_limited"] += 1
+            state.limit = max(1, state.limit // 2)
+            state.successes = 0
+            state.failures += 1
+            if probing or state.failures >= self.failure_threshold:
+                state.open_until = time.monotonic() + self.reset_seconds
+                state.counts["circuit_opened"] += 1
+            return
+        # Errors such as a bad request still show the service is up, but only
+        # a success shows it can take more
+        state.failures = 0
+        state.open_until = None
+        if error is not None:
+            return
+        state.successes += 1
+        if state.successes >= state.limit and state.limit < state.max_limit:
+            state.limit += 1
+            state.successes = 0
+
+    async def _send(self, flight, request, stream, timeout):
+        client = self._get_client()
+        if not stream:
+            response = await client.chat.completions.create(timeout=timeout, **request)
+            text = response.choices[0].message.content or ""
+            flight.publish(text)
+            return Completion(text, response.usage, None, False)
+
+        started = time.perf_counter()
+        first_token_ms = None
+        usage = None
+        # With include_usage the last chunk carries the token counts
+        response = await client.chat.completions.create(
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=timeout,
+            **request,
+        )
+        async for chunk in response:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first_token_ms is None:
+                    first_token_ms = round((time.perf_counter() - started) * 1000, 2)
+                flight.publish(chunk.choices[0].delta.content)
+        return Completion(flight.text(), usage, first_token_ms, False)
+
+    def _get_client(self):
+        if self._client is None:
+            openai = _openai()
+            import httpx
+
+            self._client = openai.AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                # Failed requests are retried by the job queue, with backoff
+                max_retries=0,
+                http_client=openai.DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections,
+                    )
+                ),
+            )
+        return self._client
+
+    def _state(self, model):
+        state = self._models.get(model)
+        if state is None:
+            rpm = self.requests_per_minute.get(model, DEFAULT_REQUESTS_PER_MINUTE)
+            state = self._models[model] = _ModelState(
+                rpm, self.concurrency, self.max_concurrency
+            )
+        return state
+
+
+class _Flight:
+    """One request in progress and the callers waiting for it."""
+
+    def __init__(self):
+        self.task = None
+        self.pieces = []
+        # Queues of callers that want the text as it arrives, or None
+        self.listeners = []
+
+    def text(self):
+        return "".join(self.pieces)
+
+    def listen(self, pieces):
+        if pieces is not None and self.pieces:
+            # Catch up on what was streamed before this caller joined
+            pieces.put(self.text())
+        self.listeners.append(pieces)
+
+    def leave(self, pieces):
+        self.listeners.remove(pieces)
+
+    def publish(self, piece):
+        self.pieces.append(piece)
+        for pieces in self.listeners:
+            if pieces is not None:
+                pieces.put(piece)
+
+    def finish(self):
+        for pieces in self.listeners:
+            if pieces is not None:
+                pieces.put(_FINISHED)
+
+
+def _take_token(state):
+    """Take a rate limit token from state's bucket if one is available."""
+    now = time.monotonic()
+    state.tokens = min(
+        state.capacity, state.tokens + (now - state.refilled_at) * state.rate
+    )
+    state.refilled_at = now
+    if state.tokens < 1:
+        return False
+    state.tokens -= 1
+    return True
+
+
+def _free_slot(state):
+    """Give back a concurrency slot and wake the requests waiting for one."""
+    state.in_flight -= 1
+    for waiter in state.waiters:
+        if not waiter.done():
+            waiter.set_result(None)
+
+
+def _flight_key(request):
+    """Identify a request by its model, messages and parameters."""
+    material = json.dumps(request, sort_keys=True, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _openai():
+    import openai
+
+    return openai
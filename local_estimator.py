@@ -0,0 +1,241 @@
+"""Offline macro estimation from a bundled food-composition table.
+
+Descriptions such as "2 rotis with dal" or "150g paneer and 1 bowl rice" are
+split into items, each item is parsed into quantity, unit and food, and macros
+are computed from per-100g values. Items that can't be parsed are handed back
+so only those need to go to the LLM.
+"""
+
+import re
+
+from estimate_cache import normalize_description, UNITS
+
+# Per-100g protein, carbs and fat for common foods, with the grams in one of
+# each unit the food is usually measured in. The first unit is the default
+# when a description gives a count without a unit ("2 roti").
+FOODS = {
+    "roti": {"per_100g": (8.0, 46.0, 4.0), "units": {"piece": 40}},
+    "paratha": {"per_100g": (6.4, 45.0, 13.0), "units": {"piece": 80}},
+    "naan": {"per_100g": (8.7, 50.0, 5.1), "units": {"piece": 90}},
+    "bread": {"per_100g": (9.0, 49.0, 3.2), "units": {"slice": 25}},
+    "rice": {
+        "per_100g": (2.7, 28.0, 0.3),
+        "units": {"bowl": 150, "cup": 160, "plate": 250},
+    },
+    "brown rice": {
+        "per_100g": (2.6, 23.0, 0.9),
+        "units": {"bowl": 150, "cup": 160, "plate": 250},
+    },
+    "dal": {"per_100g": (6.8, 17.0, 3.0), "units": {"bowl": 200, "cup": 200}},
+    "rajma": {"per_100g": (8.7, 22.8, 0.5), "units": {"bowl": 200, "cup": 200}},
+    "chole": {"per_100g": (8.9, 27.0, 2.6), "units": {"bowl": 200, "cup": 200}},
+    "sprout": {"per_100g": (3.0, 6.0, 0.2), "units": {"bowl": 100, "cup": 100}},
+    "soya chunk": {"per_100g": (52.0, 33.0, 0.5), "units": {"cup": 50, "bowl": 50}},
+    "paneer": {
+        "per_100g": (18.0, 3.6, 20.0),
+        "units": {"piece": 25, "cup": 150, "bowl": 150},
+    },
+    "tofu": {"per_100g": (8.0, 1.9, 4.8), "units": {"piece": 85, "cup": 250}},
+    "egg": {"per_100g": (13.0, 1.1, 11.0), "units": {"piece": 50}},
+    "egg white": {"per_100g": (11.0, 0.7, 0.2), "units": {"piece": 33}},
+    "chicken": {
+        "per_100g": (27.0, 0.0, 7.7),
+        "units": {"piece": 120, "bowl": 200, "plate": 250},
+    },
+    "chicken breast": {"per_100g": (31.0, 0.0, 3.6), "units": {"piece": 120}},
+    "fish": {"per_100g": (22.0, 0.0, 5.0), "units": {"piece": 100}},
+    "whey": {"per_100g": (80.0, 10.0, 5.0), "units": {"scoop": 30}},
+    "milk": {"per_100g": (3.3, 4.8, 3.0), "units": {"glass": 250, "cup": 240}},
+    "curd": {
+        "per_100g": (3.5, 4.7, 3.3),
+        "units": {"bowl": 150, "cup": 245, "glass": 250},
+    },
+    "greek yogurt": {"per_100g": (10.0, 3.6, 0.4), "units": {"cup": 200}},
+    "oat": {"per_100g": (13.0, 68.0, 6.5), "units": {"cup": 80, "bowl": 40}},
+    "idli": {"per_100g": (4.0, 20.0, 0.4), "units": {"piece": 40}},
+    "dosa": {"per_100g": (4.0, 29.0, 3.7), "units": {"piece": 100}},
+    "poha": {"per_100g": (2.5, 23.0, 3.0), "units": {"plate": 200, "bowl": 200}},
+    "upma": {"per_100g": (3.0, 19.0, 4.0), "units": {"plate": 200, "bowl": 200}},
+    "sabzi": {"per_100g": (2.0, 8.0, 5.0), "units": {"bowl": 150}},
+    "salad": {"per_100g": (0.8, 4.0, 0.2), "units": {"bowl": 100, "plate": 150}},
+    "banana": {"per_100g": (1.1, 23.0, 0.3), "units": {"piece": 118}},
+    "apple": {"per_100g": (0.3, 14.0, 0.2), "units": {"piece": 182}},
+    "peanut butter": {"per_100g": (25.0, 20.0, 50.0), "units": {"tbsp": 16}},
+    "almond": {"per_100g": (21.0, 22.0, 50.0), "units": {"piece": 1.2}},
+    "ghee": {"per_100g": (0.0, 0.0, 100.0), "units": {"tsp": 5, "tbsp": 14}},
+}
+
+# Alternative names, already in normalized (lowercase, singular) form
+ALIASES = {
+    "chapati": "roti",
+    "chapathi": "roti",
+    "phulka": "roti",
+    "chawal": "rice",
+    "dahl": "dal",
+    "daal": "dal",
+    "chana": "chole",
+    "chickpea": "chole",
+    "kidney bean": "rajma",
+    "dahi": "curd",
+    "yogurt": "curd",
+    "yoghurt": "curd",
+    "whey protein": "whey",
+    "protein shake": "whey",
+    "oatmeal": "oat",
+    "anda": "egg",
+    "cucumber salad": "salad",
+    "green salad": "salad",
+    "sprout salad": "sprout",
+    "soya": "soya chunk",
+    "vegetable": "sabzi",
+    "curry": "sabzi",
+}
+
+# Leading words that don't change the food's macros much
+MODIFIERS = {
+    "boiled",
+    "grilled",
+    "roasted",
+    "steamed",
+    "cooked",
+    "plain",
+    "scrambled",
+    "poached",
+    "fresh",
+    "homemade",
+    "home",
+    "made",
+    "whole",
+    "toned",
+    "wheat",
+    "moong",
+    "masoor",
+    "toor",
+    "yellow",
+    "tandoori",
+    "mixed",
+    "large",
+    "medium",
+    "small",
+}
+
+# Units that measure weight or volume directly (ml is treated as grams)
+GRAMS_PER_UNIT = {"g": 1, "kg": 1000, "ml": 1, "l": 1000}
+
+_SEPARATOR_RE = re.compile(r",|;|\+|&|\n|\band\b|\bwith\b|\bplus\b", re.IGNORECASE)
+_QUANTITY_RE = re.compile(r"^(\d+(?:\.\d+)?)([a-z]*)$")
+
+
+def _lookup_food(words):
+    """Return the table key for a list of normalized words, or None."""
+    while words:
+        name = " ".join(words)
+        name = ALIASES.get(name, name)
+        if name in FOODS:
+            return name
+        if words[0] not in MODIFIERS:
+            return None
+        words = words[1:]
+    return None
+
+
+def parse_item(item):
+    """Parse one item such as "150g paneer" or "a bowl of dal".
+
+    Args:
+        item: A single food item from a meal description.
+
+    Returns:
+        ``(quantity, unit, food, grams)`` or None if the item isn't understood.
+    """
+    words = normalize_description(item).split()
+    if not words:
+        return None
+
+    quantity, unit = 1.0, None
+    match = _QUANTITY_RE.match(words[0])
+    if match:
+        quantity = float(match.group(1))
+        unit = match.group(2) or None
+        words = words[1:]
+    elif words[0] in ("a", "an"):
+        words = words[1:]
+    if unit is None and words and words[0] in UNITS:
+        unit = words[0]
+        words = words[1:]
+    if words and words[0] == "of":
+        words = words[1:]
+
+    food = _lookup_food(words)
+    if food is None:
+        return None
+    units = FOODS[food]["units"]
+    if unit is None:
+        unit = next(iter(units))
+    if unit in GRAMS_PER_UNIT:
+        grams = quantity * GRAMS_PER_UNIT[unit]
+    elif unit in units:
+        grams = quantity * units[unit]
+    else:
+        return None
+    return quantity, unit, food, grams
+
+
+def _format_quantity(quantity, unit, food, grams):
+    if unit in GRAMS_PER_UNIT:
+        return f"{quantity:g}{unit} {food}"
+    if unit == "piece":
+        return f"{quantity:g} {food} (~{grams:g}g)"
+    return f"{quantity:g} {unit} {food} (~{grams:g}g)"
+
+
+def estimate_locally(description):
+    """Estimate as much of a meal description as possible from the food table.
+
+    Args:
+        description: Free-text meal description.
+
+    Returns:
+        ``(result, unparsed)`` where result has the same shape as
+        estimate_macros() output for the understood items (None if none were)
+        and unparsed lists the items that still need estimating elsewhere.
+    """
+    totals = [0.0, 0.0, 0.0]
+    understood = []
+    unparsed = []
+    for item in _SEPARATOR_RE.split(description):
+        if not item.strip():
+            continue
+        parsed = parse_item(item)
+        if parsed is None:
+            unparsed.append(item.strip())
+            continue
+        quantity, unit, food, grams = parsed
+        for i, per_100g in enumerate(FOODS[food]["per_100g"]):
+            totals[i] += per_100g * grams / 100
+        understood.append(_format_quantity(quantity, unit, food, grams))
+
+    if not understood:
+        return None, unparsed
+    result = {
+        "interpretation": "Estimated from the built-in food table: "
+        + ", ".join(understood)
+        + ".",
+        "macros": {
+            "protein": round(totals[0], 1),
+            "carbs": round(totals[1], 1),
+            "fat": round(totals[2], 1),
+        },
+    }
+    return result, unparsed
+
+
+def merge_estimates(first, second):
+    """Combine two estimate results for different parts of the same meal."""
+    return {
+        "interpretation": f"{first['interpretation']} {second['interpretation']}",
+        "macros": {
+            macro: round(first["macros"][macro] + second["macros"][macro], 1)
+            for macro in ("protein", "carbs", "fat")
+        },
+    }
@@ -0,0 +1,527 @@
+"""Compressed monthly segments holding meals too old to keep in meals.json.
+
+A ``MealJournal`` keeps only recent months in its snapshot. Whole months that
+fall out of its window are moved here, one immutable file per month in the
+``archive`` folder (``meals-YYYY-MM.seg``). A segment starts with a small
+header index, followed by one zlib-compressed JSON block per day:
+
+- 8 bytes ``TEMPOSEG`` and the header length as a little-endian uint32
+- the header as JSON: meal count, first and last day and timestamp, for
+  each day its protein/carbs/fat/meal totals and where its block starts, and
+  where the summary block starts
+- the day blocks, each a JSON list of meals in the ``meal_schema.json`` shape
+  sorted by time
+- the summary block: for each distinct description (as normalized by
+  ``normalize_description``) how many meals had it and the latest of them, so
+  meal search can cover the month without decoding its days
+
+A segment is memory-mapped the first time it is needed, and its header and
+day blocks are all read through that one mapping. Totals come straight from
+the header, a few kilobytes per month, so only its pages are read in. Meals
+are only decoded for the days asked for, so paging back through History
+touches a block or two rather than the whole month.
+
+Segments are never edited in place. Changing an archived month (importing
+old meals, deleting one) writes a new file and renames it over the old one,
+so a reader holding the previous mapping keeps a consistent view. Writers
+must hold the journal's exclusive lock, and ``MealJournal`` reads under the
+shared one. The folder's mtime tells readers when to look for new or
+replaced segments.
+"""
+
+import collections
+import json
+import mmap
+import os
+import re
+import struct
+import zlib
+
+from estimate_cache import normalize_description
+from fileio import atomic_write_bytes
+from meal_store import add_to_rollups, empty_totals, MealRecord
+
+ARCHIVE_DIR = "archive"
+SEGMENT_FORMAT = "meals-{month}.seg"
+SEGMENT_PATTERN = re.compile(r"meals-(\d{4}-\d{2})\.seg$")
+# Suffix of segments written by stage() and not yet published
+STAGED_SUFFIX = ".staged"
+MAGIC = b"TEMPOSEG"
+VERSION = 2
+# Version 1 segments have no summary block; it is built from their days
+READ_VERSIONS = (1, 2)
+# zlib level for day blocks; segments are written rarely and read often
+COMPRESSION = 6
+# Decoded day blocks kept in memory, about two months' worth
+DAY_CACHE = 62
+
+_PREFIX = struct.Struct("<8sI")
+
+
+class CorruptSegment(Exception):
+    """A segment file doesn't have the expected layout."""
+
+
+class _Segment:
+    """One segment file, mapped on first use.
+
+    The header and the day blocks are read through the same mapping, so they
+    always come from the same version of the file even if it is replaced
+    in the meantime.
+    """
+
+    __slots__ = ("path", "token", "_header", "_body_start", "_map")
+
+    def __init__(self, path, token):
+        self.path = path
+        # (inode, size, mtime) of the listed file, then of the mapped one
+        self.token = token
+        self._header = None
+        self._body_start = None
+        self._map = None
+
+    @property
+    def header(self):
+        if self._header is None:
+            self._open()
+        return self._header
+
+    def read_day(self, day):
+        """Return the meals of day as MealRecords in time order."""
+        entry = self.header["days"].get(day)
+        if entry is None:
+            return []
+        start = self._body_start + entry["offset"]
+        block = zlib.decompress(self._map[start : start + entry["length"]])
+        return [MealRecord.from_dict(meal) for meal in json.loads(block)]
+
+    def read_summary(self):
+        """Return ``{normalized description: [count, latest MealRecord]}``."""
+        entry = self.header.get("summary")
+        if entry is None:
+            meals = []
+            for day in sorted(self.header["days"]):
+                meals.extend(self.read_day(day))
+            return _summarize(meals)
+        start = self._body_start + entry["offset"]
+        block = zlib.decompress(self._map[start : start + entry["length"]])
+        return {
+            key: [count, MealRecord.from_dict(meal)]
+            for key, count, meal in json.loads(block)
+        }
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def _open(self):
+        with open(self.path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_size < _PREFIX.size:
+                raise CorruptSegment(f"{self.path} is truncated")
+            segment_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, length = _PREFIX.unpack_from(segment_map)
+            if magic != MAGIC:
+                raise CorruptSegment(f"{self.path} is not a meal segment")
+            body_start = _PREFIX.size + length
+            header = json.loads(segment_map[_PREFIX.size : body_start])
+            if header.get("version") not in READ_VERSIONS:
+                raise CorruptSegment(
+                    f"{self.path} has unsupported version {header.get('version')}"
+                )
+        except BaseException:
+            segment_map.close()
+            raise
+        # Replaced since it was listed: describe the version actually mapped
+        self.token = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        self._map = segment_map
+        self._body_start = body_start
+        self._header = header
+
+
+class MealArchive:
+    """The archived months of one data folder.
+
+    Not thread-safe on its own; ``MealJournal`` calls it under its lock.
+    """
+
+    def __init__(self, directory):
+        """Create an archive for the data folder directory.
+
+        Args:
+            directory: Folder holding meals.json; segments live in its
+                ``archive`` subfolder, created when the first one is written.
+        """
+        self.path = os.path.join(directory, ARCHIVE_DIR)
+        # Day blocks decoded vs. served from memory
+        self.block_reads = 0
+        self.block_hits = 0
+        # month -> _Segment, and the folder [mtime, inode] they reflect
+        self._segments = {}
+        self._seen = None
+        # (segment token, day) -> MealRecords, least recently used first
+        self._days = collections.OrderedDict()
+
+    def months(self):
+        """Return the archived months as YYYY-MM strings, oldest first."""
+        self._refresh()
+        return sorted(self._segments)
+
+    def newest_day(self):
+        """Return the last day with archived meals, or None if there are none."""
+        months = self.months()
+        return self._segments[months[-1]].header["last_day"] if months else None
+
+    def count(self):
+        """Return the number of archived meals."""
+        self._refresh()
+        return sum(segment.header["count"] for segment in self._segments.values())
+
+    def daily_totals(self, start_day=None, end_day=None):
+        """Return ``{day: rollup}`` for archived days in start_day..end_day.
+
+        Only segment headers are read. Either bound may be None for open.
+        """
+        totals = {}
+        for segment in self._overlapping(start_day, end_day):
+            for day, entry in segment.header["days"].items():
+                if (start_day is None or day >= start_day) and (
+                    end_day is None or day <= end_day
+                ):
+                    totals[day] = {key: entry[key] for key in empty_totals()}
+        return totals
+
+    def meals_between(self, start_day, end_day):
+        """Return archived meals whose local date is within start_day..end_day."""
+        meals = []
+        for segment in self._overlapping(start_day, end_day):
+            for day in sorted(segment.header["days"]):
+                if start_day <= day <= end_day:
+                    meals.extend(self._read_day(segment, day))
+        return meals
+
+    def records(self):
+        """Return every archived meal, oldest month first."""
+        meals = []
+        for segment in self._overlapping(None, None):
+            meals.extend(self._read_month(segment))
+        return meals
+
+    def summaries(self):
+        """Return a (latest MealRecord, count) pair per distinct description.
+
+        Only each segment's summary block is read, not its days. Descriptions
+        are told apart after ``normalize_description``.
+        """
+        merged = {}
+        for segment in self._overlapping(None, None):
+            for key, (count, latest) in segment.read_summary().items():
+                seen = merged.get(key)
+                if seen is None:
+                    merged[key] = [count, latest]
+                    continue
+                seen[0] += count
+                if (latest.epoch, latest.id) > (seen[1].epoch, seen[1].id):
+                    seen[1] = latest
+        return [(latest, count) for count, latest in merged.values()]
+
+    def page(self, limit, before=None, exclude=()):
+        """Return up to limit archived meals newest first.
+
+        Args:
+            limit: Maximum number of meals.
+            before: MealRecord to continue after (only older meals are
+                returned), or None to start at the newest.
+            exclude: Meal ids to skip, such as those also in meals.json.
+        """
+        key = None if before is None else (before.epoch, before.id)
+        meals = []
+        for segment in reversed(list(self._overlapping(None, None))):
+            for day in sorted(segment.header["days"], reverse=True):
+                if before is not None and day > before.day:
+                    continue
+                for meal in reversed(self._read_day(segment, day)):
+                    if key is not None and (meal.epoch, meal.id) >= key:
+                        continue
+                    if meal.id in exclude:
+                        continue
+                    meals.append(meal)
+                    if len(meals) == limit:
+                        return meals
+        return meals
+
+    def add(self, records):
+        """Merge records into their months' segments, replacing equal ids.
+
+        Args:
+            records: MealRecords, all from months that belong in the archive.
+        """
+        for month, meals in _by_month(records).items():
+            segment = self._segments_now().get(month)
+            merged = {}
+            if segment is not None:
+                merged = {meal.id: meal for meal in self._read_month(segment)}
+            merged.update((meal.id, meal) for meal in meals)
+            self._write(month, list(merged.values()))
+
+    def stage(self, records):
+        """Merge records into staged copies of their months' segments.
+
+        Readers don't see staged segments until commit_staged() renames them
+        over the live ones, so a bulk import can be written a batch at a time
+        and published only once all of it has been read.
+
+        Args:
+            records: MealRecords, all from months that belong in the archive.
+        """
+        for month, meals in _by_month(records).items():
+            staged = self._path(month) + STAGED_SUFFIX
+            merged = {}
+            if os.path.exists(staged):
+                segment = _Segment(staged, None)
+                merged = {meal.id: meal for meal in self._read_month(segment)}
+                segment.close()
+            else:
+                segment = self._segments_now().get(month)
+                if segment is not None:
+                    merged = {meal.id: meal for meal in self._read_month(segment)}
+            merged.update((meal.id, meal) for meal in meals)
+            self._write(month, list(merged.values()), staged)
+
+    def commit_staged(self):
+        """Publish every staged segment in place of its live one."""
+        for path in self._staged():
+            os.replace(path, path[: -len(STAGED_SUFFIX)])
+
+    def discard_staged(self):
+        """Remove staged segments, such as those left by an interrupted import."""
+        for path in self._staged():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def replace(self, records):
+        """Make records the whole archive, removing segments of other months."""
+        months = _by_month(records)
+        for month in self._segments_now():
+            if month not in months:
+                self._write(month, [])
+        for month, meals in months.items():
+            self._write(month, meals)
+
+    def delete(self, meal_id, day=None):
+        """Remove an archived meal by rewriting its month.
+
+        Args:
+            meal_id: Meal to remove.
+            day: Its local day if known, so only that day is searched;
+                otherwise every segment is read until it is found.
+
+        Returns:
+            Whether the meal was found.
+        """
+        segments = self._segments_now()
+        if day is not None:
+            candidates = [day[:7]] if day[:7] in segments else []
+        else:
+            candidates = sorted(segments, reverse=True)
+        for month in candidates:
+            segment = segments[month]
+            if day is not None and not any(
+                meal.id == meal_id for meal in self._read_day(segment, day)
+            ):
+                continue
+            meals = self._read_month(segment)
+            kept = [meal for meal in meals if meal.id != meal_id]
+            if len(kept) < len(meals):
+                self._write(month, kept)
+                return True
+        return False
+
+    def stats(self):
+        """Return segment and decoded-day counts."""
+        self._refresh()
+        return {
+            "segments": len(self._segments),
+            "block_reads": self.block_reads,
+            "block_hits": self.block_hits,
+        }
+
+    def _overlapping(self, start_day, end_day):
+        """Yield segments of months that may hold days in start_day..end_day."""
+        self._refresh()
+        for month in sorted(self._segments):
+            if start_day is not None and month < start_day[:7]:
+                continue
+            if end_day is not None and month > end_day[:7]:
+                continue
+            yield self._segments[month]
+
+    def _segments_now(self):
+        # Writers re-list the folder even if its mtime looks unchanged
+        self._seen = None
+        self._refresh()
+        return self._segments
+
+    def _refresh(self):
+        """Pick up segments written, replaced or removed by any process."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._close(self._segments.values())
+            self._segments = {}
+            self._seen = None
+            return
+        seen = [stat.st_mtime_ns, stat.st_ino]
+        if seen == self._seen:
+            return
+        segments = {}
+        for entry in os.scandir(self.path):
+            match = SEGMENT_PATTERN.match(entry.name)
+            if match is None:
+                continue
+            file_stat = entry.stat()
+            token = (file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns)
+            segment = self._segments.get(match.group(1))
+            if segment is None or segment.token != token:
+                segment = _Segment(entry.path, token)
+            segments[match.group(1)] = segment
+        self._close(
+            segment
+            for month, segment in self._segments.items()
+            if segments.get(month) is not segment
+        )
+        self._segments = segments
+        self._seen = seen
+
+    def _read_day(self, segment, day):
+        key = (segment.token, day)
+        meals = self._days.get(key)
+        if meals is not None:
+            self._days.move_to_end(key)
+            self.block_hits += 1
+            return meals
+        meals = segment.read_day(day)
+        self.block_reads += 1
+        self._days[key] = meals
+        if len(self._days) > DAY_CACHE:
+            self._days.popitem(last=False)
+        return meals
+
+    def _read_month(self, segment):
+        # Whole months are read for rewrites and exports, so bypass the cache
+        meals = []
+        for day in sorted(segment.header["days"]):
+            meals.extend(segment.read_day(day))
+            self.block_reads += 1
+        return meals
+
+    def _path(self, month):
+        return os.path.join(self.path, SEGMENT_FORMAT.format(month=month))
+
+    def _staged(self):
+        try:
+            entries = list(os.scandir(self.path))
+        except FileNotFoundError:
+            return []
+        return [
+            entry.path
+            for entry in entries
+            if entry.name.endswith(STAGED_SUFFIX)
+            and SEGMENT_PATTERN.match(entry.name[: -len(STAGED_SUFFIX)])
+        ]
+
+    def _write(self, month, meals, path=None):
+        """Write month's segment from meals, or remove it if there are none.
+
+        Args:
+            month: Month (YYYY-MM) the meals belong to.
+            meals: MealRecords to write.
+            path: File to write instead of the live segment.
+        """
+        path = path or self._path(month)
+        if not meals:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return
+        os.makedirs(self.path, exist_ok=True)
+        meals = sorted(meals, key=lambda meal: (meal.epoch, meal.id))
+        days = {}
+        for meal in meals:
+            days.setdefault(meal.day, []).append(meal)
+        index = {}
+        blocks = []
+        offset = 0
+        for day in sorted(days):
+            block = zlib.compress(
+                json.dumps(
+                    [meal.to_dict() for meal in days[day]], separators=(",", ":")
+                ).encode("utf-8"),
+                COMPRESSION,
+            )
+            totals = {}
+            for meal in days[day]:
+                add_to_rollups(totals, meal)
+            index[day] = {**totals[day], "offset": offset, "length": len(block)}
+            blocks.append(block)
+            offset += len(block)
+        summary = zlib.compress(
+            json.dumps(
+                [
+                    [key, count, latest.to_dict()]
+                    for key, (count, latest) in _summarize(meals).items()
+                ],
+                separators=(",", ":"),
+            ).encode("utf-8"),
+            COMPRESSION,
+        )
+        blocks.append(summary)
+        header = json.dumps(
+            {
+                "version": VERSION,
+                "month": month,
+                "count": len(meals),
+                "first_day": min(index),
+                "last_day": max(index),
+                "first": meals[0].timestamp,
+                "last": meals[-1].timestamp,
+                "days": index,
+                "summary": {"offset": offset, "length": len(summary)},
+            },
+            separators=(",", ":"),
+        ).encode("utf-8")
+        atomic_write_bytes(
+            path, b"".join([_PREFIX.pack(MAGIC, len(header)), header, *blocks])
+        )
+
+    @staticmethod
+    def _close(segments):
+        for segment in segments:
+            segment.close()
+
+
+def _summarize(meals):
+    """Group meals by normalized description into [count, latest meal] pairs."""
+    summary = {}
+    for meal in meals:
+        key = normalize_description(meal.description)
+        seen = summary.get(key)
+        if seen is None:
+            summary[key] = [1, meal]
+            continue
+        seen[0] += 1
+        if (meal.epoch, meal.id) > (seen[1].epoch, seen[1].id):
+            seen[1] = meal
+    return summary
+
+
+def _by_month(records):
+    months = {}
+    for meal in records:
+        months.setdefault(meal.day[:7], []).append(meal)
+    return months
@@ -0,0 +1,316 @@
+"""In-memory similar-meal index over past meal descriptions.
+
+Descriptions are normalized with the same rules as the estimate cache and
+stop words are dropped, so "two rotis with dal" and "2 roti dal" become the
+same entry. Each distinct description is indexed under its words and the
+character trigrams of those words in an inverted index. A query (even a
+partial word or a typo) finds the entries sharing the most rare features,
+ranked by a weighted overlap score.
+
+Only distinct descriptions are indexed, so a history of 100k meals that repeats
+the same few hundred dishes is still a small index: beyond its entry, a meal
+costs just its id and time. Meals are added and removed one at a time as they
+are saved or deleted. Archived months come in as a summary instead, the latest
+meal of each description and how many there were, read once on a background
+thread started by ``preload()`` or the first search. Searches never wait for
+it; until it is in they only cover the recent meals.
+"""
+
+import heapq
+import math
+import threading
+
+from estimate_cache import normalize_description
+
+# Words that don't tell meals apart
+STOP_WORDS = {"a", "an", "and", "with", "of", "the", "some", "plus", "in", "on"}
+
+# Features whose posting lists are scanned in full; more common features only
+# add weight to candidates already found
+MAX_CANDIDATES = 2000
+# Candidates rescored exactly after the first pass
+RESCORE = 50
+
+
+def meal_features(text):
+    """Return the set of index features for a description.
+
+    Args:
+        text: Meal description, normalized or not.
+
+    Returns:
+        Words (minus stop words) prefixed with ``w:`` and their padded
+        character trigrams prefixed with ``t:``.
+    """
+    return _features(normalize_description(text))
+
+
+def _entry_key(normalized):
+    """Return the normalized description without stop words, if any remain."""
+    words = [word for word in normalized.split() if word not in STOP_WORDS]
+    return " ".join(words) or normalized
+
+
+def _features(normalized):
+    features = set()
+    for word in normalized.split():
+        if word in STOP_WORDS:
+            continue
+        features.add("w:" + word)
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            features.add("t:" + padded[i : i + 3])
+    return features
+
+
+class _Entry:
+    """One distinct normalized description and the meals logged with it.
+
+    Each meal is kept as its time and a look (description, macros,
+    interpretation) shared with the meals that look the same, so an entry
+    stays small however often its dish was logged. Meals known only from an
+    archive summary are just counted.
+    """
+
+    __slots__ = ("key", "features", "meals", "looks", "latest", "others")
+
+    def __init__(self, key, features):
+        self.key = key
+        self.features = features
+        # meal id -> (epoch, look) for every logged meal with this description
+        self.meals = {}
+        # look -> the same tuple, so meals that look alike share one copy
+        self.looks = {}
+        # (epoch, look) of the most recently eaten of those meals
+        self.latest = None
+        # Archived meals counted by a summary but not kept in meals
+        self.others = 0
+
+    @property
+    def count(self):
+        return len(self.meals) + self.others
+
+    def add(self, meal, others=0):
+        look = (
+            meal.description,
+            (meal.protein, meal.carbs, meal.fat),
+            meal.interpretation,
+        )
+        look = self.looks.setdefault(look, look)
+        self.meals[meal.id] = (meal.epoch, look)
+        self.others += others
+        if self.latest is None or meal.epoch >= self.latest[0]:
+            self.latest = (meal.epoch, look)
+
+    def remove(self, meal_id):
+        removed = self.meals.pop(meal_id)
+        if removed == self.latest:
+            self.latest = max(
+                self.meals.values(), key=lambda meal: meal[0], default=None
+            )
+            # Drop looks no meal has any more
+            self.looks = {look: look for _, look in self.meals.values()}
+
+
+class MealIndex:
+    """Inverted index from words and trigrams to distinct past descriptions."""
+
+    def __init__(self, meals=(), load_summaries=None):
+        """Create an index, optionally filled with meals.
+
+        Args:
+            meals: MealRecords to index.
+            load_summaries: Callable returning (latest MealRecord, count)
+                pairs for further meals, one per description, such as
+                ``MealJournal.archived_summaries``. It is called on a
+                background thread, see preload().
+        """
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._entry_ids = {}
+        self._meal_entries = {}
+        self._postings = {}
+        self._next_id = 0
+        self._load_summaries = load_summaries
+        self._loaded = load_summaries is None
+        self._loading = False
+        # Bumped by rebuild so a load started before it is dropped
+        self._generation = 0
+        # Meals removed while the summaries were being read, so they aren't
+        # added back
+        self._removed = set()
+        self._add_all(meals)
+
+    def __len__(self):
+        """Number of distinct descriptions indexed."""
+        return len(self._entries)
+
+    def rebuild(self, meals):
+        """Replace the index contents with meals; summaries are read again."""
+        with self._lock:
+            self._entries.clear()
+            self._entry_ids.clear()
+            self._meal_entries.clear()
+            self._postings.clear()
+            self._add_all(meals)
+            self._generation += 1
+            if self._load_summaries is not None:
+                self._loaded = False
+                self._loading = False
+
+    def preload(self):
+        """Start reading the summaries in the background, if not done yet."""
+        with self._lock:
+            if self._loaded or self._loading:
+                return
+            self._loading = True
+            self._removed.clear()
+            generation = self._generation
+        threading.Thread(
+            target=self._load, args=(generation,), name="meal-index-load", daemon=True
+        ).start()
+
+    def add(self, meal):
+        """Index a newly saved MealRecord."""
+        with self._lock:
+            self._add(meal, {})
+
+    def remove(self, meal_id):
+        """Stop indexing meal_id; does nothing if it isn't indexed."""
+        with self._lock:
+            if not self._loaded:
+                self._removed.add(meal_id)
+            entry_id = self._meal_entries.pop(meal_id, None)
+            if entry_id is None:
+                return
+            entry = self._entries[entry_id]
+            entry.remove(meal_id)
+            if entry.meals:
+                return
+            del self._entries[entry_id]
+            del self._entry_ids[entry.key]
+            for feature in entry.features:
+                postings = self._postings[feature]
+                postings.discard(entry_id)
+                if not postings:
+                    del self._postings[feature]
+
+    def search(self, text, limit=5, min_score=0.3):
+        """Return past meals that look like text, best match first.
+
+        Args:
+            text: What is being typed.
+            limit: Maximum number of matches.
+            min_score: Matches scoring below this (0..1) are left out.
+
+        Returns:
+            Dicts with the most recent meal's ``description``, ``macros`` and
+            ``interpretation`` (if any), plus ``score`` and ``count`` (how
+            many times it was logged). Archived meals are left out until
+            their summaries have been read.
+        """
+        query = meal_features(text)
+        if not query:
+            return []
+        self.preload()
+        with self._lock:
+            total = len(self._entries)
+            if not total:
+                return []
+            weights = {
+                feature: math.log(1 + total / len(self._postings[feature]))
+                for feature in query
+                if feature in self._postings
+            }
+            query_weight = sum(weights.values())
+            if not query_weight:
+                return []
+
+            # Rarest features first: they find the candidates, common ones
+            # only add to candidates already found
+            overlap = {}
+            for feature in sorted(weights, key=lambda f: len(self._postings[f])):
+                postings = self._postings[feature]
+                weight = weights[feature]
+                if not overlap or len(overlap) + len(postings) <= MAX_CANDIDATES:
+                    for entry_id in postings:
+                        overlap[entry_id] = overlap.get(entry_id, 0.0) + weight
+                else:
+                    for entry_id in overlap:
+                        if entry_id in postings:
+                            overlap[entry_id] += weight
+
+            # Rescore the best candidates: the average of how much of the query
+            # they cover and a weighted Jaccard similarity, which penalizes
+            # words the query doesn't have
+            best = heapq.nlargest(RESCORE, overlap, key=overlap.get)
+            matches = []
+            for entry_id in best:
+                entry = self._entries[entry_id]
+                extra = sum(
+                    math.log(1 + total / len(self._postings[feature]))
+                    for feature in entry.features - query
+                )
+                coverage = overlap[entry_id] / query_weight
+                similarity = overlap[entry_id] / (query_weight + extra)
+                score = (coverage + similarity) / 2
+                if score >= min_score:
+                    matches.append((score, entry.count, entry))
+            matches.sort(key=lambda match: (match[0], match[1]), reverse=True)
+
+            results = []
+            for score, count, entry in matches[:limit]:
+                description, (protein, carbs, fat), interpretation = entry.latest[1]
+                result = {
+                    "description": description,
+                    "macros": {"protein": protein, "carbs": carbs, "fat": fat},
+                    "score": round(score, 3),
+                    "count": count,
+                }
+                if interpretation is not None:
+                    result["interpretation"] = interpretation
+                results.append(result)
+            return results
+
+    def _load(self, generation):
+        try:
+            summaries = self._load_summaries()
+        except Exception:
+            # Search still covers the meals given directly
+            summaries = ()
+        with self._lock:
+            if generation != self._generation:
+                # Rebuilt while reading; the next preload() reads them again
+                return
+            keys = {}
+            for latest, count in summaries:
+                if latest.id not in self._removed:
+                    self._add(latest, keys, count - 1)
+            self._removed.clear()
+            self._loading = False
+            self._loaded = True
+
+    def _add_all(self, meals):
+        # Raw description -> normalized key, so repeats are normalized once
+        keys = {}
+        for meal in meals:
+            self._add(meal, keys)
+
+    def _add(self, meal, keys, others=0):
+        if meal.id in self._meal_entries:
+            return
+        description = meal.description
+        key = keys.get(description)
+        if key is None:
+            key = keys[description] = _entry_key(normalize_description(description))
+        entry_id = self._entry_ids.get(key)
+        if entry_id is None:
+            entry_id = self._next_id
+            self._next_id += 1
+            entry = _Entry(key, frozenset(_features(key)))
+            self._entries[entry_id] = entry
+            self._entry_ids[key] = entry_id
+            for feature in entry.features:
+                self._postings.setdefault(feature, set()).add(entry_id)
+        self._entries[entry_id].add(meal, others)
+        self._meal_entries[meal.id] = entry_id
@@ -0,0 +1,811 @@
+"""Meal storage backends.
+
+The default backend is an append-only journal. ``meals.json`` is the compacted
+snapshot and keeps the shape described in ``meal_schema.json``. Every add,
+delete and repeat after the last compaction is appended as one JSON line to
+``meals.jsonl``, so a click costs one small write instead of re-serializing the
+whole history. Replaying a record is idempotent, which keeps compaction safe if
+the app dies halfway through it.
+
+Several sessions and processes may share one journal. Appends take a shared
+flock on ``meals.lock`` and rely on O_APPEND, so they never wait for each
+other; compaction takes the lock exclusively so no append lands between reading
+the journal and truncating it. Each record starts with a newline, which keeps
+a record torn by a crash on a line of its own where replay skips it.
+
+A journal keeps the replayed meals in memory, as ``MealRecord`` objects, and is
+meant to be shared by the whole process. Before answering a query it stats the
+files: if only the journal grew, just the new records are replayed, and the
+files are re-read in full only when the snapshot changed underneath it.
+
+Per-day protein/carbs/fat totals are kept alongside in ``meal_rollups.json``.
+They are updated as records are applied and rebuilt from the log whenever the
+file doesn't match the current snapshot.
+
+Only recent meals stay in the snapshot. Compaction moves whole months older
+than ``TEMPO_HOT_DAYS`` (default 90) into compressed monthly segments (see
+``meal_archive``), and a journal that finds expired months in its snapshot
+compacts on its own. Loading and today's queries therefore read only the
+recent months; queries reaching further back read the segment headers for
+totals and decode just the archived days they cover.
+"""
+
+from bisect import bisect_left, insort
+from datetime import date, datetime, timedelta
+import json
+import os
+import re
+import threading
+
+from file_cache import json_cache
+from fileio import atomic_write_json, file_lock
+
+SNAPSHOT_FILE = "meals.json"
+JOURNAL_FILE = "meals.jsonl"
+ROLLUP_FILE = "meal_rollups.json"
+LOCK_FILE = "meals.lock"
+SETTINGS_LOCK_FILE = "settings.lock"
+
+# Fold the journal into the snapshot once it holds this many records
+COMPACT_EVERY = 500
+# Meals from archived months that add_many holds before merging them into
+# their segments
+ARCHIVE_BATCH = 5000
+
+# Environment settings picking the storage backend and data location
+BACKEND_ENV = "TEMPO_STORAGE"
+DB_PATH_ENV = "TEMPO_DB_PATH"
+DATA_DIR_ENV = "TEMPO_DATA_DIR"
+DEFAULT_DB_FILE = "tempo.db"
+
+# Days of history kept in meals.json before whole months move to the archive
+HOT_DAYS_ENV = "TEMPO_HOT_DAYS"
+DEFAULT_HOT_DAYS = 90
+
+# Default for save_document's expected argument: write without checking
+ANY_VERSION = object()
+
+
+class ConflictError(Exception):
+    """A document changed since it was read, so the write was refused."""
+
+
+def user_data_dir(user=None):
+    """Return (and create) the data folder for user.
+
+    Args:
+        user: Signed-in user identifier such as an email address, or None for
+            the shared folder used when nobody is signed in.
+
+    Returns:
+        ``$TEMPO_DATA_DIR`` (default ".") or its ``users/<user>`` subfolder.
+    """
+    base = os.getenv(DATA_DIR_ENV, ".")
+    if not user:
+        return base
+    directory = os.path.join(base, "users", re.sub(r"[^A-Za-z0-9@._-]", "_", user))
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def open_store(user=None):
+    """Open the backend selected by ``TEMPO_STORAGE`` ("json" or "sqlite").
+
+    Args:
+        user: Signed-in user whose data folder to use, or None for the shared
+            one (see user_data_dir).
+
+    Returns:
+        A MealJournal or SqliteMealStore.
+    """
+    directory = user_data_dir(user)
+    backend = os.getenv(BACKEND_ENV, "json").lower()
+    if backend == "json":
+        return MealJournal(directory)
+    if backend == "sqlite":
+        from sqlite_store import SqliteMealStore
+
+        db_path = os.path.join(directory, DEFAULT_DB_FILE)
+        if not user:
+            db_path = os.getenv(DB_PATH_ENV, db_path)
+        return SqliteMealStore(db_path)
+    raise ValueError(f"Unknown storage backend {backend!r}, expected json or sqlite")
+
+
+def empty_totals():
+    """Return a zeroed per-day rollup."""
+    return {"protein": 0, "carbs": 0, "fat": 0, "meals": 0}
+
+
+def tidy_number(value):
+    """Round away float drift from incremental sums, keeping whole numbers ints."""
+    value = round(value, 2)
+    return int(value) if value == int(value) else value
+
+
+def add_to_rollups(rollups, meal, sign=1):
+    """Add (sign=1) or remove (sign=-1) a MealRecord's macros in a per-day rollup."""
+    totals = rollups.setdefault(meal.day, empty_totals())
+    totals["protein"] = tidy_number(totals["protein"] + sign * meal.protein)
+    totals["carbs"] = tidy_number(totals["carbs"] + sign * meal.carbs)
+    totals["fat"] = tidy_number(totals["fat"] + sign * meal.fat)
+    totals["meals"] += sign
+    if totals["meals"] <= 0:
+        del rollups[meal.day]
+
+
+def add_totals(totals, other):
+    """Add the rollup other into the rollup totals in place."""
+    for key in ("protein", "carbs", "fat"):
+        totals[key] = tidy_number(totals[key] + other[key])
+    totals["meals"] += other["meals"]
+
+
+def archive_cutoff(hot_days, today=None):
+    """Return the first month (YYYY-MM) that stays in meals.json.
+
+    Args:
+        hot_days: Days of history to keep in the snapshot.
+        today: Date to count back from (default: today).
+
+    Returns:
+        The month hot_days before today; every earlier month is archived.
+    """
+    today = today or date.today()
+    return (today - timedelta(days=hot_days)).isoformat()[:7]
+
+
+def local_day(timestamp):
+    """Return the local calendar date (YYYY-MM-DD) a meal timestamp falls on."""
+    if "+" in timestamp[19:] or "-" in timestamp[19:]:
+        # Timezone-aware timestamps are converted to local time first
+        return datetime.fromisoformat(timestamp).astimezone().date().isoformat()
+    return timestamp[:10]
+
+
+class MealRecord:
+    """One logged meal, with its timestamp parsed once.
+
+    Records are built from the ``meal_schema.json`` dict shape when meals are
+    loaded and turned back into it by ``to_dict()`` when they are written.
+    ``timestamp`` keeps the original ISO string so that round trip is exact,
+    while ``epoch`` (seconds since the epoch) and ``day`` (local YYYY-MM-DD)
+    are derived from it once for sorting, grouping and display.
+    """
+
+    __slots__ = (
+        "id",
+        "timestamp",
+        "epoch",
+        "day",
+        "description",
+        "protein",
+        "carbs",
+        "fat",
+        "interpretation",
+    )
+
+    def __init__(
+        self, meal_id, timestamp, description, protein, carbs, fat, interpretation=None
+    ):
+        """Create a record, parsing timestamp (ISO 8601) once."""
+        parsed = datetime.fromisoformat(timestamp)
+        if parsed.tzinfo is not None:
+            # Timezone-aware timestamps count towards the local day they fall on
+            parsed = parsed.astimezone()
+        self.id = meal_id
+        self.timestamp = timestamp
+        self.epoch = parsed.timestamp()
+        self.day = parsed.date().isoformat()
+        self.description = description
+        self.protein = protein
+        self.carbs = carbs
+        self.fat = fat
+        self.interpretation = interpretation
+
+    @classmethod
+    def from_dict(cls, meal):
+        """Build a record from a meal in the ``meal_schema.json`` shape."""
+        macros = meal["macros"]
+        return cls(
+            meal["id"],
+            meal["timestamp"],
+            meal["description"],
+            macros["protein"],
+            macros["carbs"],
+            macros["fat"],
+            meal.get("interpretation"),
+        )
+
+    def to_dict(self):
+        """Return the meal in the ``meal_schema.json`` shape."""
+        meal = {
+            "id": self.id,
+            "timestamp": self.timestamp,
+            "description": self.description,
+            "macros": self.macros,
+        }
+        if self.interpretation is not None:
+            meal["interpretation"] = self.interpretation
+        return meal
+
+    @property
+    def macros(self):
+        """Protein, carbs and fat in grams as a new dict."""
+        return {"protein": self.protein, "carbs": self.carbs, "fat": self.fat}
+
+    def __repr__(self):
+        """Show the id, timestamp and description."""
+        return f"MealRecord({self.id!r}, {self.timestamp!r}, {self.description!r})"
+
+
+class MealJournal:
+    """Meal log stored as a JSON snapshot plus an append-only JSONL journal.
+
+    MealRecords returned by the query methods are shared with the in-memory
+    state, so callers must not modify them.
+    """
+
+    def __init__(self, directory=".", hot_days=None):
+        """Create a journal rooted at directory.
+
+        Args:
+            directory: Folder holding meals.json and meals.jsonl.
+            hot_days: Days of history to keep in meals.json; whole months
+                before that are archived. Defaults to ``$TEMPO_HOT_DAYS`` or
+                90; 0 keeps everything in meals.json.
+        """
+        from meal_archive import MealArchive
+
+        if hot_days is None:
+            hot_days = int(os.getenv(HOT_DAYS_ENV, DEFAULT_HOT_DAYS))
+        self.directory = directory
+        self.hot_days = hot_days
+        self.archive = MealArchive(directory)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.journal_path = os.path.join(directory, JOURNAL_FILE)
+        self.rollup_path = os.path.join(directory, ROLLUP_FILE)
+        self.lock_path = os.path.join(directory, LOCK_FILE)
+        self.settings_lock_path = os.path.join(directory, SETTINGS_LOCK_FILE)
+        self.journal_records = 0
+        # Queries answered from memory vs. full re-reads of the files
+        self.hits = 0
+        self.reloads = 0
+        # Journal lines that weren't valid records (torn by a crash)
+        self.skipped_records = 0
+        # meal id -> MealRecord
+        self._meals = None
+        self._rollups = None
+        # (epoch, id) pairs in time order, built on the first page() call
+        self._order = None
+        # Snapshot [size, mtime] and journal bytes the in-memory state reflects
+        self._snapshot_seen = None
+        self._journal_offset = 0
+        self._lock = threading.RLock()
+
+    def load(self):
+        """Return the current meals as ``{"meals": [...]}`` in the schema shape."""
+        return {"meals": [meal.to_dict() for meal in self.records()]}
+
+    def records(self):
+        """Return every current meal as a MealRecord, archived ones included."""
+        with self._lock:
+            archived = self._archived_records()
+            return archived + list(self._meals.values())
+
+    def archived_records(self):
+        """Return the archived meals, reading every segment."""
+        with self._lock:
+            return self._archived_records()
+
+    def archived_summaries(self):
+        """Return a (latest MealRecord, count) pair per archived description.
+
+        Only the segments' summary blocks are read, so this stays quick
+        however many meals are archived.
+        """
+        with self._lock:
+            self._refresh()
+            with file_lock(self.lock_path, shared=True):
+                return self.archive.summaries()
+
+    def recent_records(self):
+        """Return the meals not archived yet, without reading the archive."""
+        with self._lock:
+            self._refresh()
+            return list(self._meals.values())
+
+    def archived_daily_totals(self):
+        """Return ``{day: rollup}`` for the archived meals, from segment headers."""
+        with self._lock:
+            self._refresh()
+            with file_lock(self.lock_path, shared=True):
+                return self.archive.daily_totals()
+
+    def daily_totals(self, day):
+        """Return the protein/carbs/fat/meal-count rollup for day (YYYY-MM-DD)."""
+        with self._lock:
+            self._refresh()
+            totals = dict(self._rollups.get(day) or empty_totals())
+            with file_lock(self.lock_path, shared=True):
+                if self._reaches_archive(day):
+                    for archived in self.archive.daily_totals(day, day).values():
+                        add_totals(totals, archived)
+            return totals
+
+    def daily_totals_between(self, start_day, end_day):
+        """Return ``{day: rollup}`` for days with meals in start_day..end_day."""
+        with self._lock:
+            self._refresh()
+            totals = {}
+            with file_lock(self.lock_path, shared=True):
+                if self._reaches_archive(start_day):
+                    totals = self.archive.daily_totals(start_day, end_day)
+            for day, rollup in self._rollups.items():
+                if start_day <= day <= end_day:
+                    if day in totals:
+                        add_totals(totals[day], rollup)
+                    else:
+                        totals[day] = dict(rollup)
+            return totals
+
+    def rebuild_rollups(self):
+        """Recompute meal_rollups.json from the meal log."""
+        with self._lock, file_lock(self.lock_path, shared=True):
+            self._load_state()
+            self._rollups = {}
+            for meal in self._meals.values():
+                add_to_rollups(self._rollups, meal)
+            self._write_rollups(self._rollups)
+
+    def stats(self):
+        """Return how often queries were answered without re-reading the files.
+
+        ``archive`` holds the archive's segment count and how many archived
+        days were decoded or served from memory.
+        """
+        lookups = self.hits + self.reloads
+        with self._lock, file_lock(self.lock_path, shared=True):
+            archive = self.archive.stats()
+        return {
+            "hits": self.hits,
+            "reloads": self.reloads,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "archive": archive,
+        }
+
+    def meals_for_day(self, day):
+        """Return the meals logged on day (YYYY-MM-DD)."""
+        return self.meals_between(day, day)
+
+    def meals_between(self, start_day, end_day):
+        """Return meals whose local date is within start_day..end_day inclusive."""
+        with self._lock:
+            self._refresh()
+            meals = [
+                meal
+                for meal in self._meals.values()
+                if start_day <= meal.day <= end_day
+            ]
+            with file_lock(self.lock_path, shared=True):
+                if not self._reaches_archive(start_day):
+                    return meals
+                archived = self.archive.meals_between(start_day, end_day)
+            return [meal for meal in archived if meal.id not in self._meals] + meals
+
+    def page(self, limit, before=None):
+        """Return up to limit meals newest first.
+
+        Args:
+            limit: Maximum number of meals.
+            before: The last MealRecord of the previous page, or None for the
+                newest page.
+        """
+        with self._lock:
+            self._refresh()
+            if self._order is None:
+                self._order = sorted(
+                    (meal.epoch, meal_id) for meal_id, meal in self._meals.items()
+                )
+            if before is None:
+                end = len(self._order)
+            else:
+                end = bisect_left(self._order, (before.epoch, before.id))
+            window = self._order[max(0, end - limit) : end]
+            meals = [self._meals[meal_id] for _, meal_id in reversed(window)]
+            with file_lock(self.lock_path, shared=True):
+                newest = self.archive.newest_day()
+                if newest is None or (len(meals) == limit and meals[-1].day > newest):
+                    return meals
+                # The page reaches back into (or overlaps) the archived months
+                older = self.archive.page(limit, before, exclude=self._meals)
+            meals.extend(older)
+            meals.sort(key=lambda meal: (meal.epoch, meal.id), reverse=True)
+            return meals[:limit]
+
+    def load_document(self, name):
+        """Return the parsed ``<name>.json`` settings file, or None if missing."""
+        try:
+            return json_cache.read_json(self._document_path(name))
+        except FileNotFoundError:
+            return None
+
+    def save_document(self, name, data, expected=ANY_VERSION):
+        """Atomically write the ``<name>.json`` settings file.
+
+        Args:
+            name: Document name.
+            data: New contents.
+            expected: If given, the contents the caller based its change on
+                (None for "didn't exist"); the write is refused if the file no
+                longer holds exactly that.
+
+        Raises:
+            ConflictError: If expected doesn't match the stored document.
+        """
+        path = self._document_path(name)
+        with file_lock(self.settings_lock_path):
+            self._check_document(name, expected)
+            atomic_write_json(path, data)
+        json_cache.invalidate(path)
+
+    def delete_document(self, name, expected=ANY_VERSION):
+        """Remove the ``<name>.json`` settings file if it exists.
+
+        Raises:
+            ConflictError: If expected is given and doesn't match.
+        """
+        path = self._document_path(name)
+        with file_lock(self.settings_lock_path):
+            self._check_document(name, expected)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        json_cache.invalidate(path)
+
+    def add(self, meal):
+        """Append a newly logged meal."""
+        self._append({"op": "add", "meal": meal})
+
+    def repeat(self, meal, source_id):
+        """Append a meal that repeats an earlier one."""
+        self._append({"op": "repeat", "meal": meal, "source_id": source_id})
+
+    def delete(self, meal_id, day=None):
+        """Append a tombstone for meal_id, or remove it from the archive.
+
+        Args:
+            meal_id: Meal to delete.
+            day: Its local day (YYYY-MM-DD) if known; an archived meal is
+                then found without searching every archived month.
+        """
+        with self._lock:
+            # Decide and write under one exclusive lock, so the meal's month
+            # can't be archived between the check and the tombstone
+            with file_lock(self.lock_path):
+                self._refresh_locked()
+                if meal_id not in self._meals and self.archive.delete(meal_id, day):
+                    return
+                self._write_journal({"op": "delete", "id": meal_id})
+            self._appended()
+
+    def add_many(self, meals):
+        """Add meals in one step, replacing any already logged with the same id.
+
+        They are folded into a new snapshot together with the journal rather
+        than appended record by record. Meals from archived months are merged
+        into staged copies of their segments ``ARCHIVE_BATCH`` at a time, so
+        memory stays bounded by the batch and the recent months however long
+        the input is. Nothing is published until the whole input has been
+        read. The staged segments are then renamed one month at a time and
+        the new snapshot is written last, so a crash in between can leave
+        part of the meals saved. Meals keep their ids, so running the same
+        import again completes it without duplicating any. With archiving
+        turned off (``hot_days=0``) every meal is held in memory; use the
+        SQLite backend for very large imports then.
+
+        Args:
+            meals: Iterable of meals in the ``meal_schema.json`` shape.
+
+        Returns:
+            Number of meals added.
+        """
+        with self._lock, file_lock(self.lock_path):
+            self._load_state()
+            records = dict(self._meals)
+            cutoff = archive_cutoff(self.hot_days) if self.hot_days else None
+            batch = []
+            count = 0
+            self.archive.discard_staged()
+            try:
+                for meal in meals:
+                    record = MealRecord.from_dict(meal)
+                    count += 1
+                    if cutoff is None or record.day >= cutoff:
+                        records[record.id] = record
+                        continue
+                    # The imported meal replaces any copy still in the snapshot
+                    records.pop(record.id, None)
+                    batch.append(record)
+                    if len(batch) >= ARCHIVE_BATCH:
+                        self.archive.stage(batch)
+                        batch = []
+                if batch:
+                    self.archive.stage(batch)
+            except BaseException:
+                self.archive.discard_staged()
+                raise
+            self.archive.commit_staged()
+            self._write_snapshot(list(records.values()))
+        return count
+
+    def replace(self, meals_data):
+        """Overwrite the whole log with meals_data and clear the journal."""
+        records = [MealRecord.from_dict(meal) for meal in meals_data["meals"]]
+        with self._lock, file_lock(self.lock_path):
+            self._write_snapshot(records, replace_archive=True)
+
+    def compact(self):
+        """Fold the journal into a fresh snapshot."""
+        with self._lock, file_lock(self.lock_path):
+            # Re-read under the exclusive lock so no record is left behind
+            self._load_state()
+            self._write_snapshot(list(self._meals.values()))
+
+    def _document_path(self, name):
+        return os.path.join(self.directory, f"{name}.json")
+
+    def _check_document(self, name, expected):
+        if expected is ANY_VERSION:
+            return
+        try:
+            with open(self._document_path(name), "r") as f:
+                current = json.load(f)
+        except FileNotFoundError:
+            current = None
+        if current != expected:
+            raise ConflictError(f"{name} was changed by another session")
+
+    def _write_snapshot(self, records, replace_archive=False):
+        """Replace the snapshot and clear the journal; needs the exclusive lock.
+
+        Meals from months before the hot window are merged into their archive
+        segments first, so a crash in between leaves them in both places
+        rather than in neither. With replace_archive, the archive is rewritten
+        to hold exactly those meals.
+        """
+        archived = []
+        if self.hot_days:
+            cutoff = archive_cutoff(self.hot_days)
+            archived = [meal for meal in records if meal.day < cutoff]
+            records = [meal for meal in records if meal.day >= cutoff]
+        if replace_archive:
+            self.archive.replace(archived)
+        elif archived:
+            self.archive.add(archived)
+        atomic_write_json(
+            self.snapshot_path, {"meals": [meal.to_dict() for meal in records]}
+        )
+        rollups = {}
+        for meal in records:
+            add_to_rollups(rollups, meal)
+        self._write_rollups(rollups)
+        self._truncate_journal()
+        self._meals = {meal.id: meal for meal in records}
+        self._rollups = rollups
+        self._order = None
+        self._snapshot_seen = self._snapshot_token()
+        self._journal_offset = 0
+
+    def _refresh(self):
+        """Bring the in-memory state up to date with the files on disk."""
+        if not os.path.exists(self.snapshot_path):
+            with file_lock(self.lock_path):
+                if not os.path.exists(self.snapshot_path):
+                    # Create meals.json with empty structure if it doesn't exist
+                    atomic_write_json(self.snapshot_path, {"meals": []})
+        with file_lock(self.lock_path, shared=True):
+            self._refresh_locked()
+        if self._archive_due():
+            with file_lock(self.lock_path):
+                # Another process may have archived them in the meantime
+                self._load_state()
+                if self._archive_due():
+                    self._write_snapshot(list(self._meals.values()))
+
+    def _archive_due(self):
+        """Whether the snapshot holds meals from months that belong archived."""
+        return bool(
+            self.hot_days
+            and self._rollups
+            and min(self._rollups) < archive_cutoff(self.hot_days)
+        )
+
+    def _reaches_archive(self, start_day):
+        """Whether archived meals may fall on start_day or later; needs a lock."""
+        newest = self.archive.newest_day()
+        return newest is not None and start_day <= newest
+
+    def _archived_records(self):
+        """Read the archive and the snapshot together; needs self._lock.
+
+        Months due for archiving are moved first. The segments and the hot
+        meals are then read under one shared lock, so no meal can move from
+        one to the other while they are read.
+        """
+        self._refresh()
+        with file_lock(self.lock_path, shared=True):
+            self._refresh_locked()
+            return [
+                meal for meal in self.archive.records() if meal.id not in self._meals
+            ]
+
+    def _refresh_locked(self):
+        if self._meals is not None and self._snapshot_token() == self._snapshot_seen:
+            journal_size = _file_size(self.journal_path)
+            if journal_size >= self._journal_offset:
+                if journal_size > self._journal_offset:
+                    # Only new records were appended, so replay just those
+                    records, self._journal_offset = self._read_journal(
+                        self._journal_offset
+                    )
+                    for record in records:
+                        self._apply_in_memory(record)
+                    self.journal_records += len(records)
+                self.hits += 1
+                return
+        self.reloads += 1
+        self._load_state()
+
+    def _load_state(self):
+        try:
+            with open(self.snapshot_path, "r") as f:
+                stat = os.fstat(f.fileno())
+                snapshot = json.load(f)
+            snapshot_token = [stat.st_size, stat.st_mtime_ns]
+        except FileNotFoundError:
+            snapshot = {"meals": []}
+            snapshot_token = None
+
+        meals = {meal["id"]: MealRecord.from_dict(meal) for meal in snapshot["meals"]}
+        rollups = self._read_rollups(snapshot_token)
+        if rollups is None:
+            # Missing or written for another snapshot, so rebuild it
+            rollups = {}
+            for meal in meals.values():
+                add_to_rollups(rollups, meal)
+            self._write_rollups(rollups)
+
+        records, journal_offset = self._read_journal()
+        for record in records:
+            self._apply(meals, rollups, record)
+        self.journal_records = len(records)
+        self._meals = meals
+        self._rollups = rollups
+        self._order = None
+        self._snapshot_seen = snapshot_token
+        self._journal_offset = journal_offset
+
+    def _snapshot_token(self):
+        try:
+            stat = os.stat(self.snapshot_path)
+        except FileNotFoundError:
+            return None
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def _read_rollups(self, snapshot_token):
+        """Return the saved rollups if they were built from snapshot_token."""
+        try:
+            with open(self.rollup_path, "r") as f:
+                saved = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if saved.get("snapshot") != snapshot_token:
+            return None
+        return saved["days"]
+
+    def _write_rollups(self, rollups):
+        atomic_write_json(
+            self.rollup_path, {"snapshot": self._snapshot_token(), "days": rollups}
+        )
+
+    def _append(self, record):
+        with file_lock(self.lock_path, shared=True):
+            self._write_journal(record)
+        self._appended()
+
+    def _write_journal(self, record):
+        """Append record to the journal file; needs the shared or exclusive lock."""
+        # The leading newline isolates whatever a crashed writer left behind
+        line = "\n" + json.dumps(record, separators=(",", ":")) + "\n"
+        fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode("utf-8"))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _appended(self):
+        """Catch up with the journal after a write, compacting it when long."""
+        with self._lock:
+            if self._meals is None:
+                self.journal_records += 1
+            else:
+                # Picks up this record, and any appended by other processes
+                self._refresh()
+            if self.journal_records >= COMPACT_EVERY:
+                self.compact()
+
+    def _read_journal(self, start=0):
+        """Parse complete records from byte offset start onwards.
+
+        A line that isn't valid JSON is what's left of a record torn by a
+        crash and is skipped. A last line without its newline may still be
+        being written and is left for the next read.
+
+        Returns:
+            The records and the offset just past the last complete line.
+        """
+        try:
+            with open(self.journal_path, "rb") as f:
+                f.seek(start)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+
+        records = []
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].split(b"\n"):
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                self.skipped_records += 1
+        return records, start + end
+
+    def _truncate_journal(self):
+        try:
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(0)
+                os.fsync(f.fileno())
+        except FileNotFoundError:
+            pass
+        self.journal_records = 0
+
+    def _apply_in_memory(self, record):
+        meal_id = record["meal"]["id"] if "meal" in record else record["id"]
+        previous = self._meals.get(meal_id)
+        self._apply(self._meals, self._rollups, record)
+        if self._order is None:
+            return
+        if previous is not None:
+            key = (previous.epoch, meal_id)
+            index = bisect_left(self._order, key)
+            if index < len(self._order) and self._order[index] == key:
+                del self._order[index]
+        if record["op"] != "delete":
+            insort(self._order, (self._meals[meal_id].epoch, meal_id))
+
+    @staticmethod
+    def _apply(meals, rollups, record):
+        if record["op"] in ("add", "repeat"):
+            meal = MealRecord.from_dict(record["meal"])
+            previous = meals.get(meal.id)
+            if previous is not None:
+                # Replaying a record already folded into the snapshot
+                add_to_rollups(rollups, previous, -1)
+            meals[meal.id] = meal
+            add_to_rollups(rollups, meal)
+        elif record["op"] == "delete":
+            meal = meals.pop(record["id"], None)
+            if meal is not None:
+                add_to_rollups(rollups, meal, -1)
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
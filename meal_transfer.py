@@ -0,0 +1,601 @@
+"""Bulk import and export of the meal log as CSV or JSONL.
+
+Imports stream the input file row by row, so tens of thousands of rows take
+bounded memory. Each row is normalized to the ``meal_schema.json`` meal shape
+and validated against that schema. Rows without macros are estimated the way
+the app estimates a logged meal. The built-in food table is tried first and
+the estimate cache second. What is left is sent to the LLM a few dozen
+descriptions per request, with several requests in flight at once. Finished
+meals are spooled to a temporary file, and only once the whole input has been
+read are they handed to the store in one ``add_many`` call. With SQLite that
+call is a single transaction. The JSON store publishes archived months one at
+a time and its snapshot last, so a crash can leave an import partly saved;
+running it again completes it without duplicating meals.
+
+Exports page through the store newest first and write one row at a time.
+
+Rows without an ``id`` get one derived from their timestamp, description and
+how many rows before them had both the same, so importing the same file twice
+doesn't log its meals twice::
+
+    python meal_transfer.py import history.csv --dir .
+    python meal_transfer.py export backup.jsonl --dir .
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import csv
+from datetime import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+from estimate_cache import EstimateCache
+from jsonschema import Draft7Validator
+from llm_client import LLMClient
+from local_estimator import estimate_locally, merge_estimates
+from meal_store import (
+    BACKEND_ENV,
+    DATA_DIR_ENV,
+    open_store,
+    tidy_number,
+)
+
+SCHEMA_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "meal_schema.json"
+)
+
+# Columns written by export, in order; import reads the same names
+FIELDS = ["id", "timestamp", "description", "protein", "carbs", "fat", "interpretation"]
+MACROS = ("protein", "carbs", "fat")
+# Other names import accepts for those columns (compared in lower case)
+COLUMN_ALIASES = {
+    "date": "timestamp",
+    "datetime": "timestamp",
+    "time": "timestamp",
+    "meal": "description",
+    "food": "description",
+    "name": "description",
+    "protein_g": "protein",
+    "carbs_g": "carbs",
+    "carbohydrates": "carbs",
+    "fat_g": "fat",
+    "notes": "interpretation",
+}
+
+# Rows estimated together; distinct descriptions in one chunk share estimates
+CHUNK_ROWS = 500
+# Descriptions sent to the LLM in one request, and requests in flight at once
+BATCH_SIZE = 25
+WORKERS = 4
+# Attempts per request after the first, with exponential backoff
+RETRIES = 2
+BACKOFF = 1.0
+# Estimates remembered between chunks, so repeated dishes skip the cache
+MEMO_SIZE = 10000
+# Row errors kept for the report; all of them are counted
+MAX_ERRORS = 100
+# Meals read from the store per page while exporting
+EXPORT_PAGE = 1000
+
+# Same model and prompt version as the app's single-meal estimates, so both
+# share the estimate cache
+ESTIMATE_MODEL = "gpt-4o-mini"
+ESTIMATE_PROMPT_VERSION = 1
+# Seconds a single OpenAI request may take before it is abandoned
+LLM_TIMEOUT = 60
+
+# Timestamps given as a date only are logged at noon that day
+DATE_ONLY_TIME = "T12:00:00"
+# Namespace for ids derived from a row's timestamp and description
+IMPORT_NAMESPACE = uuid.UUID("5f0c8a52-3c1e-4b7a-9d0e-7a51c6f4e2b9")
+
+BATCH_PROMPT = """You are a nutrition expert. You are given a numbered list of meal
+descriptions. For each meal:
+1. Briefly explain what you understand about the meal (quantities, ingredients,
+preparation). Don't give feedback on the pros and cons of the meal.
+2. Estimate its macronutrients (protein, carbs, fat in grams).
+
+Return a JSON object with one entry per meal, using the meal's number as index:
+{
+    "meals": [
+        {
+            "index": 1,
+            "interpretation": "Your understanding of the meal",
+            "macros": {"protein": X, "carbs": Y, "fat": Z}
+        }
+    ]
+}"""
+
+ImportResult = collections.namedtuple(
+    "ImportResult", ["imported", "estimated", "failed", "errors"]
+)
+ImportResult.__doc__ = """Outcome of import_meals.
+
+``imported`` meals were saved (or would be, on a dry run), ``estimated`` of
+them had their macros estimated, and ``failed`` rows were left out. ``errors``
+lists ``(line, message)`` for the first MAX_ERRORS of those rows.
+"""
+
+
+def _row_validator():
+    """Validator for an imported meal, whose macros may still be missing."""
+    with open(SCHEMA_FILE, "r") as f:
+        item = json.load(f)["properties"]["meals"]["items"]
+    item = dict(
+        item, required=[field for field in item["required"] if field != "macros"]
+    )
+    # Timestamps are checked by to_meal instead of the date-time format, as
+    # the app logs local times without a UTC offset
+    return Draft7Validator(item)
+
+
+def detect_format(path):
+    """Return "csv" or "jsonl" from a file name's extension."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    raise ValueError(f"Can't tell the format of {path!r}; use --format csv or jsonl")
+
+
+def read_rows(f, file_format):
+    """Yield ``(line, row)`` for each row of a CSV or JSONL file.
+
+    CSV rows are dicts keyed by lower-cased column names with aliases
+    resolved. A JSONL line that isn't a JSON object is yielded as its error
+    message (a str) so the caller can report it and carry on.
+    """
+    if file_format == "csv":
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        columns = []
+        for name in header:
+            name = name.strip().lower()
+            columns.append(COLUMN_ALIASES.get(name, name))
+        for values in reader:
+            if any(value.strip() for value in values):
+                yield reader.line_num, dict(zip(columns, values))
+        return
+
+    for line, text in enumerate(f, 1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError as e:
+            yield line, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield line, "Expected a JSON object"
+            continue
+        yield line, row
+
+
+def to_meal(row):
+    """Convert a CSV or JSONL row to a meal in the ``meal_schema.json`` shape.
+
+    Macros may be given as a nested ``macros`` object or as separate
+    protein/carbs/fat values. They are left out if none are given, so the
+    meal can be estimated.
+
+    Raises:
+        ValueError: If the timestamp or a macro isn't readable.
+    """
+    meal = {}
+    for field in ("timestamp", "description", "interpretation"):
+        value = row.get(field)
+        if isinstance(value, str):
+            value = value.strip()
+        if value not in (None, ""):
+            meal[field] = value
+
+    timestamp = meal.get("timestamp")
+    if isinstance(timestamp, str):
+        try:
+            parsed = datetime.fromisoformat(
+                timestamp + DATE_ONLY_TIME if len(timestamp) == 10 else timestamp
+            )
+        except ValueError:
+            raise ValueError(f"Invalid timestamp {timestamp!r}") from None
+        meal["timestamp"] = parsed.isoformat()
+
+    macros = row.get("macros")
+    if macros is None:
+        macros = {macro: row.get(macro) for macro in MACROS}
+    if isinstance(macros, dict):
+        given = {
+            macro: value for macro, value in macros.items() if value not in (None, "")
+        }
+        if given:
+            meal["macros"] = {
+                macro: tidy_number(float(value)) if isinstance(value, str) else value
+                for macro, value in given.items()
+            }
+    else:
+        meal["macros"] = macros
+
+    if row.get("id") not in (None, ""):
+        meal["id"] = row["id"]
+    return meal
+
+
+def import_id(timestamp, description, occurrence):
+    """Return the id given to the occurrence-th row (from 1) with these values."""
+    return str(
+        uuid.uuid5(IMPORT_NAMESPACE, f"{timestamp}\0{description}\0{occurrence}")
+    )
+
+
+def openai_completer(model=ESTIMATE_MODEL, timeout=LLM_TIMEOUT, client=None):
+    """Return a function that sends chat messages to OpenAI and parses the JSON reply.
+
+    Args:
+        model: Model to use.
+        timeout: Seconds each request may take.
+        client: LLMClient to send requests through (default: a new one). It
+            reads ``OPENAI_API_KEY`` (and ``OPENAI_BASE_URL``, if set) from
+            the environment.
+    """
+    client = client or LLMClient()
+
+    def complete(messages):
+        text = client.complete(model=model, messages=messages, timeout=timeout).text
+        if not text.strip():
+            raise ValueError("Empty response from ChatGPT")
+        return json.loads(text)
+
+    return complete
+
+
+class BatchEstimator:
+    """Estimates many meal descriptions with few LLM requests."""
+
+    def __init__(
+        self,
+        complete,
+        cache=None,
+        model=ESTIMATE_MODEL,
+        prompt_version=ESTIMATE_PROMPT_VERSION,
+        batch_size=BATCH_SIZE,
+        workers=WORKERS,
+        retries=RETRIES,
+        backoff=BACKOFF,
+    ):
+        """Create an estimator.
+
+        Args:
+            complete: Function taking chat messages and returning the parsed
+                JSON reply, e.g. from openai_completer. It is called from
+                worker threads.
+            cache: EstimateCache to read and store estimates in, or None.
+            model: Model name the cache entries are keyed on.
+            prompt_version: Prompt version the cache entries are keyed on.
+            batch_size: Descriptions per request.
+            workers: Requests in flight at once.
+            retries: Attempts per request after the first.
+            backoff: Seconds before the first retry, doubling after each.
+        """
+        self.complete = complete
+        self.cache = cache
+        self.model = model
+        self.prompt_version = prompt_version
+        self.batch_size = batch_size
+        self.retries = retries
+        self.backoff = backoff
+        # Descriptions answered locally, from the cache and by the LLM
+        self.local = 0
+        self.cached = 0
+        self.requested = 0
+        self.requests = 0
+        # Recent estimates by description, least recently used first
+        self._memo = collections.OrderedDict()
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+    def close(self):
+        """Stop the worker threads."""
+        self._pool.shutdown()
+
+    def estimate(self, descriptions):
+        """Estimate each distinct description.
+
+        Args:
+            descriptions: Meal descriptions; repeats are estimated once.
+
+        Returns:
+            A dict mapping each description to an estimate
+            (``{"interpretation": ..., "macros": {...}}``), or to None if it
+            couldn't be estimated.
+        """
+        results = {}
+        # description -> (local part of the estimate, text still to estimate)
+        pending = {}
+        for description in dict.fromkeys(descriptions):
+            if description in self._memo:
+                self._memo.move_to_end(description)
+                results[description] = self._memo[description]
+                self.cached += 1
+                continue
+            local_result, unparsed = estimate_locally(description)
+            if local_result is not None and not unparsed:
+                results[description] = local_result
+                self.local += 1
+                continue
+            if self.cache is not None:
+                cached = self.cache.get(description, self.model, self.prompt_version)
+                if cached is not None:
+                    results[description] = cached
+                    self.cached += 1
+                    continue
+            pending[description] = (local_result, ", ".join(unparsed) or description)
+
+        waiting = list(pending)
+        batches = [
+            waiting[start : start + self.batch_size]
+            for start in range(0, len(waiting), self.batch_size)
+        ]
+        requests = [
+            self._pool.submit(self._request, [pending[d][1] for d in batch])
+            for batch in batches
+        ]
+        for batch, request in zip(batches, requests):
+            for description, estimate in zip(batch, request.result()):
+                local_result = pending[description][0]
+                if estimate is not None:
+                    if local_result is not None:
+                        estimate = merge_estimates(local_result, estimate)
+                    if self.cache is not None:
+                        self.cache.put(
+                            description, self.model, self.prompt_version, estimate
+                        )
+                results[description] = estimate
+
+        for description, estimate in results.items():
+            if estimate is not None:
+                self._memo[description] = estimate
+                self._memo.move_to_end(description)
+        while len(self._memo) > MEMO_SIZE:
+            self._memo.popitem(last=False)
+        self.requested += len(waiting)
+        self.requests += len(batches)
+        return results
+
+    def _request(self, texts):
+        """Estimate texts in one request; None for any the reply left out."""
+        listing = "\n".join(f"{i}. {text}" for i, text in enumerate(texts, 1))
+        messages = [
+            {"role": "system", "content": BATCH_PROMPT},
+            {"role": "user", "content": listing},
+        ]
+        for attempt in range(self.retries + 1):
+            try:
+                reply = self.complete(messages)
+                break
+            except Exception:
+                if attempt == self.retries:
+                    return [None] * len(texts)
+                time.sleep(self.backoff * 2**attempt)
+
+        estimates = [None] * len(texts)
+        entries = reply.get("meals") if isinstance(reply, dict) else None
+        for entry in entries if isinstance(entries, list) else []:
+            try:
+                index = int(entry["index"]) - 1
+                macros = {macro: float(entry["macros"][macro]) for macro in MACROS}
+            except (KeyError, TypeError, ValueError):
+                continue
+            if 0 <= index < len(texts):
+                estimates[index] = {
+                    "interpretation": str(entry.get("interpretation", "")),
+                    "macros": {
+                        macro: round(value, 1) for macro, value in macros.items()
+                    },
+                }
+        return estimates
+
+
+def import_meals(store, f, file_format, estimator=None, dry_run=False):
+    """Validate, estimate and save every row of a CSV or JSONL file.
+
+    Args:
+        store: MealJournal or SqliteMealStore to add the meals to.
+        f: Open text file to read.
+        file_format: "csv" or "jsonl".
+        estimator: BatchEstimator for rows without macros; without one such
+            rows fail.
+        dry_run: Check and estimate the rows without saving them.
+
+    Returns:
+        An ImportResult.
+    """
+    validator = _row_validator()
+    imported = estimated = failed = 0
+    errors = []
+    # (timestamp, description) -> rows seen with them, for import_id
+    occurrences = collections.Counter()
+
+    def fail(line, message):
+        nonlocal failed
+        failed += 1
+        if len(errors) < MAX_ERRORS:
+            errors.append((line, message))
+
+    def flush(chunk, spool):
+        nonlocal imported, estimated
+        unknown = [meal["description"] for _, meal in chunk if "macros" not in meal]
+        estimates = estimator.estimate(unknown) if estimator and unknown else {}
+        for line, meal in chunk:
+            if "macros" not in meal:
+                estimate = estimates.get(meal["description"])
+                if estimate is None:
+                    reason = "couldn't be estimated" if estimator else "not estimated"
+                    fail(line, f"Macros missing and {reason}")
+                    continue
+                meal["macros"] = estimate["macros"]
+                meal.setdefault("interpretation", estimate["interpretation"])
+                estimated += 1
+            spool.write(json.dumps(meal) + "\n")
+            imported += 1
+
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as spool:
+        chunk = []
+        for line, row in read_rows(f, file_format):
+            if isinstance(row, str):
+                fail(line, row)
+                continue
+            try:
+                meal = to_meal(row)
+            except (TypeError, ValueError) as e:
+                fail(line, str(e))
+                continue
+            if "id" not in meal:
+                key = (meal.get("timestamp"), meal.get("description"))
+                occurrences[key] += 1
+                meal["id"] = import_id(*key, occurrences[key])
+            problems = [error.message for error in validator.iter_errors(meal)]
+            if problems:
+                fail(line, "; ".join(problems))
+                continue
+            chunk.append((line, meal))
+            if len(chunk) >= CHUNK_ROWS:
+                flush(chunk, spool)
+                chunk = []
+        flush(chunk, spool)
+
+        if not dry_run and imported:
+            spool.seek(0)
+            store.add_many(json.loads(line) for line in spool)
+    return ImportResult(imported, estimated, failed, errors)
+
+
+def export_meals(store, f, file_format):
+    """Write every meal in store to f as CSV or JSONL, newest first.
+
+    Returns:
+        Number of meals written.
+    """
+    writer = None
+    if file_format == "csv":
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+    count = 0
+    page = store.page(EXPORT_PAGE)
+    while page:
+        for meal in page:
+            if writer is not None:
+                writer.writerow(
+                    [
+                        meal.id,
+                        meal.timestamp,
+                        meal.description,
+                        meal.protein,
+                        meal.carbs,
+                        meal.fat,
+                        meal.interpretation or "",
+                    ]
+                )
+            else:
+                f.write(json.dumps(meal.to_dict()) + "\n")
+        count += len(page)
+        page = store.page(EXPORT_PAGE, before=page[-1])
+    return count
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Tempo meal log import and export")
+    parser.add_argument(
+        "--dir", help=f"data folder (default: ${DATA_DIR_ENV} or the current folder)"
+    )
+    parser.add_argument(
+        "--backend", choices=("json", "sqlite"), help=f"default: ${BACKEND_ENV}"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="add meals from a file")
+    import_parser.add_argument("path", help="CSV or JSONL file, or - for stdin")
+    import_parser.add_argument("--format", choices=("csv", "jsonl"))
+    import_parser.add_argument(
+        "--no-estimate",
+        action="store_true",
+        help="skip rows without macros instead of estimating them",
+    )
+    import_parser.add_argument(
+        "--dry-run", action="store_true", help="check the file without saving"
+    )
+    import_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    import_parser.add_argument("--workers", type=int, default=WORKERS)
+    import_parser.add_argument("--model", default=ESTIMATE_MODEL)
+    export_parser = subparsers.add_parser("export", help="write all meals to a file")
+    export_parser.add_argument("path", help="CSV or JSONL file, or - for stdout")
+    export_parser.add_argument("--format", choices=("csv", "jsonl"))
+    args = parser.parse_args()
+
+    if args.dir:
+        os.environ[DATA_DIR_ENV] = args.dir
+    if args.backend:
+        os.environ[BACKEND_ENV] = args.backend
+    file_format = args.format or detect_format(args.path)
+    store = open_store()
+
+    if args.command == "export":
+        if args.path == "-":
+            count = export_meals(store, sys.stdout, file_format)
+        else:
+            with open(args.path, "w", encoding="utf-8", newline="") as f:
+                count = export_meals(store, f, file_format)
+        print(f"Exported {count} meals", file=sys.stderr)
+        return 0
+
+    estimator = None
+    if not args.no_estimate:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        estimator = BatchEstimator(
+            openai_completer(args.model),
+            # The app's estimate cache, in the data folder
+            cache=EstimateCache(),
+            model=args.model,
+            batch_size=args.batch_size,
+            workers=args.workers,
+        )
+    try:
+        if args.path == "-":
+            result = import_meals(
+                store, sys.stdin, file_format, estimator, args.dry_run
+            )
+        else:
+            with open(args.path, "r", encoding="utf-8-sig", newline="") as f:
+                result = import_meals(store, f, file_format, estimator, args.dry_run)
+    finally:
+        if estimator is not None:
+            estimator.close()
+
+    for line, message in result.errors:
+        print(f"line {line}: {message}", file=sys.stderr)
+    if result.failed > len(result.errors):
+        print(f"... and {result.failed - len(result.errors)} more", file=sys.stderr)
+    verb = "Would import" if args.dry_run else "Imported"
+    print(
+        f"{verb} {result.imported} meals ({result.estimated} estimated), "
+        f"skipped {result.failed} rows",
+        file=sys.stderr,
+    )
+    if estimator is not None:
+        print(
+            f"Estimates: {estimator.local} from the food table, {estimator.cached} "
+            f"cached, {estimator.requested} in {estimator.requests} requests",
+            file=sys.stderr,
+        )
+    return 1 if result.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
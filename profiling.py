@@ -0,0 +1,186 @@
+"""Lightweight timing spans for script runs and background jobs.
+
+``Profiler.span(phase)`` times a block with ``time.perf_counter``. While a run
+is open on the current thread (the Streamlit script thread between
+``start_run`` and ``finish_run``), spans are summed per phase into that run,
+which is written as a single record when it finishes. Spans on other threads,
+such as OpenAI calls on job queue threads, are written as records of their
+own together with any details the block attached (model, token counts).
+
+Records are JSON lines in a file rotated by size. The most recent durations of
+each phase are also kept in memory for a p50/p95 summary. A span costs a few
+microseconds and a run writes one line, so profiling can stay on in
+production.
+"""
+
+import collections
+import contextlib
+from datetime import datetime
+import json
+import logging
+import logging.handlers
+import threading
+import time
+
+# Durations kept per phase for the percentile summary
+SAMPLES = 500
+# Size at which the log file is rotated, and rotated files kept
+MAX_BYTES = 5 * 1024 * 1024
+BACKUPS = 3
+
+
+class Profiler:
+    """Collects timing spans and writes them to a rotating JSONL file."""
+
+    def __init__(
+        self, path=None, samples=SAMPLES, max_bytes=MAX_BYTES, backups=BACKUPS
+    ):
+        """Create a profiler.
+
+        Args:
+            path: JSONL file to write records to, or None to only keep the
+                in-memory summary.
+            samples: Most recent durations kept per phase.
+            max_bytes: Size at which the file is rotated.
+            backups: Rotated files kept (``path.1`` ... ``path.<backups>``).
+        """
+        self.path = path
+        self._samples = collections.defaultdict(
+            lambda: collections.deque(maxlen=samples)
+        )
+        self._counts = collections.defaultdict(collections.Counter)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._logger = None
+        if path:
+            handler = logging.handlers.RotatingFileHandler(
+                path,
+                maxBytes=max_bytes,
+                backupCount=backups,
+                encoding="utf-8",
+                delay=True,
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self._logger = logging.getLogger(f"{__name__}.{id(self)}")
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            self._logger.addHandler(handler)
+
+    @contextlib.contextmanager
+    def span(self, phase):
+        """Time the enclosed block as phase.
+
+        Yields:
+            A dict the block can add details to, e.g. ``model`` or token
+            counts. Keys ending in ``_tokens`` are also totalled per phase.
+            An exception raised by the block is noted as ``error``.
+        """
+        details = {}
+        start = time.perf_counter()
+        try:
+            yield details
+        except Exception as e:
+            details["error"] = type(e).__name__
+            raise
+        finally:
+            self._add(phase, (time.perf_counter() - start) * 1000, details)
+
+    def start_run(self, started=None):
+        """Open a run on this thread, replacing any run left open.
+
+        Args:
+            started: ``time.perf_counter()`` value the run began at (default:
+                now).
+        """
+        self._local.run = {}
+        self._local.run_started = time.perf_counter() if started is None else started
+
+    def in_run(self):
+        """Whether a run is open on this thread."""
+        return getattr(self._local, "run", None) is not None
+
+    def finish_run(self, **fields):
+        """Close this thread's run and write it as one record.
+
+        Its total duration is also summarized as the ``run`` phase.
+
+        Args:
+            **fields: Extra values to store in the record.
+        """
+        run = getattr(self._local, "run", None)
+        if run is None:
+            return
+        self._local.run = None
+        elapsed = (time.perf_counter() - self._local.run_started) * 1000
+        with self._lock:
+            self._samples["run"].append(elapsed)
+            self._counts["run"]["count"] += 1
+        self._write(
+            {
+                "type": "run",
+                "ms": round(elapsed, 2),
+                **fields,
+                "spans": {phase: round(ms, 2) for phase, ms in run.items()},
+            }
+        )
+
+    def summary(self):
+        """Return per-phase statistics over the recent durations.
+
+        Returns:
+            Dicts with ``phase``, ``count`` (all time), ``p50_ms``, ``p95_ms``
+            and token totals where the phase recorded any, sorted by phase.
+        """
+        with self._lock:
+            rows = []
+            for phase, samples in sorted(self._samples.items()):
+                ordered = sorted(samples)
+                row = {
+                    "phase": phase,
+                    "count": self._counts[phase]["count"],
+                    "p50_ms": round(percentile(ordered, 50), 2),
+                    "p95_ms": round(percentile(ordered, 95), 2),
+                }
+                for key, total in sorted(self._counts[phase].items()):
+                    if key != "count":
+                        row[key] = total
+                rows.append(row)
+            return rows
+
+    def _add(self, phase, elapsed, details):
+        with self._lock:
+            self._samples[phase].append(elapsed)
+            counts = self._counts[phase]
+            counts["count"] += 1
+            for key, value in details.items():
+                if key.endswith("_tokens") and isinstance(value, int):
+                    counts[key] += value
+        run = getattr(self._local, "run", None)
+        if run is not None:
+            run[phase] = run.get(phase, 0.0) + elapsed
+        else:
+            self._write(
+                {"type": "span", "phase": phase, "ms": round(elapsed, 2), **details}
+            )
+
+    def _write(self, record):
+        if self._logger is None:
+            return
+        record = {"time": datetime.now().isoformat(timespec="milliseconds"), **record}
+        self._logger.info(json.dumps(record, default=str))
+
+
+def percentile(ordered, percent):
+    """Return the nearest-rank percentile of an already sorted list.
+
+    Args:
+        ordered: Values sorted in ascending order.
+        percent: Percentile to return, 0..100.
+
+    Returns:
+        The value at that rank, or 0.0 if ordered is empty.
+    """
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-percent * len(ordered) // 100))
+    return ordered[int(rank) - 1]
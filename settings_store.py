@@ -0,0 +1,121 @@
+"""Write-coalescing layer over the stored settings documents.
+
+Changes to goals, preferences and the protein-choice cache are staged in memory
+during a script run and written once by ``flush()``. Setting a document to the
+value it already has is a no-op, so reruns that change nothing touch no files.
+
+Writes are optimistic: each one states the value the change was based on, and
+if another session changed the document in the meantime the two changes are
+merged key by key and the write is retried.
+"""
+
+import copy
+
+from meal_store import ConflictError
+
+_DELETED = object()
+_MISSING = object()
+
+# Attempts at writing a document before giving up on a conflict
+MAX_ATTEMPTS = 5
+
+
+class SettingsStore:
+    """Stages settings document changes and writes only the ones that differ."""
+
+    def __init__(self, backend):
+        """Wrap backend, which provides load/save/delete_document.
+
+        Args:
+            backend: The meal store holding the settings documents.
+        """
+        self.backend = backend
+        self.writes = 0
+        self.skipped = 0
+        self.conflicts = 0
+        self._pending = {}
+        # Stored value of each document when this run first read it
+        self._base = {}
+
+    def get(self, name):
+        """Return document name including staged changes, or None if missing."""
+        if name in self._pending:
+            value = self._pending[name]
+            return None if value is _DELETED else copy.deepcopy(value)
+        return copy.deepcopy(self._stored(name))
+
+    def set(self, name, data):
+        """Stage data as the new value of document name.
+
+        Returns:
+            True if this changes the document, False if it already had data.
+        """
+        if self.get(name) == data:
+            self.skipped += 1
+            return False
+        if self._stored(name) == data:
+            # Changed and then changed back within the same run
+            del self._pending[name]
+        else:
+            self._pending[name] = copy.deepcopy(data)
+        return True
+
+    def delete(self, name):
+        """Stage removal of document name."""
+        if self.get(name) is None:
+            return False
+        self._pending[name] = _DELETED
+        return True
+
+    @property
+    def dirty(self):
+        """Whether there are staged changes waiting for flush()."""
+        return bool(self._pending)
+
+    def flush(self):
+        """Write every staged change once and clear the staging area.
+
+        Raises:
+            ConflictError: If a document kept changing underneath every retry.
+        """
+        pending, self._pending = self._pending, {}
+        base, self._base = self._base, {}
+        for name, value in pending.items():
+            expected = base[name]
+            for attempt in range(MAX_ATTEMPTS):
+                try:
+                    if value is _DELETED:
+                        self.backend.delete_document(name, expected=expected)
+                    else:
+                        self.backend.save_document(name, value, expected=expected)
+                    break
+                except ConflictError:
+                    if attempt == MAX_ATTEMPTS - 1:
+                        raise
+                    self.conflicts += 1
+                    current = self.backend.load_document(name)
+                    value = _merge(base[name], value, current)
+                    expected = current
+            self.writes += 1
+
+    def _stored(self, name):
+        if name not in self._base:
+            self._base[name] = self.backend.load_document(name)
+        return self._base[name]
+
+
+def _merge(base, ours, theirs):
+    """Apply the keys we changed relative to base on top of theirs."""
+    if not all(isinstance(doc, dict) for doc in (base, ours, theirs)):
+        # Whole-document change (created or deleted): last writer wins
+        return ours
+    merged = dict(theirs)
+    for key in set(base) | set(ours):
+        value = ours.get(key, _MISSING)
+        if value == base.get(key, _MISSING):
+            continue
+        if value is _MISSING:
+            merged.pop(key, None)
+        else:
+            merged[key] = value
+    return merged
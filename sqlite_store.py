@@ -0,0 +1,382 @@
+"""SQLite meal storage with indexed timestamp and local-date lookups.
+
+Select it with ``TEMPO_STORAGE=sqlite``. Existing JSON data can be copied over
+once with::
+
+    python sqlite_store.py migrate --dir . --db tempo.db
+"""
+
+import argparse
+import contextlib
+import json
+import sqlite3
+import threading
+
+from meal_store import (
+    ANY_VERSION,
+    ConflictError,
+    empty_totals,
+    local_day,
+    MealJournal,
+    MealRecord,
+    tidy_number,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meals (
+    id TEXT PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    day TEXT NOT NULL,
+    description TEXT NOT NULL,
+    protein NUMERIC NOT NULL,
+    carbs NUMERIC NOT NULL,
+    fat NUMERIC NOT NULL,
+    interpretation TEXT,
+    source_id TEXT
+);
+CREATE INDEX IF NOT EXISTS meals_timestamp ON meals (timestamp);
+CREATE INDEX IF NOT EXISTS meals_day ON meals (day, timestamp);
+CREATE TABLE IF NOT EXISTS daily_totals (
+    day TEXT PRIMARY KEY,
+    protein NUMERIC NOT NULL,
+    carbs NUMERIC NOT NULL,
+    fat NUMERIC NOT NULL,
+    meals INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS meals_rollup_insert AFTER INSERT ON meals
+BEGIN
+    INSERT OR IGNORE INTO daily_totals (day, protein, carbs, fat, meals)
+    VALUES (NEW.day, 0, 0, 0, 0);
+    UPDATE daily_totals SET protein = protein + NEW.protein,
+        carbs = carbs + NEW.carbs, fat = fat + NEW.fat, meals = meals + 1
+    WHERE day = NEW.day;
+END;
+CREATE TRIGGER IF NOT EXISTS meals_rollup_delete AFTER DELETE ON meals
+BEGIN
+    UPDATE daily_totals SET protein = protein - OLD.protein,
+        carbs = carbs - OLD.carbs, fat = fat - OLD.fat, meals = meals - 1
+    WHERE day = OLD.day;
+    DELETE FROM daily_totals WHERE day = OLD.day AND meals <= 0;
+END;
+CREATE TABLE IF NOT EXISTS documents (
+    name TEXT PRIMARY KEY,
+    body TEXT NOT NULL
+);
+"""
+
+MEAL_COLUMNS = "id, timestamp, description, protein, carbs, fat, interpretation"
+
+# Settings files carried over by the migrator
+DOCUMENTS = ("goals", "preferences")
+
+
+class SqliteMealStore:
+    """Meal log kept in a SQLite database.
+
+    ``day`` is the meal's local calendar date, derived from the timestamp when
+    the row is written, so day and range lookups are index scans. Triggers keep
+    the ``daily_totals`` rollup in step with every insert and delete.
+    """
+
+    def __init__(self, db_path):
+        """Open (and create if needed) the database at db_path."""
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            has_meals = conn.execute("SELECT 1 FROM meals LIMIT 1").fetchone()
+            has_totals = conn.execute("SELECT 1 FROM daily_totals LIMIT 1").fetchone()
+        if has_meals and not has_totals:
+            # Database created before rollups existed
+            self.rebuild_rollups()
+
+    def load(self):
+        """Return every meal as ``{"meals": [...]}`` in logging order."""
+        rows = self._connection().execute(
+            f"SELECT {MEAL_COLUMNS} FROM meals ORDER BY timestamp"
+        )
+        return {"meals": [_row_to_meal(row) for row in rows]}
+
+    def records(self):
+        """Return every meal as a MealRecord in logging order."""
+        rows = self._connection().execute(
+            f"SELECT {MEAL_COLUMNS} FROM meals ORDER BY timestamp"
+        )
+        return [MealRecord(*row) for row in rows]
+
+    def recent_records(self):
+        """Return every meal; the database is indexed, so nothing is archived."""
+        return self.records()
+
+    def archived_records(self):
+        """Return no archived meals, as this store keeps no archive."""
+        return []
+
+    def archived_summaries(self):
+        """Return no archived descriptions, as this store keeps no archive."""
+        return []
+
+    def archived_daily_totals(self):
+        """Return no archived totals, as this store keeps no archive."""
+        return {}
+
+    def meals_for_day(self, day):
+        """Return the meals logged on day (YYYY-MM-DD)."""
+        rows = self._connection().execute(
+            f"SELECT {MEAL_COLUMNS} FROM meals WHERE day = ? ORDER BY timestamp",
+            (day,),
+        )
+        return [MealRecord(*row) for row in rows]
+
+    def meals_between(self, start_day, end_day):
+        """Return meals whose local date is within start_day..end_day inclusive."""
+        rows = self._connection().execute(
+            f"SELECT {MEAL_COLUMNS} FROM meals WHERE day BETWEEN ? AND ? "
+            "ORDER BY timestamp",
+            (start_day, end_day),
+        )
+        return [MealRecord(*row) for row in rows]
+
+    def page(self, limit, before=None):
+        """Return up to limit meals newest first.
+
+        Pass the last MealRecord of one page as ``before`` to get the next
+        page; this keyset pagination stays fast however deep you go.
+        """
+        if before is None:
+            rows = self._connection().execute(
+                f"SELECT {MEAL_COLUMNS} FROM meals "
+                "ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (limit,),
+            )
+        else:
+            rows = self._connection().execute(
+                f"SELECT {MEAL_COLUMNS} FROM meals "
+                "WHERE (timestamp, id) < (?, ?) "
+                "ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (before.timestamp, before.id, limit),
+            )
+        return [MealRecord(*row) for row in rows]
+
+    def daily_totals(self, day):
+        """Return the protein/carbs/fat/meal-count rollup for day (YYYY-MM-DD)."""
+        row = (
+            self._connection()
+            .execute(
+                "SELECT protein, carbs, fat, meals FROM daily_totals WHERE day = ?",
+                (day,),
+            )
+            .fetchone()
+        )
+        return _row_to_totals(row) if row else empty_totals()
+
+    def daily_totals_between(self, start_day, end_day):
+        """Return ``{day: rollup}`` for days with meals in start_day..end_day."""
+        rows = self._connection().execute(
+            "SELECT day, protein, carbs, fat, meals FROM daily_totals "
+            "WHERE day BETWEEN ? AND ? ORDER BY day",
+            (start_day, end_day),
+        )
+        return {row[0]: _row_to_totals(row[1:]) for row in rows}
+
+    def rebuild_rollups(self):
+        """Recompute the daily_totals table from the meals table."""
+        with self._connection() as conn:
+            conn.execute("DELETE FROM daily_totals")
+            conn.execute(
+                "INSERT INTO daily_totals (day, protein, carbs, fat, meals) "
+                "SELECT day, SUM(protein), SUM(carbs), SUM(fat), COUNT(*) "
+                "FROM meals GROUP BY day"
+            )
+
+    def load_document(self, name):
+        """Return the stored settings document name, or None if missing."""
+        row = (
+            self._connection()
+            .execute("SELECT body FROM documents WHERE name = ?", (name,))
+            .fetchone()
+        )
+        return json.loads(row[0]) if row else None
+
+    def save_document(self, name, data, expected=ANY_VERSION):
+        """Store the settings document name.
+
+        Args:
+            name: Document name.
+            data: New contents.
+            expected: If given, the contents the caller based its change on
+                (None for "didn't exist"); the write is refused if the stored
+                document no longer matches.
+
+        Raises:
+            ConflictError: If expected doesn't match the stored document.
+        """
+        with self._document_transaction(name, expected) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (name, body) VALUES (?, ?)",
+                (name, json.dumps(data)),
+            )
+
+    def delete_document(self, name, expected=ANY_VERSION):
+        """Remove the settings document name if it exists.
+
+        Raises:
+            ConflictError: If expected is given and doesn't match.
+        """
+        with self._document_transaction(name, expected) as conn:
+            conn.execute("DELETE FROM documents WHERE name = ?", (name,))
+
+    def add(self, meal):
+        """Insert a newly logged meal."""
+        with self._connection() as conn:
+            _insert_meal(conn, meal)
+
+    def repeat(self, meal, source_id):
+        """Insert a meal that repeats an earlier one."""
+        with self._connection() as conn:
+            _insert_meal(conn, meal, source_id)
+
+    def delete(self, meal_id, day=None):
+        """Remove meal_id; day is accepted for parity with MealJournal."""
+        with self._connection() as conn:
+            conn.execute("DELETE FROM meals WHERE id = ?", (meal_id,))
+
+    def add_many(self, meals):
+        """Insert meals in one transaction, replacing any with the same id.
+
+        Args:
+            meals: Iterable of meals in the ``meal_schema.json`` shape.
+
+        Returns:
+            Number of meals added.
+        """
+        count = 0
+        with self._connection() as conn:
+            for meal in meals:
+                _insert_meal(conn, meal)
+                count += 1
+        return count
+
+    def replace(self, meals_data):
+        """Overwrite the whole log with meals_data."""
+        with self._connection() as conn:
+            conn.execute("DELETE FROM meals")
+            for meal in meals_data["meals"]:
+                _insert_meal(conn, meal)
+
+    @contextlib.contextmanager
+    def _document_transaction(self, name, expected):
+        conn = self._connection()
+        # IMMEDIATE takes the write lock up front so the check and the write
+        # can't interleave with another session's
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if expected is not ANY_VERSION:
+                row = conn.execute(
+                    "SELECT body FROM documents WHERE name = ?", (name,)
+                ).fetchone()
+                if (json.loads(row[0]) if row else None) != expected:
+                    raise ConflictError(f"{name} was changed by another session")
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+
+def _insert_meal(conn, meal, source_id=None):
+    # Delete first rather than INSERT OR REPLACE so the rollup trigger fires
+    conn.execute("DELETE FROM meals WHERE id = ?", (meal["id"],))
+    conn.execute(
+        "INSERT INTO meals (id, timestamp, day, description, protein, "
+        "carbs, fat, interpretation, source_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            meal["id"],
+            meal["timestamp"],
+            local_day(meal["timestamp"]),
+            meal["description"],
+            meal["macros"]["protein"],
+            meal["macros"]["carbs"],
+            meal["macros"]["fat"],
+            meal.get("interpretation"),
+            source_id,
+        ),
+    )
+
+
+def _row_to_totals(row):
+    return {
+        "protein": tidy_number(row[0]),
+        "carbs": tidy_number(row[1]),
+        "fat": tidy_number(row[2]),
+        "meals": row[3],
+    }
+
+
+def _row_to_meal(row):
+    meal = {
+        "id": row[0],
+        "timestamp": row[1],
+        "description": row[2],
+        "macros": {"protein": row[3], "carbs": row[4], "fat": row[5]},
+    }
+    if row[6] is not None:
+        meal["interpretation"] = row[6]
+    return meal
+
+
+def migrate(directory, db_path):
+    """Copy meals.json/meals.jsonl, goals.json and preferences.json into db_path.
+
+    Args:
+        directory: Folder holding the JSON data files.
+        db_path: SQLite database to create or update.
+
+    Returns:
+        Number of meals copied.
+    """
+    # Only read the source: with archiving off, opening it moves no meals
+    journal = MealJournal(directory, hot_days=0)
+    store = SqliteMealStore(db_path)
+    meals = journal.load()["meals"]
+    with store._connection() as conn:
+        for meal in meals:
+            _insert_meal(conn, meal)
+        for name in DOCUMENTS:
+            document = journal.load_document(name)
+            if document is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO documents (name, body) VALUES (?, ?)",
+                    (name, json.dumps(document)),
+                )
+    return len(meals)
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Tempo SQLite storage tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser(
+        "migrate", help="copy the JSON data files into a SQLite database"
+    )
+    migrate_parser.add_argument("--dir", default=".", help="folder with JSON files")
+    migrate_parser.add_argument("--db", default="tempo.db", help="database path")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        count = migrate(args.dir, args.db)
+        print(f"Migrated {count} meals into {args.db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Incremental parsing of a JSON document that arrives in pieces.
+
+LLM responses are streamed token by token. ``PartialJSONParser`` is fed each
+piece and returns the most complete value the text so far allows: open strings
+are cut off where they stop, open objects and arrays are closed, and a key or
+number that may still be growing is left out until it is finished. The final
+value is parsed from the full text exactly as ``json.loads`` would.
+"""
+
+import json
+
+# Characters that may be in the middle of a number or a true/false/null literal
+_BARE_TOKEN_CHARS = set("0123456789+-.eEtrufalsn")
+
+
+class PartialJSONParser:
+    """Parses a streamed JSON document, giving a best-effort value after each piece.
+
+    Each character is scanned once, so feeding a whole response costs time
+    linear in its length plus one ``json.loads`` of the current prefix per
+    piece.
+    """
+
+    def __init__(self):
+        """Create a parser that hasn't seen any text yet."""
+        self.value = None
+        self._text = ""
+        self._started = False
+        self._start = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        # Longest prefix known to end between values, and what is open there
+        self._cut = 0
+        self._cut_stack = ()
+
+    def feed(self, piece):
+        """Add the next piece of text.
+
+        Args:
+            piece: The next chunk of the document.
+
+        Returns:
+            The most complete value parsed so far, or None if nothing yet.
+        """
+        start = len(self._text)
+        self._text += piece
+        for position in range(start, len(self._text)):
+            self._scan(self._text[position], position)
+
+        partial = self._complete()
+        if partial is not None:
+            self.value = partial
+        return self.value
+
+    def result(self):
+        """Parse the full text.
+
+        Raises:
+            json.JSONDecodeError: If the text is not a complete JSON document.
+        """
+        return json.loads(self._text)
+
+    @property
+    def text(self):
+        """All text fed so far."""
+        return self._text
+
+    def _scan(self, char, position):
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+            return
+        if not self._started:
+            # Ignore anything (like a code fence) before the document starts
+            if char not in "{[":
+                return
+            self._started = True
+            self._start = position
+        if char == '"':
+            self._in_string = True
+        elif char in "{[":
+            self._stack.append(char)
+            self._cut, self._cut_stack = position + 1, tuple(self._stack)
+        elif char in "}]":
+            if self._stack:
+                self._stack.pop()
+            self._cut, self._cut_stack = position + 1, tuple(self._stack)
+        elif char == ",":
+            self._cut, self._cut_stack = position, tuple(self._stack)
+
+    def _complete(self):
+        if not self._started:
+            return None
+        text = self._text[self._start :]
+        cut = self._cut - self._start
+        candidates = []
+        if self._in_string:
+            # Close the open string, dropping a half-written escape
+            open_text = text[:-1] if self._escape else text
+            candidates.append(open_text + '"' + _closers(self._stack))
+        elif text.rstrip()[-1] not in _BARE_TOKEN_CHARS:
+            candidates.append(text + _closers(self._stack))
+        candidates.append(text[:cut] + _closers(self._cut_stack))
+        for candidate in candidates:
+            try:
+                return json.loads(candidate)
+            except json.JSONDecodeError:
+                continue
+        return None
+
+
+def _closers(stack):
+    return "".join("}" if opener == "{" else "]" for opener in reversed(stack))
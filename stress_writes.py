@@ -0,0 +1,144 @@
+"""Multi-process stress check for concurrent meal and settings writes.
+
+Starts several processes that all add, repeat and delete meals in one data
+folder while compaction runs constantly, and update their own key in a shared
+settings document. Afterwards every surviving meal, the per-day rollups and the
+settings document are checked against what the workers did. Exits non-zero if
+any update was lost::
+
+    python stress_writes.py --processes 8 --ops 300 --backend json
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+
+import meal_store
+from meal_store import add_to_rollups, MealJournal
+from settings_store import SettingsStore
+from sqlite_store import SqliteMealStore
+
+# Settings document every worker writes its own key into
+STRESS_DOCUMENT = "stress"
+
+
+def open_backend(backend, directory):
+    """Open a fresh store of the given kind on directory."""
+    if backend == "sqlite":
+        return SqliteMealStore(os.path.join(directory, meal_store.DEFAULT_DB_FILE))
+    return MealJournal(directory)
+
+
+def make_meal(worker, index):
+    """Return a meal with a deterministic id and timestamp."""
+    day = index % 28 + 1
+    return {
+        "id": f"{worker}-{index}",
+        "timestamp": f"2024-01-{day:02d}T{worker % 24:02d}:00:00.{index:06d}",
+        "description": f"worker {worker} meal {index}",
+        "macros": {"protein": 1, "carbs": 2, "fat": 0.5},
+    }
+
+
+def run_worker(backend, directory, worker, ops):
+    """Add ops meals, delete every fifth and record progress in settings."""
+    # Compact often so appends keep racing against compaction
+    meal_store.COMPACT_EVERY = 20
+    store = open_backend(backend, directory)
+    for index in range(ops):
+        meal = make_meal(worker, index)
+        if index % 7 == 0:
+            store.repeat(meal, source_id=f"{worker}-0")
+        else:
+            store.add(meal)
+        if index % 5 == 4:
+            store.delete(f"{worker}-{index - 2}")
+        if index % 10 == 0:
+            store.load()
+        if index % 25 == 0 or index == ops - 1:
+            settings = SettingsStore(store)
+            document = settings.get(STRESS_DOCUMENT) or {}
+            document[f"worker-{worker}"] = index
+            settings.set(STRESS_DOCUMENT, document)
+            settings.flush()
+
+
+def expected_ids(processes, ops):
+    """Return the ids that should survive the run."""
+    ids = set()
+    for worker in range(processes):
+        for index in range(ops):
+            ids.add(f"{worker}-{index}")
+            if index % 5 == 4:
+                ids.discard(f"{worker}-{index - 2}")
+    return ids
+
+
+def check(backend, directory, processes, ops):
+    """Compare the final state with what the workers wrote; return problems."""
+    store = open_backend(backend, directory)
+    meals = store.records()
+    problems = []
+
+    found = {meal.id for meal in meals}
+    expected = expected_ids(processes, ops)
+    if found != expected:
+        problems.append(
+            f"meals: {len(expected - found)} lost, {len(found - expected)} unexpected"
+        )
+
+    rollups = {}
+    for meal in meals:
+        add_to_rollups(rollups, meal)
+    if store.daily_totals_between("0000-00-00", "9999-99-99") != rollups:
+        problems.append("daily rollups don't match the meals")
+
+    document = store.load_document(STRESS_DOCUMENT) or {}
+    for worker in range(processes):
+        if document.get(f"worker-{worker}") != ops - 1:
+            problems.append(
+                f"settings: worker {worker} ended at "
+                f"{document.get(f'worker-{worker}')}, expected {ops - 1}"
+            )
+    return problems
+
+
+def main():
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=300, help="meals per process")
+    parser.add_argument("--backend", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--dir", help="data folder (default: a new temp folder)")
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix="tempo-stress-")
+    workers = [
+        multiprocessing.Process(
+            target=run_worker, args=(args.backend, directory, worker, args.ops)
+        )
+        for worker in range(args.processes)
+    ]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+    if any(process.exitcode != 0 for process in workers):
+        print("A worker process failed")
+        return 1
+
+    problems = check(args.backend, directory, args.processes, args.ops)
+    total = args.processes * args.ops
+    if problems:
+        print(f"FAILED after {total} writes in {directory}:")
+        for problem in problems:
+            print(f"  {problem}")
+        return 1
+    print(f"OK: {total} writes from {args.processes} processes, no updates lost")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""In-memory cache of meal suggestions keyed on bucketed remaining goals.
+
+Suggestions depend on the protein and calories still to eat, the hours left
+until the last meal and the preferred protein sources. Rounding the numbers to
+coarse steps means most requests over a day fall on a handful of keys, so an
+answer fetched in the background after a meal is saved can be shown at once
+when suggestions are asked for. The prompt is built from the rounded values,
+so a cached answer is exactly the answer to its key.
+"""
+
+import collections
+import threading
+import time
+
+from jobs import FAILED
+
+PROTEIN_STEP = 10
+CALORIE_STEP = 100
+HOURS_STEP = 0.5
+TTL_SECONDS = 6 * 3600
+MAX_ENTRIES = 256
+# Seconds before a key whose background fetch failed is fetched again
+RETRY_AFTER = 300
+
+SuggestionInputs = collections.namedtuple(
+    "SuggestionInputs",
+    ["protein", "calories", "hours", "protein_sources", "last_meal_time"],
+)
+
+
+def suggestion_inputs(
+    remaining_protein,
+    remaining_calories,
+    hours_remaining,
+    protein_sources,
+    last_meal_time,
+):
+    """Round the suggestion inputs into buckets.
+
+    Args:
+        remaining_protein: Grams of protein left to reach the goal.
+        remaining_calories: Calories left to reach the goal.
+        hours_remaining: Hours until the last meal of the day.
+        protein_sources: Preferred protein sources.
+        last_meal_time: Time of the last meal as HH:MM.
+
+    Returns:
+        A hashable SuggestionInputs usable as a cache key.
+    """
+    return SuggestionInputs(
+        protein=int(round(remaining_protein / PROTEIN_STEP) * PROTEIN_STEP),
+        calories=int(round(remaining_calories / CALORIE_STEP) * CALORIE_STEP),
+        # Past the last meal time every value means the same thing
+        hours=max(0.0, round(hours_remaining / HOURS_STEP) * HOURS_STEP),
+        protein_sources=tuple(sorted(protein_sources)),
+        last_meal_time=last_meal_time,
+    )
+
+
+class SuggestionCache:
+    """Thread-safe LRU cache of suggestions with a TTL and in-flight tracking."""
+
+    def __init__(self, ttl=TTL_SECONDS, max_entries=MAX_ENTRIES):
+        """Create an empty cache.
+
+        Args:
+            ttl: Seconds an entry stays valid after it was stored.
+            max_entries: Least recently used entries beyond this are evicted.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.prefetches = 0
+        self._entries = collections.OrderedDict()
+        self._jobs = {}
+        # key -> when its fetch failed, oldest first
+        self._failed = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached suggestions for key, or None on a miss."""
+        with self._lock:
+            value = self._fresh(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, suggestions):
+        """Store suggestions for key and evict entries over the size cap."""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), suggestions)
+            self._entries.move_to_end(key)
+            self._failed.pop(key, None)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def job(self, key):
+        """Return the unfinished job fetching key, or None."""
+        with self._lock:
+            return self._running_job(key)
+
+    def track(self, key, job, prefetch=False):
+        """Record that job is fetching suggestions for key."""
+        with self._lock:
+            self._jobs[key] = job
+            if prefetch:
+                self.prefetches += 1
+
+    def needs_fetch(self, key):
+        """Whether key is neither cached, being fetched, nor recently failed."""
+        with self._lock:
+            if self._fresh(key) is not None or self._running_job(key) is not None:
+                return False
+            self._expire_failures()
+            return key not in self._failed
+
+    def stats(self):
+        """Return hit/miss/eviction/prefetch counters and the entry count."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "prefetches": self.prefetches,
+                "entries": len(self._entries),
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _fresh(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic() - self.ttl:
+            del self._entries[key]
+            self.evictions += 1
+            return None
+        return entry[1]
+
+    def _running_job(self, key):
+        job = self._jobs.get(key)
+        if job is None:
+            return None
+        if not job.done:
+            return job
+        del self._jobs[key]
+        if job.status == FAILED:
+            self._failed[key] = time.monotonic()
+            self._failed.move_to_end(key)
+            self._expire_failures()
+            while len(self._failed) > self.max_entries:
+                self._failed.popitem(last=False)
+        return None
+
+    def _expire_failures(self):
+        # Failures whose backoff is over; they are in the order they happened
+        cutoff = time.monotonic() - RETRY_AFTER
+        while self._failed and next(iter(self._failed.values())) < cutoff:
+            self._failed.popitem(last=False)
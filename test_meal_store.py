@@ -0,0 +1,64 @@
+"""Regression tests for MealJournal and its archive."""
+
+from datetime import date, timedelta
+import json
+import os
+import tempfile
+import unittest
+
+from meal_store import MealJournal
+
+
+def _meal(index, day):
+    return {
+        "id": str(index),
+        "timestamp": f"{day.isoformat()}T12:00:00",
+        "description": f"meal {index}",
+        "macros": {"protein": 10, "carbs": 20, "fat": 5},
+    }
+
+
+class ArchiveOnOpenTest(unittest.TestCase):
+    """A journal opened on an un-archived meals.json archives without loss."""
+
+    def setUp(self):
+        """Write a year of meals to meals.json, as before archiving existed."""
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.directory = temp.name
+        today = date.today()
+        self.meals = [_meal(i, today - timedelta(days=i)) for i in range(400)]
+        with open(os.path.join(self.directory, "meals.json"), "w") as f:
+            json.dump({"meals": self.meals}, f)
+
+    def test_load_returns_every_meal(self):
+        """The first load() of a fresh journal includes the archived months."""
+        journal = MealJournal(self.directory, hot_days=90)
+        loaded = journal.load()["meals"]
+        self.assertEqual(
+            sorted(meal["id"] for meal in loaded),
+            sorted(meal["id"] for meal in self.meals),
+        )
+        # The old months did move to the archive
+        self.assertTrue(journal.archive.months())
+
+    def test_archived_records_after_open(self):
+        """Archived and recent records split the meals without gaps or overlap."""
+        journal = MealJournal(self.directory, hot_days=90)
+        archived = journal.archived_records()
+        recent = journal.recent_records()
+        self.assertEqual(len(archived) + len(recent), len(self.meals))
+        self.assertFalse({meal.id for meal in archived} & {m.id for m in recent})
+
+    def test_load_replace_round_trip_keeps_history(self):
+        """Saving what load() returned keeps the archived history."""
+        MealJournal(self.directory, hot_days=90).replace(
+            MealJournal(self.directory, hot_days=90).load()
+        )
+        self.assertEqual(
+            len(MealJournal(self.directory, hot_days=90).records()), len(self.meals)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
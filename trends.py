@@ -0,0 +1,305 @@
+"""Daily, weekly and monthly macro trends computed with NumPy.
+
+``MealTrends`` keeps the meal history as columns (each meal's local day, as
+days since 1970-01-01, and its protein, carbs and fat) plus a table of per-day
+sums built from them with ``np.bincount``. Adding or removing a meal touches
+only its row and its day, so the table stays current as meals are logged
+without another pass over the history. Weekly and monthly totals, rolling
+averages and goal adherence are computed from the per-day table with
+vectorized operations; years of history are only a few thousand rows there.
+
+Archived months only need their per-day totals, which the store reads from
+segment headers, so they are added to the table without rows of their own.
+"""
+
+import collections
+from datetime import date
+import threading
+
+import numpy as np
+
+# Calories per gram of protein, carbs and fat
+CALORIES_PER_GRAM = np.array([4.0, 4.0, 9.0])
+# A day meets the calorie goal when it is within this fraction of it
+CALORIE_TOLERANCE = 0.1
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# Columns of the per-day table
+_PROTEIN, _CARBS, _FAT, _MEALS = range(4)
+
+Totals = collections.namedtuple(
+    "Totals", ["periods", "protein", "carbs", "fat", "calories", "meals"]
+)
+Totals.__doc__ = """Macro totals per period.
+
+Each field is an array with one value per period: ``periods`` holds the first
+day of each period (``datetime64[D]``), ``meals`` the number of meals logged
+in it, and the rest grams or calories eaten in it.
+"""
+
+
+def _day_number(day):
+    """Days since 1970-01-01 for a date or YYYY-MM-DD string."""
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    return day.toordinal() - _EPOCH_ORDINAL
+
+
+def _totals(first_day, table):
+    periods = np.arange(first_day, first_day + len(table)).astype("datetime64[D]")
+    return _to_totals(periods, table)
+
+
+def _to_totals(periods, table):
+    # Rounding also hides float residue left by removing meals from a sum
+    calories = table[:, _PROTEIN : _FAT + 1] @ CALORIES_PER_GRAM
+    return Totals(
+        periods=periods,
+        protein=np.round(table[:, _PROTEIN], 1),
+        carbs=np.round(table[:, _CARBS], 1),
+        fat=np.round(table[:, _FAT], 1),
+        calories=np.round(calories, 1),
+        meals=np.rint(table[:, _MEALS]).astype(np.int64),
+    )
+
+
+class MealTrends:
+    """Columnar meal history with per-day macro sums kept up to date."""
+
+    def __init__(self, meals=(), daily_totals=None):
+        """Create the columns, optionally filled with meals.
+
+        Args:
+            meals: MealRecords to add.
+            daily_totals: ``{day: rollup}`` of meals not passed as records,
+                such as archived months (see rebuild).
+        """
+        self._lock = threading.Lock()
+        self.rebuild(meals, daily_totals)
+
+    def __len__(self):
+        """Number of meals held."""
+        return len(self._rows)
+
+    def rebuild(self, meals, daily_totals=None):
+        """Replace the contents with meals.
+
+        Args:
+            meals: MealRecords to hold.
+            daily_totals: ``{day: rollup}`` (protein, carbs, fat and meals)
+                to count on top of meals. These days can't have single meals
+                removed; rebuild instead.
+        """
+        rows = {}
+        days = []
+        macros = []
+        # Local day -> day number, as meals share a few thousand days
+        day_numbers = {}
+        for meal in meals:
+            if meal.id in rows:
+                continue
+            day = day_numbers.get(meal.day)
+            if day is None:
+                day = day_numbers[meal.day] = _day_number(meal.day)
+            rows[meal.id] = len(days)
+            days.append(day)
+            macros.append((meal.protein, meal.carbs, meal.fat))
+        daily_totals = daily_totals or {}
+        extra_days = np.array(
+            [_day_number(day) for day in daily_totals], dtype=np.int64
+        )
+        extra = np.array(
+            [
+                (totals["protein"], totals["carbs"], totals["fat"], totals["meals"])
+                for totals in daily_totals.values()
+            ],
+            dtype=np.float64,
+        ).reshape(-1, 4)
+        with self._lock:
+            self._rows = rows
+            self._size = len(days)
+            self._day = np.array(days, dtype=np.int32)
+            self._macros = np.array(macros, dtype=np.float64).reshape(-1, 3)
+            self._extra_days = extra_days
+            self._extra = extra
+            self._build_table()
+
+    def add(self, meal):
+        """Add a newly saved MealRecord."""
+        with self._lock:
+            if meal.id in self._rows:
+                return
+            if self._size == len(self._day):
+                # Grow the columns geometrically so appends stay cheap
+                capacity = max(16, 2 * self._size)
+                self._day = np.resize(self._day, capacity)
+                self._macros = np.resize(self._macros, (capacity, 3))
+            row = self._size
+            day = _day_number(meal.day)
+            self._day[row] = day
+            self._macros[row] = (meal.protein, meal.carbs, meal.fat)
+            self._rows[meal.id] = row
+            self._size += 1
+            self._update_day(day, self._macros[row], 1)
+
+    def remove(self, meal_id):
+        """Stop counting meal_id.
+
+        Returns:
+            Whether it was held; a meal only counted in daily_totals isn't.
+        """
+        with self._lock:
+            row = self._rows.pop(meal_id, None)
+            if row is None:
+                return False
+            # The row stays in the columns until the next rebuild
+            self._update_day(self._day[row], self._macros[row], -1)
+            return True
+
+    def daily(self, start=None, end=None):
+        """Return the totals of each day from start to end inclusive.
+
+        Args:
+            start: First day (a date); defaults to the first day with meals.
+            end: Last day (a date); defaults to today or the last day with
+                meals, whichever is later.
+
+        Returns:
+            Totals with one period per calendar day, including days with no
+            meals logged.
+        """
+        with self._lock:
+            table_end = self._first_day + len(self._table) - 1
+            if start is None:
+                first = (
+                    self._first_day if len(self._table) else _day_number(date.today())
+                )
+            else:
+                first = _day_number(start)
+            if end is None:
+                last = max(table_end, _day_number(date.today()))
+            else:
+                last = _day_number(end)
+            table = np.zeros((max(0, last - first + 1), 4))
+            low = max(first, self._first_day)
+            high = min(last, table_end)
+            if low <= high:
+                table[low - first : high - first + 1] = self._table[
+                    low - self._first_day : high - self._first_day + 1
+                ]
+        return _totals(first, table)
+
+    def _build_table(self):
+        live = np.fromiter(self._rows.values(), dtype=np.int64, count=len(self._rows))
+        days = np.concatenate([self._day[live], self._extra_days])
+        if not len(days):
+            self._first_day = 0
+            self._table = np.zeros((0, 4))
+            return
+        self._first_day = int(days.min())
+        offsets = days[: len(live)] - self._first_day
+        length = int(days.max()) - self._first_day + 1
+        self._table = np.column_stack(
+            [
+                np.bincount(offsets, weights=self._macros[live, i], minlength=length)
+                for i in range(3)
+            ]
+            + [np.bincount(offsets, minlength=length).astype(np.float64)]
+        )
+        # Days held only as totals; a day appears at most once among them
+        np.add.at(self._table, self._extra_days - self._first_day, self._extra)
+
+    def _update_day(self, day, macros, sign):
+        day = int(day)
+        if not len(self._table):
+            self._first_day = day
+            self._table = np.zeros((1, 4))
+        elif day < self._first_day:
+            self._table = np.vstack([np.zeros((self._first_day - day, 4)), self._table])
+            self._first_day = day
+        elif day >= self._first_day + len(self._table):
+            extra = day - self._first_day - len(self._table) + 1
+            self._table = np.vstack([self._table, np.zeros((extra, 4))])
+        index = day - self._first_day
+        self._table[index, _PROTEIN : _FAT + 1] += sign * macros
+        self._table[index, _MEALS] += sign
+
+
+def resample(totals, period):
+    """Sum daily totals into calendar weeks (starting Monday) or months.
+
+    Args:
+        totals: Totals from MealTrends.daily().
+        period: "week" or "month".
+
+    Returns:
+        Totals with one period per week or month, dated by its first day.
+    """
+    if not len(totals.periods):
+        return totals
+    if period == "week":
+        days = totals.periods.astype(np.int64)
+        # 1970-01-01 was a Thursday
+        keys = (days - (days + 3) % 7).astype("datetime64[D]")
+    elif period == "month":
+        keys = totals.periods.astype("datetime64[M]").astype("datetime64[D]")
+    else:
+        raise ValueError(f"Unknown period: {period!r}")
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    table = np.column_stack([totals.protein, totals.carbs, totals.fat, totals.meals])
+    return _to_totals(keys[starts], np.add.reduceat(table, starts, axis=0))
+
+
+def rolling_average(values, meals, window):
+    """Average values over the last window periods that have meals logged.
+
+    Periods with nothing logged are left out rather than counted as zero, so
+    a day without logging doesn't pull the average down.
+
+    Args:
+        values: One value per period, e.g. Totals.calories.
+        meals: Meals logged per period (Totals.meals).
+        window: Number of periods, ending at each one, to average over.
+
+    Returns:
+        An array like values; NaN where the window has no meals logged.
+    """
+    value_sums = np.concatenate(([0.0], np.cumsum(values)))
+    logged_counts = np.concatenate(([0], np.cumsum(meals > 0)))
+    ends = np.arange(1, len(values) + 1)
+    starts = np.maximum(ends - window, 0)
+    logged = logged_counts[ends] - logged_counts[starts]
+    averages = np.full(len(values), np.nan)
+    np.divide(
+        value_sums[ends] - value_sums[starts], logged, out=averages, where=logged > 0
+    )
+    return np.round(averages, 1)
+
+
+def goal_adherence(totals, protein_goal, calorie_goal):
+    """Share of logged days that met the protein and calorie goals.
+
+    Args:
+        totals: Daily Totals from MealTrends.daily().
+        protein_goal: Daily protein goal in grams; met at or above it.
+        calorie_goal: Daily calorie goal; met within CALORIE_TOLERANCE of it.
+
+    Returns:
+        A dict with ``days_logged`` and the ``protein``, ``calories`` and
+        ``both`` rates (0..1) over those days.
+    """
+    logged = totals.meals > 0
+    days_logged = int(logged.sum())
+    if not days_logged:
+        return {"days_logged": 0, "protein": 0.0, "calories": 0.0, "both": 0.0}
+    protein_met = totals.protein[logged] >= protein_goal
+    calories_met = (
+        np.abs(totals.calories[logged] - calorie_goal)
+        <= CALORIE_TOLERANCE * calorie_goal
+    )
+    return {
+        "days_logged": days_logged,
+        "protein": float(protein_met.mean()),
+        "calories": float(calories_met.mean()),
+        "both": float((protein_met & calories_met).mean()),
+    }